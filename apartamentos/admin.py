@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
-from .models import Comodidade, Predio, Apartamento, FotoApartamento, Perfil, Reserva, ApartamentoComodidade
+from .models import Comodidade, Predio, Apartamento, FotoApartamento, Perfil, Reserva, ApartamentoComodidade, EmailPendente, ImagemPendente
 
 class PerfilInline(admin.StackedInline):
     model = Perfil; can_delete = False; verbose_name_plural = 'Perfil do Usuário'; fk_name = 'usuario'
@@ -43,4 +43,12 @@ class ApartamentoAdmin(admin.ModelAdmin):
 
 @admin.register(Reserva)
 class ReservaAdmin(admin.ModelAdmin):
-    list_display = ('apartamento', 'hospede', 'data_checkin', 'data_checkout', 'status'); list_filter = ('status', 'data_checkin'); search_fields = ('apartamento__titulo', 'hospede__username'); autocomplete_fields = ['apartamento', 'hospede']
\ No newline at end of file
+    list_display = ('apartamento', 'hospede', 'data_checkin', 'data_checkout', 'status'); list_filter = ('status', 'data_checkin'); search_fields = ('apartamento__titulo', 'hospede__username'); autocomplete_fields = ['apartamento', 'hospede']
+
+@admin.register(EmailPendente)
+class EmailPendenteAdmin(admin.ModelAdmin):
+    list_display = ('assunto', 'destinatario', 'status', 'tentativas', 'proxima_tentativa', 'data_envio'); list_filter = ('status',); search_fields = ('destinatario', 'assunto'); readonly_fields = ('data_criacao', 'data_envio', 'ultimo_erro')
+
+@admin.register(ImagemPendente)
+class ImagemPendenteAdmin(admin.ModelAdmin):
+    list_display = ('nome_arquivo', 'modelo', 'campo', 'status', 'tentativas', 'proxima_tentativa', 'data_processamento'); list_filter = ('status', 'modelo'); search_fields = ('nome_arquivo',); readonly_fields = ('data_criacao', 'data_processamento', 'ultimo_erro')
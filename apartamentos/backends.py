@@ -4,6 +4,10 @@ from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
 from django.db.models import Q
 
+from .cache import obter_permissoes, obter_usuario
+from .models import Perfil
+from .utils import chave_login
+
 UserModel = get_user_model()
 
 class EmailBackend(ModelBackend):
@@ -12,17 +16,19 @@ class EmailBackend(ModelBackend):
     façam login usando seu endereço de e-mail.
     """
     def authenticate(self, request, username=None, password=None, **kwargs):
-        try:
-            # Tenta encontrar um usuário que corresponda ao username OU ao email (case-insensitive)
-            user = UserModel.objects.get(Q(username__iexact=username) | Q(email__iexact=username))
-        except UserModel.DoesNotExist:
-            # Se nenhum usuário for encontrado, retorna None para permitir que outros backends tentem.
+        chave = chave_login(username)
+        if not chave or password is None:
             return None
-        except UserModel.MultipleObjectsReturned:
-            # Se múltiplos usuários forem encontrados (ex: mesmo username e email em contas diferentes,
-            # o que não deveria acontecer se o email for único), retorna o primeiro.
-            # Ou pode lançar um erro, dependendo da sua regra de negócio.
-            user = UserModel.objects.filter(Q(username__iexact=username) | Q(email__iexact=username)).order_by('id').first()
+        # Igualdade nas chaves normalizadas e indexadas do Perfil (username OU e-mail, sem diferença de caixa),
+        # em uma consulta só. Se o mesmo texto casar com mais de uma conta (o e-mail não é único), vale a
+        # mais antiga, como antes.
+        perfil = (Perfil.objects.filter(Q(chave_username=chave) | Q(chave_email=chave))
+                  .select_related('usuario').order_by('usuario_id').first())
+        if perfil is None:
+            # Roda o hasher mesmo assim, para o tempo de resposta não revelar se a conta existe
+            UserModel().set_password(password)
+            return None
+        user = perfil.usuario
 
         # Verifica a senha do usuário encontrado
         if user.check_password(password) and self.user_can_authenticate(user):
@@ -30,8 +36,26 @@ class EmailBackend(ModelBackend):
         return None # Senha incorreta
 
     def get_user(self, user_id):
+        # Lido a cada requisição autenticada: vem do cache (invalidado pelos sinais de User)
+        user = obter_usuario(user_id, self._carregar_usuario)
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+    def get_all_permissions(self, user_obj, obj=None):
+        """
+        Permissões do usuário e dos seus grupos em cache entre requisições (ver cache.obter_permissoes),
+        invalidadas pelos sinais de grupos/permissões. O conjunto também fica em user_obj._perm_cache,
+        que é onde o ModelBackend seguinte da lista procura antes de consultar o banco.
+        """
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            user_obj._perm_cache = obter_permissoes(
+                user_obj.pk, lambda: super(EmailBackend, self).get_all_permissions(user_obj))
+        return user_obj._perm_cache
+
+    @staticmethod
+    def _carregar_usuario(user_id):
         try:
-            user = UserModel._default_manager.get(pk=user_id)
+            return UserModel._default_manager.get(pk=user_id)
         except UserModel.DoesNotExist:
             return None
-        return user if self.user_can_authenticate(user) else None
\ No newline at end of file
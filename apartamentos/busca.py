@@ -0,0 +1,62 @@
+# apartamentos/busca.py
+"""
+Busca em texto completo nos apartamentos (título, descrição e dados do prédio).
+
+O texto indexado é o Apartamento.documento_busca, já sem acentos e reduzido aos
+radicais (utils.termos_busca), mantido no save() do apartamento e pelos sinais de
+Predio. Cada banco indexa esse documento com o recurso nativo (migração 0010):
+    PostgreSQL: coluna tsvector gerada + índice GIN, ranqueada por ts_rank_cd;
+    SQLite: tabela FTS5 mantida por triggers, ranqueada por bm25.
+A consulta passa pelo mesmo stemmer, então os dois bancos dão os mesmos resultados.
+"""
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Value
+from django.db.models.expressions import RawSQL
+
+from .utils import termos_busca
+
+TABELA_FTS_SQLITE = 'apartamentos_busca'
+
+
+def _consulta_postgresql(termos):
+    # Cada termo vale como prefixo (busca enquanto digita): quart:* & prai:*
+    tsquery = ' & '.join(f'{termo}:*' for termo in termos)
+    corresponde = RawSQL("apartamentos_apartamento.vetor_busca @@ to_tsquery('simple', %s)", (tsquery,),
+                         output_field=BooleanField())
+    # Em double precision para o valor voltar exato no cursor da paginação (ts_rank_cd devolve real)
+    relevancia = RawSQL("CAST(ts_rank_cd(apartamentos_apartamento.vetor_busca, to_tsquery('simple', %s)) "
+                        "AS double precision)", (tsquery,), output_field=FloatField())
+    return corresponde, relevancia
+
+
+def _consulta_sqlite(termos):
+    match = ' '.join(f'"{termo}"*' for termo in termos)
+    corresponde = RawSQL(f"apartamentos_apartamento.id IN (SELECT rowid FROM {TABELA_FTS_SQLITE} "
+                         f"WHERE {TABELA_FTS_SQLITE} MATCH %s)", (match,), output_field=BooleanField())
+    # bm25 é menor para os mais relevantes; com o sinal trocado, maior = melhor, como no PostgreSQL
+    relevancia = RawSQL(f"(SELECT -bm25({TABELA_FTS_SQLITE}) FROM {TABELA_FTS_SQLITE} "
+                        f"WHERE {TABELA_FTS_SQLITE} MATCH %s AND rowid = apartamentos_apartamento.id)", (match,),
+                        output_field=FloatField())
+    return corresponde, relevancia
+
+
+CONSULTAS_POR_BANCO = {'postgresql': _consulta_postgresql, 'sqlite': _consulta_sqlite}
+
+
+def buscar_apartamentos(queryset, texto):
+    """
+    Filtra o queryset de apartamentos pelos termos do texto (todos precisam aparecer)
+    e anota a `relevancia` de cada resultado (maior = mais relevante).
+    Sem termos úteis no texto, devolve o queryset sem alterações.
+    """
+    termos = termos_busca(texto)
+    if not termos:
+        return queryset
+    consulta = CONSULTAS_POR_BANCO.get(connections[queryset.db].vendor)
+    if consulta is None:
+        # Banco sem índice de texto: cai para a busca no documento, sem ranqueamento
+        for termo in termos:
+            queryset = queryset.filter(documento_busca__contains=termo)
+        return queryset.annotate(relevancia=Value(0.0, output_field=FloatField()))
+    corresponde, relevancia = consulta(termos)
+    return queryset.filter(corresponde).annotate(relevancia=relevancia)
@@ -0,0 +1,314 @@
+# apartamentos/cache.py
+import asyncio
+import hashlib
+import threading
+import time
+from bisect import bisect_left
+
+from asgiref.sync import sync_to_async
+from cachetools import TTLCache
+
+from django.core.cache import cache
+from django.db.models import Count, Min
+
+from .models import Comodidade, Predio
+from .roteamento import ler_do_primario
+from .utils import normalizar_texto
+
+CHAVE_CATALOGO_CIDADES = 'apartamentos:catalogo_cidades'
+TEMPO_CATALOGO_CIDADES = 60 * 60 * 24  # Invalidado explicitamente quando um Predio muda
+
+CHAVE_CATALOGO_COMODIDADES = 'apartamentos:catalogo_comodidades'
+TEMPO_CATALOGO_COMODIDADES = 60 * 60 * 24  # Invalidado explicitamente quando uma Comodidade muda
+
+CHAVE_USUARIO = 'apartamentos:usuario:{}'
+TEMPO_USUARIO = 60 * 5  # Curto de propósito; além disso, invalidado sempre que o User é salvo ou removido
+
+# Permissões por usuário: cópia local por processo + cache compartilhado, ambos amarrados às versões abaixo
+CHAVE_PERMISSOES = 'apartamentos:permissoes:{}:{}:{}'
+CHAVE_VERSAO_PERMISSOES = 'apartamentos:versao_permissoes'  # Muda quando grupos ou suas permissões mudam
+CHAVE_VERSAO_PERMISSOES_USUARIO = 'apartamentos:versao_permissoes_usuario:{}'  # Grupos/flags de um usuário
+TEMPO_PERMISSOES = 60 * 60
+TEMPO_PERMISSOES_LOCAL = 60
+_permissoes_locais = TTLCache(maxsize=4096, ttl=TEMPO_PERMISSOES_LOCAL)
+_trava_permissoes_locais = threading.Lock()  # TTLCache não é thread-safe
+
+# Páginas de resultado da busca (ApartamentoListView). Toda alteração que muda resultados troca a versão
+# geral; a da cidade só muda com alterações nela, e a de estrutura com prédios/comodidades (que podem
+# mudar de cidade ou mudar o catálogo), então buscas restritas a uma cidade sobrevivem a escritas nas outras.
+CHAVE_RESULTADO_BUSCA = 'apartamentos:busca:{}'
+CHAVE_VERSAO_BUSCA = 'apartamentos:versao_busca'
+CHAVE_VERSAO_BUSCA_ESTRUTURA = 'apartamentos:versao_busca_estrutura'
+CHAVE_VERSAO_BUSCA_CIDADE = 'apartamentos:versao_busca_cidade:{}'
+TEMPO_RESULTADO_BUSCA = 60 * 10
+# Single-flight: só um processo recalcula uma página que expirou; os demais esperam o resultado
+TEMPO_TRAVA_BUSCA = 10
+ESPERA_TRAVA_BUSCA = 0.05
+TENTATIVAS_TRAVA_BUSCA = 60  # ~3 s esperando antes de desistir e calcular por conta própria
+
+CHAVE_VERSAO_APARTAMENTO = 'apartamentos:versao_apartamento:{}'
+TEMPO_FRAGMENTOS_APARTAMENTO = 60 * 60  # Usado pelos {% cache %} de apartamento_detail.html
+
+
+def obter_catalogo_cidades():
+    """
+    Retorna o catálogo de cidades como uma lista de tuplas (chave normalizada,
+    nome para exibição, quantidade de prédios), ordenada pela chave.
+
+    O catálogo fica em cache e é invalidado pelos sinais de Predio, então a
+    consulta agrupada só roda depois que algum prédio é criado, alterado ou removido.
+    """
+    catalogo = cache.get(CHAVE_CATALOGO_CIDADES)
+    if catalogo is None:
+        linhas = (Predio.objects.values('cidade_normalizada')
+                  .annotate(nome=Min('cidade'), total=Count('pk'))
+                  .order_by('cidade_normalizada'))
+        with ler_do_primario():
+            catalogo = [(linha['cidade_normalizada'], linha['nome'], linha['total']) for linha in linhas
+                        if linha['cidade_normalizada']]
+        cache.set(CHAVE_CATALOGO_CIDADES, catalogo, TEMPO_CATALOGO_CIDADES)
+    return catalogo
+
+
+def invalidar_catalogo_cidades():
+    cache.delete(CHAVE_CATALOGO_CIDADES)
+
+
+def obter_catalogo_comodidades():
+    """Lista (pk, nome) de todas as comodidades, em cache até alguma comodidade mudar."""
+    catalogo = cache.get(CHAVE_CATALOGO_COMODIDADES)
+    if catalogo is None:
+        with ler_do_primario():
+            catalogo = list(Comodidade.objects.order_by('nome').values_list('pk', 'nome'))
+        cache.set(CHAVE_CATALOGO_COMODIDADES, catalogo, TEMPO_CATALOGO_COMODIDADES)
+    return catalogo
+
+
+def invalidar_catalogo_comodidades():
+    cache.delete(CHAVE_CATALOGO_COMODIDADES)
+
+
+def autocompletar_cidades(prefixo, limite=10):
+    """
+    Retorna os nomes das cidades cuja chave normalizada começa com o prefixo
+    digitado, das com mais prédios para as com menos. A busca é feita por
+    bisseção no catálogo em cache, sem consultar o banco.
+    """
+    chave = normalizar_texto(prefixo)
+    if not chave:
+        return []
+    catalogo = obter_catalogo_cidades()
+    inicio = bisect_left(catalogo, (chave,))
+    encontradas = []
+    for chave_cidade, nome, total in catalogo[inicio:]:
+        if not chave_cidade.startswith(chave):
+            break
+        encontradas.append((total, nome))
+    encontradas.sort(key=lambda item: (-item[0], item[1]))
+    return [nome for _, nome in encontradas[:limite]]
+
+
+def cidade_do_prefixo(prefixo):
+    """
+    Chave normalizada da única cidade do catálogo que começa com o prefixo (o filtro de
+    cidade da lista é por prefixo), ou None se nenhuma ou mais de uma casar.
+    """
+    chave = normalizar_texto(prefixo)
+    if not chave:
+        return None
+    catalogo = obter_catalogo_cidades()
+    inicio = bisect_left(catalogo, (chave,))
+    encontradas = [cidade for cidade, _, _ in catalogo[inicio:inicio + 2] if cidade.startswith(chave)]
+    return encontradas[0] if len(encontradas) == 1 else None
+
+
+def obter_resultado_busca(parametros, calcular, cidade=None):
+    """
+    Resultado em cache de uma busca da lista, pela assinatura dos parâmetros normalizados.
+    Com `cidade` (busca restrita a uma cidade, ver cidade_do_prefixo) a entrada vale
+    enquanto nada mudar naquela cidade nem nos prédios/comodidades; sem ela, enquanto
+    nada mudar. `calcular()` roda no máximo uma vez por vez para a mesma chave.
+    """
+    return _calcular_uma_vez(_chave_resultado_busca(parametros, cidade), calcular, TEMPO_RESULTADO_BUSCA)
+
+
+async def aobter_resultado_busca(parametros, calcular, cidade=None):
+    """
+    obter_resultado_busca para as views assíncronas: `calcular` é uma função async, e quem
+    espera a trava de outro cálculo libera o event loop em vez de dormir na thread.
+    """
+    chave = await sync_to_async(_chave_resultado_busca)(parametros, cidade)
+    return await _acalcular_uma_vez(chave, calcular, TEMPO_RESULTADO_BUSCA)
+
+
+def _chave_resultado_busca(parametros, cidade):
+    if cidade:
+        chave_cidade = _chave_versao_cidade(cidade)
+        versoes = cache.get_many([CHAVE_VERSAO_BUSCA_ESTRUTURA, chave_cidade])
+        versao = (versoes.get(CHAVE_VERSAO_BUSCA_ESTRUTURA) or _versao(CHAVE_VERSAO_BUSCA_ESTRUTURA),
+                  versoes.get(chave_cidade) or _versao(chave_cidade))
+    else:
+        versao = _versao(CHAVE_VERSAO_BUSCA)
+    assinatura = hashlib.md5(repr((versao, cidade, parametros)).encode()).hexdigest()
+    return CHAVE_RESULTADO_BUSCA.format(assinatura)
+
+
+def _chave_versao_cidade(cidade):
+    # Sem espaços na chave (memcached não aceita); a cidade já vem normalizada, sem acentos
+    return CHAVE_VERSAO_BUSCA_CIDADE.format(cidade.replace(' ', '_'))
+
+
+def _calcular_uma_vez(chave, calcular, tempo):
+    resultado = cache.get(chave)
+    if resultado is not None:
+        return resultado
+    chave_trava = f'{chave}:trava'
+    for _ in range(TENTATIVAS_TRAVA_BUSCA):
+        if cache.add(chave_trava, 1, TEMPO_TRAVA_BUSCA):
+            try:
+                resultado = cache.get(chave)  # pode ter ficado pronto entre a leitura e a trava
+                if resultado is None:
+                    with ler_do_primario():
+                        resultado = calcular()
+                    cache.set(chave, resultado, tempo)
+            finally:
+                cache.delete(chave_trava)
+            return resultado
+        time.sleep(ESPERA_TRAVA_BUSCA)
+        resultado = cache.get(chave)
+        if resultado is not None:
+            return resultado
+    # Quem segurava a trava demorou demais (ou caiu): calcula sem esperar mais
+    with ler_do_primario():
+        return calcular()
+
+
+async def _acalcular_uma_vez(chave, calcular, tempo):
+    resultado = await cache.aget(chave)
+    if resultado is not None:
+        return resultado
+    chave_trava = f'{chave}:trava'
+    for _ in range(TENTATIVAS_TRAVA_BUSCA):
+        if await cache.aadd(chave_trava, 1, TEMPO_TRAVA_BUSCA):
+            try:
+                resultado = await cache.aget(chave)
+                if resultado is None:
+                    with ler_do_primario():
+                        resultado = await calcular()
+                    await cache.aset(chave, resultado, tempo)
+            finally:
+                await cache.adelete(chave_trava)
+            return resultado
+        await asyncio.sleep(ESPERA_TRAVA_BUSCA)
+        resultado = await cache.aget(chave)
+        if resultado is not None:
+            return resultado
+    with ler_do_primario():
+        return await calcular()
+
+
+def invalidar_busca(*cidades, estrutura=False):
+    """
+    Invalida as buscas em cache afetadas por uma alteração: todas as buscas sem cidade e,
+    nas restritas a uma cidade, as das `cidades` dadas (ou todas, com estrutura=True).
+    """
+    _incrementar_versao(CHAVE_VERSAO_BUSCA)
+    if estrutura:
+        _incrementar_versao(CHAVE_VERSAO_BUSCA_ESTRUTURA)
+    for cidade in cidades:
+        if cidade:
+            _incrementar_versao(_chave_versao_cidade(cidade))
+
+
+def versao_apartamento(apartamento_id):
+    """
+    Versão atual do conteúdo em cache de um apartamento. Ela entra na chave dos
+    fragmentos da página de detalhe, então mudar a versão invalida todos de uma vez.
+
+    A versão inicial vem do relógio (e não de 1) para que, se a chave for
+    descartada pelo cache, fragmentos antigos nunca voltem a ser reaproveitados.
+    """
+    return _versao(CHAVE_VERSAO_APARTAMENTO.format(apartamento_id))
+
+
+def _versao(chave):
+    versao = cache.get(chave)
+    if versao is None:
+        cache.add(chave, time.time_ns(), None)
+        versao = cache.get(chave)
+    return versao
+
+
+def _incrementar_versao(chave):
+    try:
+        cache.incr(chave)
+    except ValueError:
+        # Sem versão em cache, não há entradas válidas para invalidar
+        pass
+
+
+def versoes_apartamentos(apartamento_ids):
+    """Versões de vários apartamentos de uma vez ({id: versão}), com um get_many no cache."""
+    chaves = {CHAVE_VERSAO_APARTAMENTO.format(pk): pk for pk in apartamento_ids}
+    versoes = {chaves[chave]: versao for chave, versao in cache.get_many(chaves).items()}
+    for pk in apartamento_ids:
+        if pk not in versoes:
+            versoes[pk] = versao_apartamento(pk)
+    return versoes
+
+
+def invalidar_apartamento(apartamento_id):
+    _incrementar_versao(CHAVE_VERSAO_APARTAMENTO.format(apartamento_id))
+
+
+def obter_usuario(usuario_id, carregar):
+    """
+    Registro do usuário autenticado (EmailBackend.get_user), que é lido em toda
+    requisição com sessão. Fica em cache por id; `carregar(usuario_id)` só roda
+    na falta, e um None (usuário inexistente) não é guardado.
+    """
+    chave = CHAVE_USUARIO.format(usuario_id)
+    usuario = cache.get(chave)
+    if usuario is None:
+        with ler_do_primario():
+            usuario = carregar(usuario_id)
+        if usuario is not None:
+            cache.set(chave, usuario, TEMPO_USUARIO)
+    return usuario
+
+
+def invalidar_usuario(usuario_id):
+    cache.delete(CHAVE_USUARIO.format(usuario_id))
+
+
+def obter_permissoes(usuario_id, carregar):
+    """
+    Conjunto de permissões ('app.codename') do usuário, entre requisições. A chave leva
+    a versão global (grupos e suas permissões) e a do usuário (seus grupos e flags), lidas
+    juntas em um get_many; quando uma delas muda, as entradas antigas deixam de ser usadas
+    tanto no cache compartilhado quanto na cópia local de cada processo.
+    `carregar()` só roda na falta.
+    """
+    chave_usuario = CHAVE_VERSAO_PERMISSOES_USUARIO.format(usuario_id)
+    versoes = cache.get_many([CHAVE_VERSAO_PERMISSOES, chave_usuario])
+    chave = CHAVE_PERMISSOES.format(usuario_id, versoes.get(CHAVE_VERSAO_PERMISSOES) or _versao(CHAVE_VERSAO_PERMISSOES),
+                                    versoes.get(chave_usuario) or _versao(chave_usuario))
+    with _trava_permissoes_locais:
+        permissoes = _permissoes_locais.get(chave)
+    if permissoes is None:
+        permissoes = cache.get(chave)
+        if permissoes is None:
+            with ler_do_primario():
+                permissoes = frozenset(carregar())
+            cache.set(chave, permissoes, TEMPO_PERMISSOES)
+        with _trava_permissoes_locais:
+            _permissoes_locais[chave] = permissoes
+    return permissoes
+
+
+def invalidar_permissoes(usuario_id=None):
+    """Invalida as permissões em cache de um usuário ou, sem usuario_id, de todos."""
+    if usuario_id is None:
+        _incrementar_versao(CHAVE_VERSAO_PERMISSOES)
+    else:
+        _incrementar_versao(CHAVE_VERSAO_PERMISSOES_USUARIO.format(usuario_id))
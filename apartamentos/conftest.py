@@ -0,0 +1,10 @@
+import pytest
+from django.core.cache import cache
+
+
+@pytest.fixture(autouse=True)
+def limpar_cache():
+    """O banco volta ao estado inicial a cada teste; o cache precisa acompanhar."""
+    cache.clear()
+    yield
+    cache.clear()
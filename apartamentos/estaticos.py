@@ -0,0 +1,135 @@
+# apartamentos/estaticos.py
+"""
+Arquivos estáticos: pacotes (CSS/JS concatenados) e o WhiteNoise.
+
+Os templates só referenciam os pacotes de settings.PACOTES_ESTATICOS. O
+PacotesFinder os monta a partir dos arquivos de origem (os de static/vendor/
+vêm do manage.py baixar_estaticos_externos), então o collectstatic os trata
+como qualquer outro estático: nome com hash do conteúdo, versões .br/.gz
+pré-comprimidas e, no WhiteNoise, cache "immutable" de um ano.
+
+O WhiteNoiseMiddleware original só é síncrono: no ASGI o Django passaria toda
+requisição (inclusive as das views assíncronas) por uma thread só por causa
+dele. Este aceita os dois modos; no assíncrono, só a entrega do arquivo vai
+para uma thread.
+"""
+import os
+import posixpath
+import re
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core import checks
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import FileSystemStorage
+from whitenoise.middleware import WhiteNoiseMiddleware as WhiteNoiseMiddlewareSincrono
+
+# Comentários de source map: os .map não são publicados, e o manifest do collectstatic
+# recusaria a referência a um arquivo inexistente
+RE_SOURCE_MAP = re.compile(r'^\s*(?://[#@]\s*sourceMappingURL=.*|/\*[#@]\s*sourceMappingURL=.*?\*/)\s*$',
+                           re.MULTILINE)
+RE_URL_CSS = re.compile(r'''url\(\s*(['"]?)(?!data:|https?:|//|/|#)([^'")]+)\1\s*\)''')
+
+
+def remover_source_maps(conteudo):
+    return RE_SOURCE_MAP.sub('', conteudo)
+
+
+def _ajustar_urls_css(conteudo, origem, destino):
+    """url(...) relativas de um CSS em `origem` reescritas para valer a partir de `destino`."""
+    pasta_origem, pasta_destino = posixpath.dirname(origem), posixpath.dirname(destino)
+
+    def ajustar(match):
+        caminho = posixpath.normpath(posixpath.join(pasta_origem, match.group(2)))
+        return f'url({match.group(1)}{posixpath.relpath(caminho, pasta_destino or ".")}{match.group(1)})'
+    return RE_URL_CSS.sub(ajustar, conteudo)
+
+
+def montar_pacote(nome, fontes):
+    """Conteúdo do pacote `nome`: as fontes (caminhos estáticos) na ordem, sem source maps."""
+    partes = []
+    for fonte in fontes:
+        caminho = finders.find(fonte)
+        if caminho is None:
+            raise ImproperlyConfigured(f'"{fonte}" (pacote {nome}) não foi encontrado nos estáticos. '
+                                       'Os de vendor/ são baixados pelo manage.py baixar_estaticos_externos.')
+        with open(caminho, encoding='utf-8') as arquivo:
+            conteudo = remover_source_maps(arquivo.read())
+        if nome.endswith('.css'):
+            conteudo = _ajustar_urls_css(conteudo, fonte, nome)
+        partes.append(f'/* {fonte} */\n{conteudo.strip()}\n')
+    # ';' entre scripts: um arquivo sem ponto e vírgula final não emenda no próximo
+    return ('\n' if nome.endswith('.css') else ';\n').join(partes)
+
+
+class PacotesFinder(finders.BaseFinder):
+    """
+    Finder dos pacotes de settings.PACOTES_ESTATICOS: monta cada um em
+    PACOTES_ESTATICOS_DIR quando alguma fonte mudou e o entrega como um
+    arquivo estático comum (runserver, WhiteNoise em DEBUG e collectstatic).
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.storage = FileSystemStorage(location=settings.PACOTES_ESTATICOS_DIR)
+
+    def check(self, **kwargs):
+        faltando = sorted({fonte for fontes in settings.PACOTES_ESTATICOS.values() for fonte in fontes
+                           if finders.find(fonte) is None})
+        if faltando:
+            return [checks.Warning(f'Fontes de pacotes estáticos não encontradas: {", ".join(faltando)}.',
+                                   hint='Rode python manage.py baixar_estaticos_externos.',
+                                   id='apartamentos.W001')]
+        return []
+
+    def find(self, path, find_all=False, **kwargs):
+        find_all = self._check_deprecated_find_param(find_all=find_all, **kwargs)
+        if path not in settings.PACOTES_ESTATICOS:
+            return []  # como os finders do Django: lista vazia mesmo sem find_all
+        caminho = self._atualizar(path)
+        return [caminho] if find_all else caminho
+
+    def list(self, ignore_patterns):
+        for nome in settings.PACOTES_ESTATICOS:
+            self._atualizar(nome)
+            yield nome, self.storage
+
+    def _atualizar(self, nome):
+        destino = self.storage.path(nome)
+        fontes = settings.PACOTES_ESTATICOS[nome]
+        caminhos = [finders.find(fonte) for fonte in fontes]
+        if os.path.exists(destino) and None not in caminhos and \
+                os.path.getmtime(destino) >= max(os.path.getmtime(caminho) for caminho in caminhos):
+            return destino
+        conteudo = montar_pacote(nome, fontes)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        temporario = f'{destino}.{os.getpid()}.tmp'
+        with open(temporario, 'w', encoding='utf-8') as arquivo:
+            arquivo.write(conteudo)
+        os.replace(temporario, destino)  # quem estiver lendo nunca vê o pacote pela metade
+        return destino
+
+
+class WhiteNoiseMiddleware(WhiteNoiseMiddlewareSincrono):
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            # Procura no disco a cada requisição (DEBUG)
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
@@ -1,11 +1,30 @@
 # apartamentos/filters.py
+from decimal import Decimal
+
 import django_filters
-from django.forms import TextInput
-from .models import Apartamento
+from django.db.models import Count, Q
+from django.forms import NumberInput, Select, TextInput
+from .models import Apartamento, ApartamentoComodidade
+from .busca import buscar_apartamentos
+from .cache import obter_catalogo_comodidades
+from .utils import normalizar_texto
+
+# Quartos a partir deste número ficam juntos no filtro e na faceta ("4+")
+QUARTOS_MAXIMO = 4
+# Faixas de preço da diária usadas nas facetas: (mínimo, máximo exclusivo ou None)
+FAIXAS_PRECO = ((None, Decimal('150')), (Decimal('150'), Decimal('250')), (Decimal('250'), Decimal('400')),
+                (Decimal('400'), None))
+
+
+def _campo_numero(placeholder, passo='1'):
+    return NumberInput(attrs={'placeholder': placeholder, 'class': 'form-control', 'min': '0', 'step': passo})
+
 
 class ApartamentoFilter(django_filters.FilterSet):
+    # Filtra pela chave normalizada (sem acentos/maiúsculas), que é indexada,
+    # em vez de um icontains que varre a tabela de prédios.
     predio__cidade = django_filters.CharFilter(
-        lookup_expr='icontains',
+        method='filtrar_cidade',
         label="",
         widget=TextInput(attrs={
             'placeholder': 'Qual cidade?',
@@ -14,6 +33,102 @@ class ApartamentoFilter(django_filters.FilterSet):
         })
     )
 
+    # Busca em texto completo no título, descrição e dados do prédio, com a relevância anotada (ver busca.py)
+    q = django_filters.CharFilter(
+        method='filtrar_texto',
+        label="",
+        widget=TextInput(attrs={
+            'placeholder': 'O que você procura? Ex: varanda perto da praia',
+            'class': 'form-control',
+            'type': 'search'
+        })
+    )
+
+    quartos = django_filters.ChoiceFilter(
+        method='filtrar_quartos', label="Quartos", empty_label='Qualquer',
+        choices=[(n, str(n)) for n in range(1, QUARTOS_MAXIMO)] + [(QUARTOS_MAXIMO, f'{QUARTOS_MAXIMO}+')],
+        widget=Select(attrs={'class': 'form-select'}))
+    banheiros = django_filters.NumberFilter(field_name='numero_banheiros', lookup_expr='gte', label="Banheiros (mín.)",
+                                            widget=_campo_numero('Mín.'))
+    area_min = django_filters.NumberFilter(field_name='area_m2', lookup_expr='gte', label="Área mínima (m²)",
+                                           widget=_campo_numero('Mín.'))
+    area_max = django_filters.NumberFilter(field_name='area_m2', lookup_expr='lte', label="Área máxima (m²)",
+                                           widget=_campo_numero('Máx.'))
+    preco_min = django_filters.NumberFilter(field_name='preco_diaria', lookup_expr='gte', label="Diária mínima (R$)",
+                                            widget=_campo_numero('Mín.', '0.01'))
+    preco_max = django_filters.NumberFilter(field_name='preco_diaria', lookup_expr='lt', label="Diária abaixo de (R$)",
+                                            widget=_campo_numero('Máx.', '0.01'))
+    # As opções vêm do catálogo em cache, então validar o filtro não consulta o banco
+    comodidades = django_filters.MultipleChoiceFilter(method='filtrar_comodidades', label="Comodidades",
+                                                      choices=obter_catalogo_comodidades)
+
     class Meta:
         model = Apartamento
-        fields = [] # Apenas o filtro de cidade, definido acima, será usado.
\ No newline at end of file
+        fields = [] # Apenas os filtros definidos acima serão usados.
+
+    def filtrar_cidade(self, queryset, name, value):
+        chave = normalizar_texto(value)
+        if not chave:
+            return queryset
+        return queryset.filter(predio__cidade_normalizada__startswith=chave)
+
+    def filtrar_texto(self, queryset, name, value):
+        return buscar_apartamentos(queryset, value)
+
+    def filtrar_quartos(self, queryset, name, value):
+        quartos = int(value)
+        if quartos >= QUARTOS_MAXIMO:
+            return queryset.filter(numero_quartos__gte=QUARTOS_MAXIMO)
+        return queryset.filter(numero_quartos=quartos)
+
+    def filtrar_comodidades(self, queryset, name, value):
+        """
+        Apartamentos com TODAS as comodidades marcadas, em uma única subconsulta agrupada
+        (em vez de um JOIN em ApartamentoComodidade por comodidade, que multiplicaria as linhas).
+        """
+        ids = {int(pk) for pk in value}
+        if not ids:
+            return queryset
+        com_todas = (ApartamentoComodidade.objects.filter(comodidade_id__in=ids).values('apartamento_id')
+                     .annotate(total=Count('comodidade_id')).filter(total=len(ids)).values('apartamento_id'))
+        return queryset.filter(pk__in=com_todas)
+
+
+def contar_facetas(queryset):
+    """
+    Conta, entre os resultados filtrados, as unidades por número de quartos e por
+    faixa de preço em uma única consulta agregada (um COUNT ... FILTER por valor de
+    faceta), e por comodidade em um GROUP BY sobre ApartamentoComodidade restrito aos
+    mesmos resultados. Os nomes das comodidades vêm do catálogo em cache.
+
+    :return: dict com total, quartos [(valor, rótulo, n)], comodidades [(pk, nome, n)]
+             e precos [(mínimo, máximo, n)].
+    """
+    comodidades = obter_catalogo_comodidades()
+    # Só os ids dos resultados: anotações da listagem (foto de capa, relevância) não entram na contagem
+    apartamentos = Apartamento.objects.filter(pk__in=queryset.order_by().values('pk'))
+    contagens = {'total': Count('pk')}
+    for quartos in range(1, QUARTOS_MAXIMO + 1):
+        filtro = Q(numero_quartos__gte=quartos) if quartos == QUARTOS_MAXIMO else Q(numero_quartos=quartos)
+        contagens[f'quartos_{quartos}'] = Count('pk', filter=filtro)
+    for indice, (minimo, maximo) in enumerate(FAIXAS_PRECO):
+        filtro = Q()
+        if minimo is not None:
+            filtro &= Q(preco_diaria__gte=minimo)
+        if maximo is not None:
+            filtro &= Q(preco_diaria__lt=maximo)
+        contagens[f'preco_{indice}'] = Count('pk', filter=filtro)
+    resultado = apartamentos.aggregate(**contagens)
+    # Um JOIN com ApartamentoComodidade agrupado por comodidade; o par (apartamento, comodidade) é único,
+    # então COUNT simples. A consulta parte de Apartamento porque a busca por texto no SQLite cita a tabela.
+    por_comodidade = dict(apartamentos.filter(apartamentocomodidade__isnull=False)
+                          .values_list('apartamentocomodidade__comodidade_id').annotate(total=Count('pk'))
+                          .order_by())
+    return {
+        'total': resultado['total'],
+        'quartos': [(n, f'{n}+' if n == QUARTOS_MAXIMO else str(n), resultado[f'quartos_{n}'])
+                    for n in range(1, QUARTOS_MAXIMO + 1)],
+        'comodidades': [(pk, nome, por_comodidade.get(pk, 0)) for pk, nome in comodidades],
+        'precos': [(minimo, maximo, resultado[f'preco_{indice}'])
+                   for indice, (minimo, maximo) in enumerate(FAIXAS_PRECO)],
+    }
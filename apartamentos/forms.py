@@ -28,8 +28,21 @@ class PerfilUpdateForm(forms.ModelForm):
 class PredioForm(forms.ModelForm):
     class Meta:
         model = Predio
-        fields = ['nome', 'endereco_completo', 'cidade', 'estado', 'cep', 'foto_fachada']
-        widgets = {'nome': forms.TextInput(attrs={'class': 'form-control'}), 'endereco_completo': forms.TextInput(attrs={'class': 'form-control'}), 'cidade': forms.TextInput(attrs={'class': 'form-control'}), 'estado': forms.TextInput(attrs={'class': 'form-control'}), 'cep': forms.TextInput(attrs={'class': 'form-control'}), 'foto_fachada': forms.FileInput(attrs={'class': 'form-control'})}
+        fields = ['nome', 'endereco_completo', 'cidade', 'estado', 'cep', 'latitude', 'longitude', 'foto_fachada']
+        widgets = {'nome': forms.TextInput(attrs={'class': 'form-control'}), 'endereco_completo': forms.TextInput(attrs={'class': 'form-control'}), 'cidade': forms.TextInput(attrs={'class': 'form-control'}), 'estado': forms.TextInput(attrs={'class': 'form-control'}), 'cep': forms.TextInput(attrs={'class': 'form-control'}), 'latitude': forms.NumberInput(attrs={'class': 'form-control', 'step': 'any', 'min': '-90', 'max': '90'}), 'longitude': forms.NumberInput(attrs={'class': 'form-control', 'step': 'any', 'min': '-180', 'max': '180'}), 'foto_fachada': forms.FileInput(attrs={'class': 'form-control'})}
+        help_texts = {'latitude': 'Opcional: sem coordenadas, o prédio é posicionado pelo CEP.'}
+
+    def clean(self):
+        cleaned_data = super().clean()
+        latitude, longitude = cleaned_data.get('latitude'), cleaned_data.get('longitude')
+        if (latitude is None) != (longitude is None):
+            raise forms.ValidationError("Informe a latitude e a longitude juntas, ou deixe as duas em branco.")
+        if latitude is not None and not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise forms.ValidationError("Coordenadas fora do intervalo válido.")
+        if {'latitude', 'longitude'} & set(self.changed_data):
+            # Coordenadas digitadas pelo proprietário deixam de acompanhar o CEP (ver Predio.preencher_localizacao)
+            self.instance.coordenadas_aproximadas = False
+        return cleaned_data
 
 class ApartamentoForm(forms.ModelForm):
     # MUDANÇA: Usamos ModelMultipleChoiceField com CheckboxSelectMultiple
@@ -0,0 +1,143 @@
+# apartamentos/geo.py
+"""
+Localização dos prédios e busca por raio ou por área do mapa.
+
+Cada prédio guarda latitude/longitude e uma célula de grade (celula_geo): a
+posição quantizada em BITS bits por eixo, com os bits de longitude e latitude
+intercalados (curva Z, a mesma ideia do geohash). Células vizinhas na grade
+ficam em faixas contíguas de inteiros, então uma área do mapa vira poucas faixas
+`celula_geo BETWEEN ...` sobre um índice B-tree comum, sem extensão espacial,
+igual no PostgreSQL e no SQLite. As coordenadas exatas refinam o resultado.
+
+Sem coordenadas informadas, o prédio recebe o centroide aproximado da faixa do
+seu CEP (tabela offline em dados/centroides_cep.csv).
+"""
+import csv
+import math
+from decimal import Decimal
+from functools import lru_cache
+from pathlib import Path
+
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import ACos, Cast, Cos, Least, Radians, Sin
+
+BITS = 26  # por eixo: células de ~0,6 m no equador, com folga para um BigIntegerField
+RAIO_TERRA_KM = 6371.0
+MAXIMO_CELULAS = 16  # células da grade consultadas por busca, antes de juntar as faixas contíguas
+ARQUIVO_CENTROIDES = Path(__file__).resolve().parent / 'dados' / 'centroides_cep.csv'
+
+
+def _quantizar(valor, minimo, maximo):
+    posicao = int((float(valor) - minimo) / (maximo - minimo) * (1 << BITS))
+    return min(max(posicao, 0), (1 << BITS) - 1)
+
+
+def _intercalar(x, y, bits):
+    codigo = 0
+    for bit in range(bits):
+        codigo |= ((x >> bit) & 1) << (2 * bit) | ((y >> bit) & 1) << (2 * bit + 1)
+    return codigo
+
+
+def celula_geo(latitude, longitude):
+    """Célula de grade (inteiro na curva Z) de um ponto."""
+    return _intercalar(_quantizar(longitude, -180, 180), _quantizar(latitude, -90, 90), BITS)
+
+
+def faixas_da_caixa(sul, oeste, norte, leste, maximo_celulas=MAXIMO_CELULAS):
+    """
+    Faixas [inicio, fim) de celula_geo que cobrem a caixa. Usa o nível de grade mais
+    fino em que a caixa cabe em até maximo_celulas células e junta as contíguas.
+    """
+    x0, x1 = _quantizar(oeste, -180, 180), _quantizar(leste, -180, 180)
+    y0, y1 = _quantizar(sul, -90, 90), _quantizar(norte, -90, 90)
+    nivel = BITS
+    while nivel > 0 and ((x1 >> (BITS - nivel)) - (x0 >> (BITS - nivel)) + 1) * \
+            ((y1 >> (BITS - nivel)) - (y0 >> (BITS - nivel)) + 1) > maximo_celulas:
+        nivel -= 1
+    deslocamento = BITS - nivel
+    tamanho = 1 << (2 * deslocamento)
+    inicios = sorted(_intercalar(x, y, nivel) * tamanho
+                     for x in range(x0 >> deslocamento, (x1 >> deslocamento) + 1)
+                     for y in range(y0 >> deslocamento, (y1 >> deslocamento) + 1))
+    faixas = []
+    for inicio in inicios:
+        if faixas and faixas[-1][1] == inicio:
+            faixas[-1][1] = inicio + tamanho
+        else:
+            faixas.append([inicio, inicio + tamanho])
+    return [tuple(faixa) for faixa in faixas]
+
+
+def filtro_caixa(sul, oeste, norte, leste, prefixo=''):
+    """Q dos prédios dentro da caixa: faixas de células (índice) + coordenadas exatas."""
+    celulas = Q()
+    for inicio, fim in faixas_da_caixa(sul, oeste, norte, leste):
+        celulas |= Q(**{f'{prefixo}celula_geo__gte': inicio, f'{prefixo}celula_geo__lt': fim})
+    return celulas & Q(**{f'{prefixo}latitude__range': (sul, norte), f'{prefixo}longitude__range': (oeste, leste)})
+
+
+def caixa_do_raio(latitude, longitude, raio_km):
+    """Caixa (sul, oeste, norte, leste) que contém o círculo."""
+    delta_lat = math.degrees(raio_km / RAIO_TERRA_KM)
+    delta_lng = math.degrees(raio_km / (RAIO_TERRA_KM * max(math.cos(math.radians(latitude)), 0.01)))
+    return (max(latitude - delta_lat, -90), max(longitude - delta_lng, -180),
+            min(latitude + delta_lat, 90), min(longitude + delta_lng, 180))
+
+
+def expressao_distancia_km(latitude, longitude, prefixo=''):
+    """Distância em km até o ponto (lei dos cossenos esférica), calculável no PostgreSQL e no SQLite."""
+    lat = Radians(Cast(F(f'{prefixo}latitude'), FloatField()))
+    lng = Radians(Cast(F(f'{prefixo}longitude'), FloatField()))
+    lat0, lng0 = math.radians(latitude), math.radians(longitude)
+    cosseno = Cos(lat) * math.cos(lat0) * Cos(lng - lng0) + Sin(lat) * math.sin(lat0)
+    return ACos(Least(cosseno, 1.0)) * RAIO_TERRA_KM
+
+
+def _ler_numero(dados, nome, minimo, maximo):
+    valor = float(dados[nome])
+    if not minimo <= valor <= maximo:  # NaN também cai aqui
+        raise ValueError(nome)
+    return valor
+
+
+def ler_caixa(dados):
+    """Lê sul/oeste/norte/leste (área visível do mapa) de um QueryDict; retorna a tupla ou None."""
+    try:
+        sul, norte = _ler_numero(dados, 'sul', -90, 90), _ler_numero(dados, 'norte', -90, 90)
+        oeste, leste = _ler_numero(dados, 'oeste', -180, 180), _ler_numero(dados, 'leste', -180, 180)
+    except (KeyError, ValueError):
+        return None
+    if sul > norte or oeste > leste:
+        return None
+    return sul, oeste, norte, leste
+
+
+def ler_circulo(dados, raio_maximo_km=200):
+    """Lê lat/lng/raio (km) de um QueryDict; retorna (lat, lng, raio) ou None."""
+    try:
+        return (_ler_numero(dados, 'lat', -90, 90), _ler_numero(dados, 'lng', -180, 180),
+                _ler_numero(dados, 'raio', 0.1, raio_maximo_km))
+    except (KeyError, ValueError):
+        return None
+
+
+@lru_cache(maxsize=1)
+def _centroides():
+    with open(ARQUIVO_CENTROIDES, encoding='utf-8') as arquivo:
+        linhas = [(int(linha['cep_inicio']), int(linha['cep_fim']), Decimal(linha['latitude']),
+                   Decimal(linha['longitude'])) for linha in csv.DictReader(arquivo)]
+    # A faixa mais estreita (cidade) ganha da mais larga (estado)
+    return sorted(linhas, key=lambda linha: linha[1] - linha[0])
+
+
+def centroide_do_cep(cep):
+    """(latitude, longitude) aproximadas pelo prefixo de 5 dígitos do CEP, ou None se desconhecido."""
+    digitos = ''.join(c for c in str(cep or '') if c.isdigit())
+    if len(digitos) < 5:
+        return None
+    prefixo = int(digitos[:5])
+    for inicio, fim, latitude, longitude in _centroides():
+        if inicio <= prefixo <= fim:
+            return latitude, longitude
+    return None
@@ -0,0 +1,86 @@
+# apartamentos/ical.py
+"""
+Feeds iCalendar (.ics) de disponibilidade, para sincronizar com outros canais de reserva.
+
+Os feeds não exigem login (quem consome é o gerenciador de canais): o acesso é
+por uma chave assinada na URL, gerada para um apartamento ou para todos os
+apartamentos de um proprietário. O conteúdo é produzido linha a linha por um
+gerador, para ser enviado em um StreamingHttpResponse.
+"""
+from datetime import timedelta, timezone as dt_timezone
+
+from django.core import signing
+from django.urls import reverse
+
+SALT_CHAVE_ICS = 'apartamentos.calendario_ics'
+TIPO_APARTAMENTO = 'a'
+TIPO_PROPRIETARIO = 'p'
+DOMINIO_UID = 'aluguelpro'
+
+
+def gerar_chave_ics(tipo, pk):
+    return signing.Signer(salt=SALT_CHAVE_ICS).sign(f'{tipo}{pk}')
+
+
+def ler_chave_ics(chave):
+    """Retorna (tipo, pk) de uma chave válida ou levanta signing.BadSignature."""
+    valor = signing.Signer(salt=SALT_CHAVE_ICS).unsign(chave)
+    tipo, pk = valor[:1], valor[1:]
+    if tipo not in (TIPO_APARTAMENTO, TIPO_PROPRIETARIO) or not pk.isdigit():
+        raise signing.BadSignature(chave)
+    return tipo, int(pk)
+
+
+def url_ics(tipo, pk):
+    return reverse('apartamentos:calendario_ics', kwargs={'chave': gerar_chave_ics(tipo, pk)})
+
+
+def escapar_texto(texto):
+    return (str(texto).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def dobrar_linha(linha):
+    """Quebra linhas com mais de 75 octetos, como exige a RFC 5545 (continuação começa com espaço)."""
+    dados = linha.encode('utf-8')
+    if len(dados) <= 75:
+        return linha + '\r\n'
+    partes, inicio, limite = [], 0, 75
+    while inicio < len(dados):
+        fim = min(inicio + limite, len(dados))
+        # Não corta um caractere UTF-8 ao meio
+        while fim < len(dados) and (dados[fim] & 0xC0) == 0x80:
+            fim -= 1
+        partes.append(dados[inicio:fim].decode('utf-8'))
+        inicio, limite = fim, 74
+    return '\r\n '.join(partes) + '\r\n'
+
+
+def gerar_ics(reservas, nome_calendario):
+    """
+    Gera o calendário linha a linha a partir de dicts de reserva (values() com id, status,
+    data_checkin, data_checkout, data_atualizacao e apartamento__titulo).
+
+    Os dias de check-in a check-out ficam bloqueados, inclusive, seguindo a mesma
+    regra de conflito do ReservaForm; por isso o DTEND (exclusivo no iCalendar) é o
+    dia seguinte ao check-out. Dados do hóspede não saem no feed.
+    """
+    yield from (dobrar_linha(linha) for linha in (
+        'BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//AluguelPro//Calendario de Reservas//PT-BR',
+        'CALSCALE:GREGORIAN', 'METHOD:PUBLISH', f'X-WR-CALNAME:{escapar_texto(nome_calendario)}'))
+    for reserva in reservas:
+        pendente = reserva['status'] == 'PENDENTE'
+        carimbo = reserva['data_atualizacao'].astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        for linha in (
+            'BEGIN:VEVENT',
+            f"UID:reserva-{reserva['id']}@{DOMINIO_UID}",
+            f'DTSTAMP:{carimbo}',
+            f"DTSTART;VALUE=DATE:{reserva['data_checkin']:%Y%m%d}",
+            f"DTEND;VALUE=DATE:{reserva['data_checkout'] + timedelta(days=1):%Y%m%d}",
+            f"SUMMARY:{escapar_texto(('Pré-reserva' if pendente else 'Reservado') + ' - ' + reserva['apartamento__titulo'])}",
+            f"STATUS:{'TENTATIVE' if pendente else 'CONFIRMED'}",
+            'TRANSP:OPAQUE',
+            'END:VEVENT',
+        ):
+            yield dobrar_linha(linha)
+    yield dobrar_linha('END:VCALENDAR')
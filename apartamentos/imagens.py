@@ -0,0 +1,135 @@
+# apartamentos/imagens.py
+"""
+Variantes redimensionadas (WebP e JPEG) das imagens enviadas pelos usuários.
+
+As variantes são geradas uma única vez, fora da requisição, pelo comando
+`manage.py processar_imagens`, e gravadas no mesmo storage, ao lado do original:
+    apartamentos/fotos/sala.jpg -> apartamentos/fotos/sala__card-320.webp, ...
+O storage pode gravar com outro nome (o Cloudinary acrescenta um sufixo aleatório),
+então os nomes devolvidos por storage.save() ficam no modelo (variantes_arquivos) e
+as URLs saem deles. Os templates usam os srcset prontos (ver Variantes) com o
+original como reserva enquanto as variantes ainda não existem.
+"""
+import io
+import os
+
+from PIL import Image, ImageOps
+
+# Cada variante tem as larguras usadas no srcset e a proporção (altura/largura).
+# Com recorte, a imagem é cortada no centro para a proporção exata (cards e avatares).
+VARIANTES = {
+    'card': {'larguras': (320, 640), 'proporcao': 3 / 4, 'recorte': True},
+    'carrossel': {'larguras': (640, 1280, 1920), 'proporcao': 9 / 16, 'recorte': False},
+    'avatar': {'larguras': (96, 200, 400), 'proporcao': 1, 'recorte': True},
+}
+
+# Variantes geradas para cada campo de imagem: (app_label.Modelo, campo) -> nomes
+VARIANTES_POR_CAMPO = {
+    ('apartamentos.FotoApartamento', 'imagem'): ('card', 'carrossel'),
+    ('apartamentos.Predio', 'foto_fachada'): ('card',),
+    ('apartamentos.Perfil', 'foto_perfil'): ('avatar',),
+}
+
+FORMATOS = {'webp': ('WEBP', {'quality': 80, 'method': 4}),
+            'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True})}
+
+
+def nome_variante(nome_original, variante, largura, extensao):
+    raiz, _ = os.path.splitext(nome_original)
+    return f'{raiz}__{variante}-{largura}.{extensao}'
+
+
+def chave_variante(variante, largura, extensao):
+    """Chave de uma variante em variantes_arquivos: 'card-320.webp' -> nome gravado no storage."""
+    return f'{variante}-{largura}.{extensao}'
+
+
+def redimensionar(imagem, variante, largura):
+    config = VARIANTES[variante]
+    altura = round(largura * config['proporcao'])
+    if config['recorte']:
+        return ImageOps.fit(imagem, (largura, altura), Image.Resampling.LANCZOS)
+    copia = imagem.copy()
+    copia.thumbnail((largura, altura), Image.Resampling.LANCZOS)  # thumbnail nunca amplia
+    return copia
+
+
+def gerar_variantes(arquivo, variantes):
+    """
+    Gera e grava no storage do campo todas as larguras/formatos das variantes
+    informadas para o arquivo (um FieldFile). Retorna {chave_variante: nome gravado}.
+    """
+    with arquivo.open('rb') as origem:
+        imagem = Image.open(origem)
+        imagem = ImageOps.exif_transpose(imagem)
+        imagem.load()
+    if imagem.mode != 'RGB':
+        fundo = Image.new('RGB', imagem.size, 'white')
+        fundo.paste(imagem, mask=imagem.convert('RGBA').getchannel('A'))
+        imagem = fundo
+
+    storage, gravados = arquivo.storage, {}
+    for variante in variantes:
+        for largura in VARIANTES[variante]['larguras']:
+            reduzida = redimensionar(imagem, variante, largura)
+            for extensao, (formato, opcoes) in FORMATOS.items():
+                buffer = io.BytesIO()
+                reduzida.save(buffer, formato, **opcoes)
+                nome = nome_variante(arquivo.name, variante, largura, extensao)
+                # Nome determinístico: reprocessar a mesma imagem substitui as variantes antigas
+                if storage.exists(nome):
+                    storage.delete(nome)
+                gravados[chave_variante(variante, largura, extensao)] = storage.save(nome, buffer)
+    return gravados
+
+
+def apagar_variantes(storage, nomes):
+    """Remove do storage variantes que nenhum registro usa mais (o django-cleanup só cuida do original)."""
+    for nome in nomes:
+        storage.delete(nome)
+
+
+class ConjuntoVariante:
+    """srcset de uma variante nos dois formatos, mais a maior versão JPEG como src."""
+
+    def __init__(self, storage, variante, arquivos):
+        self.storage, self.variante, self.arquivos = storage, variante, arquivos
+
+    def _url(self, largura, extensao):
+        return self.storage.url(self.arquivos[chave_variante(self.variante, largura, extensao)])
+
+    def _srcset(self, extensao):
+        return ', '.join(f'{self._url(largura, extensao)} {largura}w' for largura in VARIANTES[self.variante]['larguras'])
+
+    @property
+    def webp(self):
+        return self._srcset('webp')
+
+    @property
+    def jpg(self):
+        return self._srcset('jpg')
+
+    @property
+    def src(self):
+        return self._url(VARIANTES[self.variante]['larguras'][-1], 'jpg')
+
+
+class Variantes:
+    """
+    Acesso às variantes de uma imagem nos templates: {{ foto.variantes.card.webp }}.
+    É falso quando as variantes ainda não foram geradas, para o template usar o original.
+    """
+
+    def __init__(self, arquivo_nome, storage, nomes, prontas, arquivos=None):
+        self.arquivo_nome, self.storage, self.nomes, self.prontas = arquivo_nome, storage, nomes, prontas
+        self.arquivos = arquivos or {}
+
+    def __bool__(self):
+        return bool(self.prontas and self.arquivo_nome and self.arquivos)
+
+    def __getattr__(self, variante):
+        if variante not in self.__dict__.get('nomes', ()):
+            raise AttributeError(variante)
+        if not self:
+            return None
+        return ConjuntoVariante(self.storage, variante, self.arquivos)
@@ -0,0 +1,45 @@
+import hashlib
+import os
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apartamentos.estaticos import remover_source_maps
+
+
+class Command(BaseCommand):
+    help = ('Baixa as bibliotecas de front-end (versões fixas de settings.ESTATICOS_EXTERNOS) para static/, '
+            'de onde entram nos pacotes de settings.PACOTES_ESTATICOS. Roda no build, antes do collectstatic.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--forcar', action='store_true', help='Baixa de novo os arquivos que já existem.')
+
+    def handle(self, *args, **options):
+        destino_base = settings.STATICFILES_DIRS[0]
+        baixados = 0
+        for nome, (url, sha256_esperado) in settings.ESTATICOS_EXTERNOS.items():
+            destino = os.path.join(destino_base, nome)
+            if os.path.exists(destino) and not options['forcar']:
+                continue
+            try:
+                with urllib.request.urlopen(url, timeout=30) as resposta:
+                    conteudo = resposta.read()
+            except (urllib.error.URLError, ConnectionError) as e:
+                raise CommandError(f'Não foi possível baixar {url}: {e}')
+            # Confere os bytes publicados (antes de tirar os source maps): uma CDN comprometida ou uma
+            # versão republicada não chega aos pacotes
+            sha256_obtido = hashlib.sha256(conteudo).hexdigest()
+            if sha256_obtido != sha256_esperado:
+                raise CommandError(
+                    f'sha256 de {url} não confere com settings.ESTATICOS_EXTERNOS: esperado '
+                    f'{sha256_esperado or "(nenhum fixado)"}, obtido {sha256_obtido}.')
+            if nome.endswith(('.css', '.js')):
+                conteudo = remover_source_maps(conteudo.decode('utf-8')).encode('utf-8')
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            with open(destino, 'wb') as arquivo:
+                arquivo.write(conteudo)
+            baixados += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'{baixados} arquivo(s) baixado(s); {len(settings.ESTATICOS_EXTERNOS) - baixados} já existia(m).'))
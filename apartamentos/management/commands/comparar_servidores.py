@@ -0,0 +1,105 @@
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from statistics import quantiles
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from apartamentos.models import Apartamento
+
+# Modo -> argumentos do gunicorn (o mesmo servidor de produção, com e sem os workers do uvicorn)
+SERVIDORES = {
+    'wsgi': ['config.wsgi:application'],
+    'asgi': ['config.asgi:application', '-k', 'uvicorn_worker.UvicornWorker'],
+}
+ESPERA_SERVIDOR = 30  # segundos até o servidor responder
+
+
+class Command(BaseCommand):
+    help = ('Sobe o projeto no gunicorn em modo WSGI e em modo ASGI (workers do uvicorn), com os mesmos '
+            'dados e settings, e compara vazão e latência da lista e do detalhe de apartamentos sob a mesma carga.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modos', nargs='+', choices=SERVIDORES, default=list(SERVIDORES))
+        parser.add_argument('--workers', type=int, default=2, help='Processos do gunicorn em cada modo.')
+        parser.add_argument('--requisicoes', type=int, default=400, help='Requisições medidas por modo.')
+        parser.add_argument('--concorrencia', type=int, default=32, help='Clientes simultâneos.')
+        parser.add_argument('--porta', type=int, default=8701)
+
+    def handle(self, *args, **options):
+        rotas = self.rotas()
+        if not rotas:
+            raise CommandError('Nenhum apartamento disponível; rode antes o gerar_dados_sinteticos.')
+        self.stdout.write(f'{len(rotas)} rota(s), {options["requisicoes"]} requisições, '
+                          f'{options["concorrencia"]} clientes, {options["workers"]} worker(s).')
+        self.stdout.write(f'{"modo":<6}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"máx ms":>10}{"erros":>8}')
+        for modo in options['modos']:
+            base = f'http://127.0.0.1:{options["porta"]}'
+            processo = self.subir_servidor(modo, options['porta'], options['workers'])
+            try:
+                self.esperar_servidor(processo, base)
+                # Aquecimento: uma passada por rota (conexões, templates e caches dos workers)
+                self.carga(base, rotas, len(rotas), options['concorrencia'])
+                inicio = time.perf_counter()
+                latencias, erros = self.carga(base, rotas, options['requisicoes'], options['concorrencia'])
+                duracao = time.perf_counter() - inicio
+            finally:
+                processo.terminate()
+                processo.wait(timeout=30)
+            percentis = quantiles(latencias, n=100) if len(latencias) > 1 else latencias * 99
+            self.stdout.write(f'{modo:<6}{len(latencias) / duracao:>10.1f}{percentis[49] * 1000:>10.1f}'
+                              f'{percentis[94] * 1000:>10.1f}{max(latencias, default=0) * 1000:>10.1f}{erros:>8}')
+
+    @staticmethod
+    def rotas():
+        """A lista com filtros variados (cada um é uma busca diferente no cache) e o detalhe de várias unidades."""
+        lista = reverse('apartamentos:lista_apartamentos')
+        pks = Apartamento.objects.filter(disponivel=True).order_by('-pk').values_list('pk', flat=True)[:20]
+        rotas = [reverse('apartamentos:detalhe_apartamento', args=[pk]) for pk in pks]
+        if rotas:
+            rotas += [lista] + [f'{lista}?preco_max={preco}' for preco in range(100, 1100, 50)]
+        return rotas
+
+    @staticmethod
+    def subir_servidor(modo, porta, workers):
+        ambiente = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE}
+        ambiente.pop('DJANGO_SERVIDOR', None)  # config/asgi.py liga o modo ASGI por conta própria
+        comando = [sys.executable, '-m', 'gunicorn', *SERVIDORES[modo], '-w', str(workers),
+                   '-b', f'127.0.0.1:{porta}', '--log-level', 'warning']
+        return subprocess.Popen(comando, cwd=settings.BASE_DIR, env=ambiente)
+
+    @staticmethod
+    def esperar_servidor(processo, base):
+        limite = time.monotonic() + ESPERA_SERVIDOR
+        while time.monotonic() < limite:
+            if processo.poll() is not None:
+                raise CommandError(f'O servidor saiu com código {processo.returncode}.')
+            try:
+                urllib.request.urlopen(base + reverse('apartamentos:lista_apartamentos'), timeout=5).read()
+                return
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.2)
+        processo.terminate()
+        raise CommandError(f'O servidor não respondeu em {ESPERA_SERVIDOR} s.')
+
+    @staticmethod
+    def carga(base, rotas, total, concorrencia):
+        """Faz `total` requisições percorrendo as rotas; retorna (latências em segundos, erros)."""
+        def requisitar(indice):
+            inicio = time.perf_counter()
+            try:
+                urllib.request.urlopen(base + rotas[indice % len(rotas)], timeout=60).read()
+            except (urllib.error.URLError, ConnectionError):
+                return None
+            return time.perf_counter() - inicio
+
+        with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+            resultados = list(executor.map(requisitar, range(total)))
+        latencias = [latencia for latencia in resultados if latencia is not None]
+        return latencias, len(resultados) - len(latencias)
@@ -0,0 +1,101 @@
+import time
+from datetime import timedelta
+
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from apartamentos.models import EmailPendente
+
+
+class Command(BaseCommand):
+    help = ('Envia os e-mails da caixa de saída (EmailPendente) em lotes, reutilizando uma única '
+            'conexão SMTP, com novas tentativas e espera exponencial em caso de falha.')
+
+    # Tempo durante o qual um lote fica reservado para este processo enquanto é enviado.
+    # Se o worker cair no meio do envio, os e-mails voltam para a fila depois desse prazo.
+    RESERVA_LOTE = timedelta(minutes=5)
+    ESPERA_BASE = timedelta(minutes=1)
+    ESPERA_MAXIMA = timedelta(hours=1)
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=50, help='Quantidade máxima de e-mails por lote.')
+        parser.add_argument('--max-tentativas', type=int, default=5,
+                            help='Tentativas antes de marcar o e-mail como falho.')
+        parser.add_argument('--continuo', action='store_true',
+                            help='Continua rodando e verificando a fila periodicamente.')
+        parser.add_argument('--intervalo', type=float, default=5.0,
+                            help='Segundos de espera entre verificações no modo contínuo.')
+
+    def handle(self, *args, **options):
+        while True:
+            enviados, falhas = self.processar_lote(options['lote'], options['max_tentativas'])
+            if enviados or falhas:
+                self.stdout.write(f'Lote processado: {enviados} enviado(s), {falhas} falha(s).')
+            if not options['continuo']:
+                break
+            if not (enviados or falhas):
+                time.sleep(options['intervalo'])
+
+    def reservar_lote(self, tamanho):
+        """Seleciona o próximo lote e o reserva, para que outros workers não o peguem."""
+        agora = timezone.now()
+        with transaction.atomic():
+            # skip_locked permite vários workers em paralelo no PostgreSQL (ignorado no SQLite).
+            lote = list(
+                EmailPendente.objects.select_for_update(skip_locked=True)
+                .filter(status=EmailPendente.StatusEnvio.PENDENTE, proxima_tentativa__lte=agora)
+                .order_by('proxima_tentativa', 'pk')[:tamanho]
+            )
+            if lote:
+                EmailPendente.objects.filter(pk__in=[email.pk for email in lote]).update(
+                    proxima_tentativa=agora + self.RESERVA_LOTE)
+        return lote
+
+    def calcular_espera(self, tentativas):
+        return min(self.ESPERA_BASE * (2 ** (tentativas - 1)), self.ESPERA_MAXIMA)
+
+    def registrar_falha(self, email, erro, max_tentativas):
+        email.tentativas += 1
+        email.ultimo_erro = str(erro)
+        if email.tentativas >= max_tentativas:
+            email.status = EmailPendente.StatusEnvio.FALHOU
+        else:
+            email.proxima_tentativa = timezone.now() + self.calcular_espera(email.tentativas)
+        email.save(update_fields=['tentativas', 'ultimo_erro', 'status', 'proxima_tentativa'])
+
+    def processar_lote(self, tamanho, max_tentativas):
+        lote = self.reservar_lote(tamanho)
+        if not lote:
+            return 0, 0
+
+        enviados = falhas = 0
+        conexao = get_connection()
+        try:
+            conexao.open()
+        except Exception as e:
+            # Servidor indisponível: todo o lote volta para a fila com espera.
+            for email in lote:
+                self.registrar_falha(email, e, max_tentativas)
+            self.stderr.write(self.style.ERROR(f'Não foi possível conectar ao servidor de e-mail: {e}'))
+            return 0, len(lote)
+
+        try:
+            for email in lote:
+                mensagem = EmailMessage(subject=email.assunto, body=email.corpo, from_email=email.remetente,
+                                        to=[email.destinatario], connection=conexao)
+                try:
+                    mensagem.send(fail_silently=False)
+                except Exception as e:
+                    self.registrar_falha(email, e, max_tentativas)
+                    self.stderr.write(self.style.WARNING(f'Falha ao enviar e-mail #{email.pk}: {e}'))
+                    falhas += 1
+                    continue
+                email.status = EmailPendente.StatusEnvio.ENVIADO
+                email.tentativas += 1
+                email.data_envio = timezone.now()
+                email.save(update_fields=['status', 'tentativas', 'data_envio'])
+                enviados += 1
+        finally:
+            conexao.close()
+        return enviados, falhas
@@ -0,0 +1,261 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User, Group
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from apartamentos.cache import invalidar_catalogo_cidades
+from apartamentos.geo import celula_geo, centroide_do_cep
+from apartamentos.utils import normalizar_texto
+from apartamentos.models import (
+    Predio, Apartamento, ApartamentoComodidade, Comodidade, FotoApartamento, Perfil, Reserva, Avaliacao,
+    OcupacaoDiaria
+)
+
+# (cidade, UF, prefixo do CEP)
+CIDADES = [
+    ('São Paulo', 'SP', '01'), ('Rio de Janeiro', 'RJ', '20'), ('Belo Horizonte', 'MG', '30'),
+    ('Salvador', 'BA', '40'), ('Recife', 'PE', '50'), ('Fortaleza', 'CE', '60'), ('Brasília', 'DF', '70'),
+    ('Curitiba', 'PR', '80'), ('Florianópolis', 'SC', '88'), ('Porto Alegre', 'RS', '90'),
+    ('Manaus', 'AM', '69'), ('Belém', 'PA', '66'), ('Goiânia', 'GO', '74'), ('Vitória', 'ES', '29'),
+    ('Natal', 'RN', '59'), ('João Pessoa', 'PB', '58'), ('Maceió', 'AL', '57'), ('São Luís', 'MA', '65'),
+    ('Campinas', 'SP', '13'), ('Niterói', 'RJ', '24'),
+]
+COMODIDADES_PADRAO = ['Wi-Fi', 'Ar Condicionado', 'Cozinha Equipada', 'TV a Cabo', 'Estacionamento Gratuito',
+                      'Piscina', 'Academia', 'Máquina de Lavar', 'Varanda', 'Aceita Pets']
+FOTOS_EXEMPLO = [
+    'apartamentos/galeria/2025/06/05/apartamento.jpg', 'apartamentos/galeria/2025/06/07/apartamento2interno.jpg',
+    'apartamentos/galeria/2025/06/07/aptoA1Banheiro.jpg', 'apartamentos/galeria/2025/06/07/aptoA1Quarto.jpg',
+    'apartamentos/galeria/2025/06/07/aptoA1Varanda.jpg', 'apartamentos/galeria/2025/06/07/aptoA1cozinha.jpg',
+    'apartamentos/galeria/2025/06/08/aptoA2Sala.jpg', 'apartamentos/galeria/2025/06/08/aptoA2Garagem.jpg',
+]
+NOMES_PREDIO = ['Residencial', 'Edifício', 'Condomínio', 'Solar', 'Torre']
+SOBRENOMES_PREDIO = ['das Flores', 'Atlântico', 'Primavera', 'Bela Vista', 'Jardim Europa', 'Horizonte', 'Aurora']
+
+
+class Command(BaseCommand):
+    help = ('Gera uma massa de dados sintética (usuários, prédios, apartamentos, fotos, reservas e avaliações) '
+            'com bulk_create em lotes e semente fixa, para testes de carga e benchmarks.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--proprietarios', type=int, default=100)
+        parser.add_argument('--hospedes', type=int, default=1000)
+        parser.add_argument('--predios', type=int, default=500)
+        parser.add_argument('--apartamentos', type=int, default=5000)
+        parser.add_argument('--reservas', type=int, default=50000, help='Total aproximado de reservas.')
+        parser.add_argument('--fotos-por-apartamento', type=int, default=3)
+        parser.add_argument('--taxa-avaliacao', type=float, default=0.4,
+                            help='Fração das estadias confirmadas já concluídas que recebem avaliação.')
+        parser.add_argument('--semente', type=int, default=42, help='Semente do gerador aleatório.')
+        parser.add_argument('--lote', type=int, default=2000, help='Apartamentos processados por lote.')
+        parser.add_argument('--prefixo', default='sintetico', help='Prefixo dos usernames gerados.')
+
+    def handle(self, *args, **options):
+        if min(options['proprietarios'], options['hospedes'], options['predios'], options['apartamentos']) < 1:
+            raise CommandError('Proprietários, hóspedes, prédios e apartamentos devem ser pelo menos 1.')
+        self.rng = random.Random(options['semente'])
+        self.hoje = timezone.localdate()
+        self.predios_por_id = {}
+        inicio = time.perf_counter()
+
+        comodidades = self.criar_comodidades()
+        proprietarios = self.criar_usuarios(options['proprietarios'], f"{options['prefixo']}_prop",
+                                            Perfil.CargoUsuario.PROPRIETARIO, 'Proprietários')
+        hospedes = self.criar_usuarios(options['hospedes'], f"{options['prefixo']}_hosp",
+                                       Perfil.CargoUsuario.CLIENTE, 'Clientes')
+        predios = self.criar_predios(options['predios'], proprietarios)
+        # bulk_create não dispara sinais: o catálogo de cidades em cache precisa ser descartado aqui.
+        invalidar_catalogo_cidades()
+
+        total_aptos = options['apartamentos']
+        reservas_por_apto = options['reservas'] / total_aptos
+        contagem = {'apartamentos': 0, 'reservas': 0, 'avaliacoes': 0}
+        for inicio_lote in range(0, total_aptos, options['lote']):
+            tamanho = min(options['lote'], total_aptos - inicio_lote)
+            with transaction.atomic():
+                self.criar_lote_apartamentos(tamanho, predios, hospedes, comodidades, reservas_por_apto,
+                                             options, contagem)
+            self.stdout.write(f"  {contagem['apartamentos']}/{total_aptos} apartamentos, "
+                              f"{contagem['reservas']} reservas, {contagem['avaliacoes']} avaliações")
+
+        duracao = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f"Dados sintéticos gerados em {duracao:.1f}s: {len(proprietarios)} proprietários, {len(hospedes)} hóspedes, "
+            f"{len(predios)} prédios, {contagem['apartamentos']} apartamentos, {contagem['reservas']} reservas, "
+            f"{contagem['avaliacoes']} avaliações."))
+
+    def criar_comodidades(self):
+        for nome in COMODIDADES_PADRAO:
+            Comodidade.objects.get_or_create(nome=nome)
+        return list(Comodidade.objects.values_list('pk', flat=True))
+
+    def criar_usuarios(self, quantidade, prefixo, cargo, nome_grupo):
+        """
+        Cria usuários e perfis em lote. bulk_create não dispara post_save, então o
+        sinal criar_ou_atualizar_perfil_usuario não roda: os perfis são criados aqui.
+        """
+        senha = make_password('senha123')  # Um único hash para todos (o hash é a parte cara)
+        existentes = User.objects.filter(username__startswith=prefixo).count()
+        ids = []
+        with transaction.atomic():
+            for inicio in range(existentes, existentes + quantidade, 5000):
+                fim = min(inicio + 5000, existentes + quantidade)
+                usuarios = User.objects.bulk_create([
+                    User(username=f'{prefixo}{n:07d}', email=f'{prefixo}{n:07d}@example.com', password=senha,
+                         first_name=prefixo.split('_')[-1].capitalize(), last_name=f'{n}')
+                    for n in range(inicio, fim)
+                ])
+                perfis = [Perfil(usuario=u, cargo=cargo) for u in usuarios]
+                for perfil, usuario in zip(perfis, usuarios):
+                    perfil.atualizar_chaves_login(usuario)
+                Perfil.objects.bulk_create(perfis)
+                grupo = Group.objects.filter(name=nome_grupo).first()
+                if grupo:
+                    User.groups.through.objects.bulk_create(
+                        [User.groups.through(user_id=u.pk, group_id=grupo.pk) for u in usuarios])
+                ids.extend(u.pk for u in usuarios)
+        return ids
+
+    def criar_predios(self, quantidade, proprietarios):
+        predios = []
+        with transaction.atomic():
+            for inicio in range(0, quantidade, 5000):
+                lote = []
+                for n in range(inicio, min(inicio + 5000, quantidade)):
+                    cidade, uf, prefixo_cep = self.rng.choice(CIDADES)
+                    predio = Predio(
+                        proprietario_id=self.rng.choice(proprietarios),
+                        nome=f'{self.rng.choice(NOMES_PREDIO)} {self.rng.choice(SOBRENOMES_PREDIO)} {n}',
+                        endereco_completo=f'Rua {self.rng.choice(SOBRENOMES_PREDIO)}, {self.rng.randint(1, 3000)}',
+                        cidade=cidade, cidade_normalizada=normalizar_texto(cidade), estado=uf,
+                        cep=f'{prefixo_cep}{self.rng.randint(0, 999):03d}-{self.rng.randint(0, 999):03d}',
+                    )
+                    # bulk_create não passa pelo save(): posiciona o prédio a até ~10 km do centro da cidade
+                    centroide = centroide_do_cep(predio.cep)
+                    if centroide:
+                        predio.latitude = (centroide[0] + Decimal(self.rng.uniform(-0.09, 0.09))).quantize(
+                            Decimal('0.000001'))
+                        predio.longitude = (centroide[1] + Decimal(self.rng.uniform(-0.09, 0.09))).quantize(
+                            Decimal('0.000001'))
+                        predio.celula_geo = celula_geo(predio.latitude, predio.longitude)
+                    lote.append(predio)
+                for predio in Predio.objects.bulk_create(lote):
+                    predios.append((predio.pk, predio.proprietario_id))
+                    self.predios_por_id[predio.pk] = predio
+        return predios
+
+    def sortear_estadia(self):
+        """Duração da estadia em noites: maioria curta, algumas mensais."""
+        if self.rng.random() < 0.05:
+            return self.rng.randint(30, 90)
+        return self.rng.choice([1, 2, 2, 3, 3, 4, 5, 7, 7, 10, 14])
+
+    def sortear_status(self, data_checkout):
+        if data_checkout < self.hoje:
+            pesos = [(Reserva.StatusReserva.CONFIRMADA, 0.8), (Reserva.StatusReserva.CANCELADA, 0.2)]
+        else:
+            pesos = [(Reserva.StatusReserva.PENDENTE, 0.4), (Reserva.StatusReserva.CONFIRMADA, 0.45),
+                     (Reserva.StatusReserva.CANCELADA, 0.15)]
+        return self.rng.choices([s for s, _ in pesos], weights=[p for _, p in pesos])[0]
+
+    def gerar_reservas(self, apartamento, quantidade, hospedes):
+        """Gera reservas sem sobreposição, caminhando no tempo a partir de ~2 anos atrás."""
+        data = self.hoje - timedelta(days=self.rng.randint(365, 730))
+        reservas = []
+        for _ in range(quantidade):
+            data += timedelta(days=self.rng.choice([0, 0, 1, 2, 3, 5, 8, 13, 21]))
+            checkout = data + timedelta(days=self.sortear_estadia())
+            reservas.append(Reserva(apartamento=apartamento, hospede_id=self.rng.choice(hospedes),
+                                    data_checkin=data, data_checkout=checkout,
+                                    status=self.sortear_status(checkout)))
+            data = checkout + timedelta(days=1)  # O dia de check-out também fica ocupado
+        return reservas
+
+    def inserir_ocupacoes(self, reservas):
+        """
+        Preenche o índice de disponibilidade (que normalmente é mantido por sinal) com
+        INSERTs diretos: é a tabela mais volumosa e instanciar um modelo por dia ocupado
+        dominaria o tempo total da carga.
+        """
+        meta = OcupacaoDiaria._meta
+        qn = connection.ops.quote_name
+        colunas = ', '.join(qn(meta.get_field(nome).column) for nome in ('apartamento', 'reserva', 'data'))
+        sql = f'INSERT INTO {qn(meta.db_table)} ({colunas}) VALUES (%s, %s, %s)'
+        adaptar_data = connection.ops.adapt_datefield_value
+        linhas = []
+        with connection.cursor() as cursor:
+            for reserva in reservas:
+                if reserva.status not in Reserva.STATUS_BLOQUEANTES:
+                    continue
+                apartamento_id, reserva_id, inicio = reserva.apartamento_id, reserva.pk, reserva.data_checkin
+                linhas.extend(
+                    (apartamento_id, reserva_id, adaptar_data(inicio + timedelta(days=i)))
+                    for i in range((reserva.data_checkout - inicio).days + 1)
+                )
+                if len(linhas) >= 20000:
+                    cursor.executemany(sql, linhas)
+                    linhas = []
+            if linhas:
+                cursor.executemany(sql, linhas)
+
+    def criar_lote_apartamentos(self, tamanho, predios, hospedes, comodidades, reservas_por_apto, options,
+                                contagem):
+        apartamentos, reservas, avaliacoes = [], [], []
+        for _ in range(tamanho):
+            predio_id, proprietario_id = self.rng.choice(predios)
+            quartos = self.rng.choices([1, 2, 3, 4], weights=[35, 40, 20, 5])[0]
+            diaria = Decimal(self.rng.randint(80, 250) + 60 * quartos)
+            apartamento = Apartamento(
+                predio_id=predio_id, proprietario_id=proprietario_id,
+                titulo=f'Unidade {self.rng.randint(1, 30)}{self.rng.choice("ABCD")}{contagem["apartamentos"] + len(apartamentos)}',
+                descricao='Apartamento gerado automaticamente para testes de carga.',
+                numero_quartos=quartos, numero_banheiros=max(1, quartos - self.rng.randint(0, 1)),
+                area_m2=Decimal(25 + 22 * quartos + self.rng.randint(0, 30)), preco_diaria=diaria,
+                preco_mensal=diaria * 22 if self.rng.random() < 0.5 else None,
+                disponivel=self.rng.random() < 0.95,
+            )
+            # bulk_create não chama save(): o documento da busca em texto completo é montado aqui
+            apartamento.documento_busca = apartamento.gerar_documento_busca(self.predios_por_id[predio_id])
+            apartamentos.append(apartamento)
+
+            # Reservas e avaliações são geradas antes do INSERT do apartamento, para que os
+            # agregados de avaliação (normalmente mantidos por sinal) já sejam gravados junto.
+            quantidade = int(reservas_por_apto) + (self.rng.random() < reservas_por_apto % 1)
+            for reserva in self.gerar_reservas(apartamento, quantidade, hospedes):
+                reservas.append(reserva)
+                if (reserva.status == Reserva.StatusReserva.CONFIRMADA and reserva.data_checkout < self.hoje
+                        and self.rng.random() < options['taxa_avaliacao']):
+                    nota = self.rng.choices([1, 2, 3, 4, 5], weights=[3, 5, 12, 35, 45])[0]
+                    avaliacoes.append(Avaliacao(reserva=reserva, nota=nota,
+                                                comentario='Estadia gerada automaticamente.'))
+                    apartamento.avaliacoes_total += 1
+                    apartamento.avaliacoes_soma += nota
+                    campo = f'avaliacoes_nota_{nota}'
+                    setattr(apartamento, campo, getattr(apartamento, campo) + 1)
+            if apartamento.avaliacoes_total:
+                apartamento.nota_media = apartamento.avaliacoes_soma / apartamento.avaliacoes_total
+        Apartamento.objects.bulk_create(apartamentos)
+
+        relacoes, fotos = [], []
+        for apartamento in apartamentos:
+            for comodidade_id in self.rng.sample(comodidades, self.rng.randint(0, min(5, len(comodidades)))):
+                preco = Decimal(self.rng.choice([0, 0, 0, 10, 15, 25]))
+                relacoes.append(ApartamentoComodidade(apartamento_id=apartamento.pk, comodidade_id=comodidade_id,
+                                                      preco_adicional=preco))
+            for n in range(options['fotos_por_apartamento']):
+                fotos.append(FotoApartamento(apartamento_id=apartamento.pk, imagem=self.rng.choice(FOTOS_EXEMPLO),
+                                             principal=(n == 0)))
+        ApartamentoComodidade.objects.bulk_create(relacoes, batch_size=5000)
+        FotoApartamento.objects.bulk_create(fotos, batch_size=5000)
+        # As chaves estrangeiras para objetos recém-inseridos são resolvidas pelo próprio bulk_create
+        Reserva.objects.bulk_create(reservas, batch_size=5000)
+        self.inserir_ocupacoes(reservas)
+        Avaliacao.objects.bulk_create(avaliacoes, batch_size=5000)
+
+        contagem['apartamentos'] += len(apartamentos)
+        contagem['reservas'] += len(reservas)
+        contagem['avaliacoes'] += len(avaliacoes)
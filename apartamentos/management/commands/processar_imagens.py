@@ -0,0 +1,121 @@
+import time
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from apartamentos.cache import invalidar_apartamento, invalidar_busca
+from apartamentos.imagens import VARIANTES_POR_CAMPO, apagar_variantes, gerar_variantes
+from apartamentos.models import ImagemPendente, Predio
+from apartamentos.services import enfileirar_variantes_imagem
+
+
+class Command(BaseCommand):
+    help = ('Gera as variantes redimensionadas (WebP/JPEG) das imagens enviadas, a partir da fila '
+            'ImagemPendente, com novas tentativas e espera exponencial em caso de falha.')
+
+    # Mesmo esquema de reserva de lote do enviar_emails: um worker que cair devolve o lote à fila.
+    RESERVA_LOTE = timedelta(minutes=10)
+    ESPERA_BASE = timedelta(minutes=1)
+    ESPERA_MAXIMA = timedelta(hours=1)
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=20, help='Quantidade máxima de imagens por lote.')
+        parser.add_argument('--max-tentativas', type=int, default=5,
+                            help='Tentativas antes de marcar a imagem como falha.')
+        parser.add_argument('--continuo', action='store_true',
+                            help='Continua rodando e verificando a fila periodicamente.')
+        parser.add_argument('--intervalo', type=float, default=5.0,
+                            help='Segundos de espera entre verificações no modo contínuo.')
+        parser.add_argument('--enfileirar-existentes', action='store_true',
+                            help='Antes de processar, coloca na fila as imagens já cadastradas sem variantes.')
+
+    def handle(self, *args, **options):
+        if options['enfileirar_existentes']:
+            total = self.enfileirar_existentes()
+            self.stdout.write(f'{total} imagem(ns) existente(s) colocada(s) na fila.')
+        while True:
+            processadas, falhas = self.processar_lote(options['lote'], options['max_tentativas'])
+            if processadas or falhas:
+                self.stdout.write(f'Lote processado: {processadas} imagem(ns) processada(s), {falhas} falha(s).')
+            if not options['continuo']:
+                break
+            if not (processadas or falhas):
+                time.sleep(options['intervalo'])
+
+    def enfileirar_existentes(self):
+        total = 0
+        for modelo, campo in VARIANTES_POR_CAMPO:
+            pendentes = apps.get_model(modelo).objects.filter(variantes_prontas=False).exclude(
+                **{f'{campo}__in': ['', None]})
+            for instancia in pendentes.iterator():
+                enfileirar_variantes_imagem(instancia, campo)
+                total += 1
+        return total
+
+    def reservar_lote(self, tamanho):
+        agora = timezone.now()
+        with transaction.atomic():
+            lote = list(
+                ImagemPendente.objects.select_for_update(skip_locked=True)
+                .filter(status=ImagemPendente.StatusProcessamento.PENDENTE, proxima_tentativa__lte=agora)
+                .order_by('proxima_tentativa', 'pk')[:tamanho]
+            )
+            if lote:
+                ImagemPendente.objects.filter(pk__in=[item.pk for item in lote]).update(
+                    proxima_tentativa=agora + self.RESERVA_LOTE)
+        return lote
+
+    def calcular_espera(self, tentativas):
+        return min(self.ESPERA_BASE * (2 ** (tentativas - 1)), self.ESPERA_MAXIMA)
+
+    def registrar_falha(self, item, erro, max_tentativas):
+        item.tentativas += 1
+        item.ultimo_erro = str(erro)
+        if item.tentativas >= max_tentativas:
+            item.status = ImagemPendente.StatusProcessamento.FALHOU
+        else:
+            item.proxima_tentativa = timezone.now() + self.calcular_espera(item.tentativas)
+        item.save(update_fields=['tentativas', 'ultimo_erro', 'status', 'proxima_tentativa'])
+
+    def processar(self, item):
+        modelo = apps.get_model(item.modelo)
+        instancia = modelo.objects.filter(pk=item.objeto_id).first()
+        arquivo = getattr(instancia, item.campo, None)
+        # Objeto removido ou arquivo trocado depois do pedido: o pedido mais novo cuida da imagem atual
+        if not arquivo or arquivo.name != item.nome_arquivo:
+            return
+        anteriores = set(instancia.variantes_arquivos.values())
+        gravados = gerar_variantes(arquivo, VARIANTES_POR_CAMPO[(item.modelo, item.campo)])
+        # update() não dispara os sinais de upload, então a imagem não volta para a fila
+        atualizados = modelo.objects.filter(pk=item.objeto_id, **{item.campo: item.nome_arquivo}).update(
+            variantes_prontas=True, variantes_arquivos=gravados)
+        # Apaga o que nenhum registro referencia: as variantes da imagem anterior ou, se o arquivo
+        # foi trocado/removido durante a geração, as que acabaram de ser gravadas
+        novos = set(gravados.values())
+        apagar_variantes(arquivo.storage, anteriores - novos if atualizados else novos - anteriores)
+        if atualizados and hasattr(instancia, 'apartamento_id'):
+            # Sem sinais no update(): a galeria e as páginas da busca (a foto de capa dos cards) em
+            # cache precisam ser invalidadas aqui
+            invalidar_apartamento(instancia.apartamento_id)
+            invalidar_busca(Predio.objects.filter(apartamentos=instancia.apartamento_id)
+                            .values_list('cidade_normalizada', flat=True).first())
+
+    def processar_lote(self, tamanho, max_tentativas):
+        lote = self.reservar_lote(tamanho)
+        processadas = falhas = 0
+        for item in lote:
+            try:
+                self.processar(item)
+            except Exception as e:
+                self.registrar_falha(item, e, max_tentativas)
+                self.stderr.write(self.style.WARNING(f'Falha ao processar a imagem #{item.pk}: {e}'))
+                falhas += 1
+                continue
+            item.status = ImagemPendente.StatusProcessamento.PROCESSADA
+            item.tentativas += 1
+            item.data_processamento = timezone.now()
+            item.save(update_fields=['status', 'tentativas', 'data_processamento'])
+            processadas += 1
+        return processadas, falhas
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from apartamentos.services import recalcular_agregados_avaliacao
+
+
+class Command(BaseCommand):
+    help = 'Recalcula em lote os agregados de avaliação (total, média e histograma) de todos os apartamentos.'
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write("Recalculando agregados de avaliação...")
+        with transaction.atomic():
+            total = recalcular_agregados_avaliacao()
+        self.stdout.write(self.style.SUCCESS(f'Agregados recalculados para {total} apartamentos avaliados.'))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from apartamentos.models import Reserva, OcupacaoDiaria
+from apartamentos.services import gerar_ocupacoes
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói o índice de disponibilidade (OcupacaoDiaria) a partir das reservas bloqueantes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=5000, help='Quantidade de reservas processadas por lote.')
+
+    def handle(self, *args, **options):
+        lote = options['lote']
+        self.stdout.write("Reconstruindo o índice de disponibilidade...")
+
+        with transaction.atomic():
+            OcupacaoDiaria.objects.all().delete()
+            reservas = (Reserva.objects.filter(status__in=Reserva.STATUS_BLOQUEANTES)
+                        .only('id', 'apartamento_id', 'data_checkin', 'data_checkout').order_by('pk'))
+            ocupacoes = []
+            total = 0
+            for reserva in reservas.iterator(chunk_size=lote):
+                ocupacoes.extend(gerar_ocupacoes(reserva))
+                total += 1
+                if len(ocupacoes) >= lote:
+                    OcupacaoDiaria.objects.bulk_create(ocupacoes, batch_size=lote)
+                    ocupacoes = []
+            OcupacaoDiaria.objects.bulk_create(ocupacoes, batch_size=lote)
+
+        self.stdout.write(self.style.SUCCESS(f'Índice reconstruído para {total} reservas bloqueantes.'))
@@ -0,0 +1,89 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:13
+
+import django.db.models.deletion
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+LOTE = 500
+
+
+def popular_ocupacoes(apps, schema_editor):
+    Reserva = apps.get_model("apartamentos", "Reserva")
+    OcupacaoDiaria = apps.get_model("apartamentos", "OcupacaoDiaria")
+    ocupacoes = []
+    reservas = Reserva.objects.filter(status__in=["CONFIRMADA", "PENDENTE"]).only(
+        "pk", "apartamento_id", "data_checkin", "data_checkout")
+    for reserva in reservas.iterator(chunk_size=LOTE):
+        dias = (reserva.data_checkout - reserva.data_checkin).days
+        ocupacoes.extend(
+            OcupacaoDiaria(
+                apartamento_id=reserva.apartamento_id,
+                reserva_id=reserva.pk,
+                data=reserva.data_checkin + timedelta(days=i),
+            )
+            for i in range(dias + 1)
+        )
+        # Grava a cada lote em vez de montar todas as ocupações na memória
+        if len(ocupacoes) >= LOTE:
+            OcupacaoDiaria.objects.bulk_create(ocupacoes)
+            ocupacoes = []
+    OcupacaoDiaria.objects.bulk_create(ocupacoes)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apartamentos", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OcupacaoDiaria",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("data", models.DateField(verbose_name="data ocupada")),
+                (
+                    "apartamento",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ocupacoes",
+                        to="apartamentos.apartamento",
+                    ),
+                ),
+                (
+                    "reserva",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ocupacoes",
+                        to="apartamentos.reserva",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Ocupação Diária",
+                "verbose_name_plural": "Ocupações Diárias",
+                "indexes": [
+                    models.Index(
+                        fields=["data", "apartamento"], name="ocupacao_data_apto_idx"
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("reserva", "data"),
+                        name="ocupacao_unica_por_reserva_e_dia",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(popular_ocupacoes, migrations.RunPython.noop),
+    ]
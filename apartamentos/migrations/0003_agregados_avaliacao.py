@@ -0,0 +1,96 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:14
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def popular_agregados(apps, schema_editor):
+    Apartamento = apps.get_model("apartamentos", "Apartamento")
+    Avaliacao = apps.get_model("apartamentos", "Avaliacao")
+    agregados = Avaliacao.objects.values("reserva__apartamento_id").annotate(
+        total=Count("pk"),
+        soma=Sum("nota"),
+        **{f"nota_{n}": Count("pk", filter=Q(nota=n)) for n in range(1, 6)},
+    )
+    for linha in agregados:
+        Apartamento.objects.filter(pk=linha["reserva__apartamento_id"]).update(
+            avaliacoes_total=linha["total"],
+            avaliacoes_soma=linha["soma"],
+            nota_media=linha["soma"] / linha["total"],
+            **{f"avaliacoes_nota_{n}": linha[f"nota_{n}"] for n in range(1, 6)},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apartamentos", "0002_ocupacaodiaria"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="apartamento",
+            name="avaliacoes_nota_1",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="avaliações com nota 1"
+            ),
+        ),
+        migrations.AddField(
+            model_name="apartamento",
+            name="avaliacoes_nota_2",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="avaliações com nota 2"
+            ),
+        ),
+        migrations.AddField(
+            model_name="apartamento",
+            name="avaliacoes_nota_3",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="avaliações com nota 3"
+            ),
+        ),
+        migrations.AddField(
+            model_name="apartamento",
+            name="avaliacoes_nota_4",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="avaliações com nota 4"
+            ),
+        ),
+        migrations.AddField(
+            model_name="apartamento",
+            name="avaliacoes_nota_5",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="avaliações com nota 5"
+            ),
+        ),
+        migrations.AddField(
+            model_name="apartamento",
+            name="avaliacoes_soma",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="soma das notas"
+            ),
+        ),
+        migrations.AddField(
+            model_name="apartamento",
+            name="avaliacoes_total",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="total de avaliações"
+            ),
+        ),
+        migrations.AddField(
+            model_name="apartamento",
+            name="nota_media",
+            field=models.FloatField(
+                default=0, editable=False, verbose_name="nota média"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="apartamento",
+            index=models.Index(
+                fields=["-nota_media", "-avaliacoes_total"], name="apartamento_nota_idx"
+            ),
+        ),
+        migrations.RunPython(popular_agregados, migrations.RunPython.noop),
+    ]
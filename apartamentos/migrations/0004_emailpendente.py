@@ -0,0 +1,90 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:15
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apartamentos", "0003_agregados_avaliacao"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EmailPendente",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "destinatario",
+                    models.EmailField(max_length=254, verbose_name="destinatário"),
+                ),
+                ("assunto", models.CharField(max_length=255, verbose_name="assunto")),
+                ("corpo", models.TextField(verbose_name="corpo")),
+                (
+                    "remetente",
+                    models.CharField(max_length=255, verbose_name="remetente"),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("PENDENTE", "Pendente"),
+                            ("ENVIADO", "Enviado"),
+                            ("FALHOU", "Falhou"),
+                        ],
+                        default="PENDENTE",
+                        max_length=20,
+                        verbose_name="status",
+                    ),
+                ),
+                (
+                    "tentativas",
+                    models.PositiveSmallIntegerField(
+                        default=0, verbose_name="tentativas"
+                    ),
+                ),
+                (
+                    "proxima_tentativa",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        verbose_name="próxima tentativa",
+                    ),
+                ),
+                (
+                    "ultimo_erro",
+                    models.TextField(blank=True, verbose_name="último erro"),
+                ),
+                (
+                    "data_criacao",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="data de criação"
+                    ),
+                ),
+                (
+                    "data_envio",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="data de envio"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "E-mail Pendente",
+                "verbose_name_plural": "E-mails Pendentes",
+                "ordering": ["data_criacao"],
+                "indexes": [
+                    models.Index(
+                        fields=["status", "proxima_tentativa"], name="email_fila_idx"
+                    )
+                ],
+            },
+        ),
+    ]
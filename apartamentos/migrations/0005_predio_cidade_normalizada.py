@@ -0,0 +1,50 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:32
+
+import unicodedata
+
+from django.db import migrations, models
+
+LOTE = 500
+
+
+def normalizar_texto(texto):
+    # Cópia congelada de apartamentos.utils.normalizar_texto como estava nesta migração
+    if not texto:
+        return ""
+    decomposto = unicodedata.normalize("NFKD", texto)
+    sem_acentos = "".join(c for c in decomposto if not unicodedata.combining(c))
+    return " ".join(sem_acentos.casefold().split())
+
+
+def popular_cidade_normalizada(apps, schema_editor):
+    Predio = apps.get_model("apartamentos", "Predio")
+    lote = []
+    for predio in Predio.objects.only("pk", "cidade").iterator(chunk_size=LOTE):
+        predio.cidade_normalizada = normalizar_texto(predio.cidade)
+        lote.append(predio)
+        if len(lote) == LOTE:
+            Predio.objects.bulk_update(lote, ["cidade_normalizada"])
+            lote = []
+    Predio.objects.bulk_update(lote, ["cidade_normalizada"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apartamentos", "0004_emailpendente"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="predio",
+            name="cidade_normalizada",
+            field=models.CharField(
+                db_index=True,
+                default="",
+                editable=False,
+                max_length=100,
+                verbose_name="cidade normalizada",
+            ),
+        ),
+        migrations.RunPython(popular_cidade_normalizada, migrations.RunPython.noop),
+    ]
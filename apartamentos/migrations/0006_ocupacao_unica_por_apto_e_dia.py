@@ -0,0 +1,66 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:35
+
+from django.db import migrations, models
+from django.db.models import Case, Count, IntegerField, Value, When
+
+
+def resolver_reservas_duplas(apps, schema_editor):
+    # Reservas duplas gravadas antes da constraint: fica a reserva confirmada (ou, entre iguais, a mais
+    # antiga) e as que se sobrepõem a ela são canceladas por inteiro. Apagar só os dias repetidos deixaria
+    # a reserva perdedora bloqueante com parte do índice, e o conflito só apareceria ao aprová-la.
+    OcupacaoDiaria = apps.get_model("apartamentos", "OcupacaoDiaria")
+    Reserva = apps.get_model("apartamentos", "Reserva")
+    dias_em_conflito = (
+        OcupacaoDiaria.objects.values("apartamento_id", "data")
+        .annotate(total=Count("pk"))
+        .filter(total__gt=1)
+    )
+    envolvidas = set()
+    for linha in dias_em_conflito:
+        envolvidas.update(
+            OcupacaoDiaria.objects.filter(apartamento_id=linha["apartamento_id"], data=linha["data"])
+            .values_list("reserva_id", flat=True)
+        )
+    if not envolvidas:
+        return
+
+    ocupados = set()
+    canceladas = []
+    reservas = (
+        Reserva.objects.filter(pk__in=envolvidas)
+        .annotate(prioridade=Case(When(status="CONFIRMADA", then=Value(0)), default=Value(1),
+                                  output_field=IntegerField()))
+        .order_by("prioridade", "data_reserva", "pk")
+    )
+    for reserva in reservas:
+        dias = {(reserva.apartamento_id, data) for data in reserva.ocupacoes.values_list("data", flat=True)}
+        if dias & ocupados:
+            canceladas.append(reserva)
+        else:
+            ocupados |= dias
+
+    ids = [reserva.pk for reserva in canceladas]
+    OcupacaoDiaria.objects.filter(reserva_id__in=ids).delete()
+    Reserva.objects.filter(pk__in=ids).update(status="CANCELADA")
+    print(f"\n  {len(canceladas)} reserva(s) sobreposta(s) a outra reserva do mesmo apartamento foram "
+          "canceladas (os hóspedes não foram avisados):")
+    for reserva in canceladas:
+        print(f"    reserva #{reserva.pk} (apartamento #{reserva.apartamento_id}, "
+              f"{reserva.data_checkin:%d/%m/%Y} a {reserva.data_checkout:%d/%m/%Y}, era {reserva.status})")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apartamentos", "0005_predio_cidade_normalizada"),
+    ]
+
+    operations = [
+        migrations.RunPython(resolver_reservas_duplas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="ocupacaodiaria",
+            constraint=models.UniqueConstraint(
+                fields=("apartamento", "data"), name="ocupacao_unica_por_apto_e_dia"
+            ),
+        ),
+    ]
@@ -0,0 +1,117 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:38
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apartamentos", "0006_ocupacao_unica_por_apto_e_dia"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fotoapartamento",
+            name="variantes_prontas",
+            field=models.BooleanField(
+                default=False,
+                editable=False,
+                verbose_name="variantes da imagem geradas",
+            ),
+        ),
+        migrations.AddField(
+            model_name="perfil",
+            name="variantes_prontas",
+            field=models.BooleanField(
+                default=False,
+                editable=False,
+                verbose_name="variantes da imagem geradas",
+            ),
+        ),
+        migrations.AddField(
+            model_name="predio",
+            name="variantes_prontas",
+            field=models.BooleanField(
+                default=False,
+                editable=False,
+                verbose_name="variantes da imagem geradas",
+            ),
+        ),
+        migrations.CreateModel(
+            name="ImagemPendente",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("modelo", models.CharField(max_length=100, verbose_name="modelo")),
+                (
+                    "objeto_id",
+                    models.PositiveBigIntegerField(verbose_name="ID do objeto"),
+                ),
+                ("campo", models.CharField(max_length=50, verbose_name="campo")),
+                (
+                    "nome_arquivo",
+                    models.CharField(max_length=255, verbose_name="arquivo"),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("PENDENTE", "Pendente"),
+                            ("PROCESSADA", "Processada"),
+                            ("FALHOU", "Falhou"),
+                        ],
+                        default="PENDENTE",
+                        max_length=20,
+                        verbose_name="status",
+                    ),
+                ),
+                (
+                    "tentativas",
+                    models.PositiveSmallIntegerField(
+                        default=0, verbose_name="tentativas"
+                    ),
+                ),
+                (
+                    "proxima_tentativa",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        verbose_name="próxima tentativa",
+                    ),
+                ),
+                (
+                    "ultimo_erro",
+                    models.TextField(blank=True, verbose_name="último erro"),
+                ),
+                (
+                    "data_criacao",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="data de criação"
+                    ),
+                ),
+                (
+                    "data_processamento",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="data de processamento"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Imagem Pendente",
+                "verbose_name_plural": "Imagens Pendentes",
+                "ordering": ["data_criacao"],
+                "indexes": [
+                    models.Index(
+                        fields=["status", "proxima_tentativa"], name="imagem_fila_idx"
+                    )
+                ],
+            },
+        ),
+    ]
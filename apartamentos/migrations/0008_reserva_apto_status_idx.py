@@ -0,0 +1,22 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apartamentos", "0007_variantes_de_imagem"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="reserva",
+            index=models.Index(
+                fields=["apartamento", "status", "data_checkin"],
+                name="reserva_apto_status_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,29 @@
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copiar_data_reserva(apps, schema_editor):
+    Reserva = apps.get_model("apartamentos", "Reserva")
+    Reserva.objects.update(data_atualizacao=F("data_reserva"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apartamentos", "0008_reserva_apto_status_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="reserva",
+            name="data_atualizacao",
+            field=models.DateTimeField(
+                auto_now=True,
+                default=django.utils.timezone.now,
+                verbose_name="última atualização",
+            ),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copiar_data_reserva, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,128 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:49
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+# Cópia congelada de apartamentos.utils.termos_busca (normalização, palavras vazias e radicais) como
+# estava nesta migração: mudar o stemmer depois não pode mudar o que um `migrate` do zero produz.
+PALAVRAS_VAZIAS = frozenset(
+    "a ao aos as com da das de do dos e em na nas no nos o os ou para pela pelas pelo pelos por um uma uns umas"
+    .split())
+SUFIXOS_PLURAL = (("oes", "ao"), ("aes", "ao"), ("ais", "al"), ("eis", "el"), ("ois", "ol"), ("ns", "m"),
+                  ("les", "l"), ("res", "r"), ("zes", "z"))
+SUFIXOS_DIMINUTIVO = ("zinho", "zinha", "inho", "inha")
+
+
+def normalizar_texto(texto):
+    if not texto:
+        return ""
+    decomposto = unicodedata.normalize("NFKD", texto)
+    sem_acentos = "".join(c for c in decomposto if not unicodedata.combining(c))
+    return " ".join(sem_acentos.casefold().split())
+
+
+def radical(palavra):
+    if len(palavra) < 4 or palavra.isdigit():
+        return palavra
+    for sufixo, troca in SUFIXOS_PLURAL:
+        if palavra.endswith(sufixo) and len(palavra) > len(sufixo):
+            palavra = palavra[:-len(sufixo)] + troca
+            break
+    else:
+        if palavra.endswith("s") and not palavra.endswith(("ss", "us")):
+            palavra = palavra[:-1]
+    for sufixo in SUFIXOS_DIMINUTIVO:
+        if palavra.endswith(sufixo) and len(palavra) - len(sufixo) >= 3:
+            palavra = palavra[:-len(sufixo)]
+            break
+    if len(palavra) > 3 and palavra[-1] in "aeo":
+        palavra = palavra[:-1]
+    return palavra
+
+
+def termos_busca(texto):
+    return [radical(palavra) for palavra in re.findall(r"[a-z0-9]+", normalizar_texto(texto))
+            if palavra not in PALAVRAS_VAZIAS]
+
+# PostgreSQL: coluna tsvector gerada a partir do documento (que já vem sem acentos e com radicais,
+# por isso a configuração 'simple') e índice GIN.
+SQL_POSTGRESQL = [
+    "ALTER TABLE apartamentos_apartamento ADD COLUMN vetor_busca tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('simple', documento_busca)) STORED",
+    "CREATE INDEX apartamento_busca_gin ON apartamentos_apartamento USING GIN (vetor_busca)",
+]
+SQL_POSTGRESQL_REVERSO = [
+    "DROP INDEX IF EXISTS apartamento_busca_gin",
+    "ALTER TABLE apartamentos_apartamento DROP COLUMN IF EXISTS vetor_busca",
+]
+
+# SQLite: tabela FTS5 de conteúdo externo, mantida por triggers a cada INSERT/UPDATE/DELETE.
+SQL_SQLITE = [
+    "CREATE VIRTUAL TABLE apartamentos_busca USING fts5(documento_busca, content='apartamentos_apartamento', "
+    "content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER apartamentos_busca_ai AFTER INSERT ON apartamentos_apartamento BEGIN "
+    "INSERT INTO apartamentos_busca(rowid, documento_busca) VALUES (new.id, new.documento_busca); END",
+    "CREATE TRIGGER apartamentos_busca_ad AFTER DELETE ON apartamentos_apartamento BEGIN "
+    "INSERT INTO apartamentos_busca(apartamentos_busca, rowid, documento_busca) "
+    "VALUES ('delete', old.id, old.documento_busca); END",
+    "CREATE TRIGGER apartamentos_busca_au AFTER UPDATE OF documento_busca ON apartamentos_apartamento BEGIN "
+    "INSERT INTO apartamentos_busca(apartamentos_busca, rowid, documento_busca) "
+    "VALUES ('delete', old.id, old.documento_busca); "
+    "INSERT INTO apartamentos_busca(rowid, documento_busca) VALUES (new.id, new.documento_busca); END",
+    "INSERT INTO apartamentos_busca(apartamentos_busca) VALUES ('rebuild')",
+]
+SQL_SQLITE_REVERSO = [
+    "DROP TRIGGER IF EXISTS apartamentos_busca_ai",
+    "DROP TRIGGER IF EXISTS apartamentos_busca_ad",
+    "DROP TRIGGER IF EXISTS apartamentos_busca_au",
+    "DROP TABLE IF EXISTS apartamentos_busca",
+]
+
+
+LOTE = 500
+
+
+def popular_documento_busca(apps, schema_editor):
+    Apartamento = apps.get_model("apartamentos", "Apartamento")
+    lote = []
+    for apartamento in Apartamento.objects.select_related("predio").iterator(chunk_size=LOTE):
+        predio = apartamento.predio
+        textos = (apartamento.titulo, predio.nome, predio.endereco_completo, predio.cidade, predio.estado,
+                  apartamento.descricao)
+        apartamento.documento_busca = " ".join(termo for texto in textos for termo in termos_busca(texto))
+        lote.append(apartamento)
+        if len(lote) == LOTE:
+            Apartamento.objects.bulk_update(lote, ["documento_busca"])
+            lote = []
+    Apartamento.objects.bulk_update(lote, ["documento_busca"])
+
+
+def executar(comandos):
+    def operacao(apps, schema_editor):
+        for sql in comandos.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return operacao
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apartamentos", "0009_reserva_data_atualizacao"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="apartamento",
+            name="documento_busca",
+            field=models.TextField(
+                default="", editable=False, verbose_name="documento de busca"
+            ),
+        ),
+        migrations.RunPython(popular_documento_busca, migrations.RunPython.noop),
+        migrations.RunPython(
+            executar({"postgresql": SQL_POSTGRESQL, "sqlite": SQL_SQLITE}),
+            executar({"postgresql": SQL_POSTGRESQL_REVERSO, "sqlite": SQL_SQLITE_REVERSO}),
+        ),
+    ]
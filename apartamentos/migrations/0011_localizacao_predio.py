@@ -0,0 +1,168 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:56
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+# Cópias congeladas da grade de apartamentos.geo e da tabela de centroides (dados/centroides_cep.csv)
+# como estavam nesta migração: mudar a grade ou a tabela depois não pode mudar o que um `migrate`
+# do zero produz.
+BITS = 26
+# (início, fim do prefixo de 5 dígitos do CEP, latitude, longitude)
+CENTROIDES_CEP = (
+    (1000, 5999, "-23.550500", "-46.633300"),  # São Paulo (capital)
+    (7000, 7399, "-23.453800", "-46.533300"),  # Guarulhos - SP
+    (8000, 8499, "-23.550500", "-46.633300"),  # São Paulo (capital)
+    (11000, 11099, "-23.960800", "-46.333600"),  # Santos - SP
+    (13000, 13139, "-22.909900", "-47.062600"),  # Campinas - SP
+    (1000, 19999, "-22.300000", "-48.600000"),  # São Paulo (estado)
+    (20000, 23799, "-22.906800", "-43.172900"),  # Rio de Janeiro (capital)
+    (24000, 24399, "-22.883200", "-43.103400"),  # Niterói - RJ
+    (20000, 28999, "-22.250000", "-42.660000"),  # Rio de Janeiro (estado)
+    (29000, 29099, "-20.315500", "-40.312800"),  # Vitória - ES
+    (29000, 29999, "-19.600000", "-40.600000"),  # Espírito Santo (estado)
+    (30000, 31999, "-19.916700", "-43.934500"),  # Belo Horizonte - MG
+    (30000, 39999, "-18.500000", "-44.500000"),  # Minas Gerais (estado)
+    (40000, 42599, "-12.977700", "-38.501600"),  # Salvador - BA
+    (40000, 48999, "-12.500000", "-41.700000"),  # Bahia (estado)
+    (49000, 49099, "-10.947200", "-37.073100"),  # Aracaju - SE
+    (49000, 49999, "-10.600000", "-37.400000"),  # Sergipe (estado)
+    (50000, 52999, "-8.047600", "-34.877000"),  # Recife - PE
+    (50000, 56999, "-8.400000", "-37.600000"),  # Pernambuco (estado)
+    (57000, 57099, "-9.649800", "-35.708900"),  # Maceió - AL
+    (57000, 57999, "-9.600000", "-36.600000"),  # Alagoas (estado)
+    (58000, 58099, "-7.119500", "-34.845000"),  # João Pessoa - PB
+    (58000, 58999, "-7.200000", "-36.800000"),  # Paraíba (estado)
+    (59000, 59139, "-5.794500", "-35.211000"),  # Natal - RN
+    (59000, 59999, "-5.800000", "-36.600000"),  # Rio Grande do Norte (estado)
+    (60000, 61599, "-3.731900", "-38.526700"),  # Fortaleza - CE
+    (60000, 63999, "-5.200000", "-39.500000"),  # Ceará (estado)
+    (64000, 64099, "-5.089200", "-42.801900"),  # Teresina - PI
+    (64000, 64999, "-7.700000", "-42.700000"),  # Piauí (estado)
+    (65000, 65099, "-2.530700", "-44.306800"),  # São Luís - MA
+    (65000, 65999, "-5.400000", "-45.300000"),  # Maranhão (estado)
+    (66000, 66999, "-1.455800", "-48.490200"),  # Belém - PA
+    (66000, 68899, "-3.800000", "-52.500000"),  # Pará (estado)
+    (68900, 68911, "0.034900", "-51.069400"),  # Macapá - AP
+    (68900, 68999, "1.400000", "-51.800000"),  # Amapá (estado)
+    (69000, 69099, "-3.119000", "-60.021700"),  # Manaus - AM
+    (69000, 69299, "-4.000000", "-63.000000"),  # Amazonas (estado)
+    (69300, 69339, "2.823500", "-60.675800"),  # Boa Vista - RR
+    (69300, 69399, "2.000000", "-61.400000"),  # Roraima (estado)
+    (69400, 69899, "-4.000000", "-63.000000"),  # Amazonas (estado)
+    (69900, 69923, "-9.975400", "-67.824900"),  # Rio Branco - AC
+    (69900, 69999, "-9.000000", "-70.500000"),  # Acre (estado)
+    (70000, 72799, "-15.793900", "-47.882800"),  # Brasília - DF
+    (73000, 73699, "-15.793900", "-47.882800"),  # Brasília - DF
+    (74000, 74899, "-16.686900", "-49.264800"),  # Goiânia - GO
+    (72800, 72999, "-15.900000", "-49.800000"),  # Goiás (estado)
+    (73700, 76799, "-15.900000", "-49.800000"),  # Goiás (estado)
+    (76800, 76834, "-8.761200", "-63.900400"),  # Porto Velho - RO
+    (76800, 76999, "-10.900000", "-62.800000"),  # Rondônia (estado)
+    (77000, 77249, "-10.184400", "-48.333600"),  # Palmas - TO
+    (77000, 77999, "-9.500000", "-48.400000"),  # Tocantins (estado)
+    (78000, 78109, "-15.601000", "-56.097400"),  # Cuiabá - MT
+    (78000, 78899, "-12.900000", "-55.900000"),  # Mato Grosso (estado)
+    (79000, 79124, "-20.469700", "-54.620100"),  # Campo Grande - MS
+    (79000, 79999, "-20.500000", "-54.800000"),  # Mato Grosso do Sul (estado)
+    (80000, 82999, "-25.428400", "-49.273300"),  # Curitiba - PR
+    (80000, 87999, "-24.600000", "-51.600000"),  # Paraná (estado)
+    (88000, 88099, "-27.595400", "-48.548000"),  # Florianópolis - SC
+    (88000, 89999, "-27.300000", "-50.400000"),  # Santa Catarina (estado)
+    (90000, 91999, "-30.034600", "-51.217700"),  # Porto Alegre - RS
+    (90000, 99999, "-29.800000", "-53.200000"),  # Rio Grande do Sul (estado)
+)
+
+
+def _quantizar(valor, minimo, maximo):
+    posicao = int((float(valor) - minimo) / (maximo - minimo) * (1 << BITS))
+    return min(max(posicao, 0), (1 << BITS) - 1)
+
+
+def _intercalar(x, y, bits):
+    codigo = 0
+    for bit in range(bits):
+        codigo |= ((x >> bit) & 1) << (2 * bit) | ((y >> bit) & 1) << (2 * bit + 1)
+    return codigo
+
+
+def celula_geo(latitude, longitude):
+    return _intercalar(_quantizar(longitude, -180, 180), _quantizar(latitude, -90, 90), BITS)
+
+
+def centroide_do_cep(cep):
+    digitos = "".join(c for c in str(cep or "") if c.isdigit())
+    if len(digitos) < 5:
+        return None
+    prefixo = int(digitos[:5])
+    # A faixa mais estreita (cidade) ganha da mais larga (estado)
+    for inicio, fim, latitude, longitude in sorted(CENTROIDES_CEP, key=lambda linha: linha[1] - linha[0]):
+        if inicio <= prefixo <= fim:
+            return Decimal(latitude), Decimal(longitude)
+    return None
+
+
+def localizar_predios_pelo_cep(apps, schema_editor):
+    Predio = apps.get_model("apartamentos", "Predio")
+    predios = []
+    for predio in Predio.objects.only("pk", "cep"):
+        centroide = centroide_do_cep(predio.cep)
+        if centroide:
+            predio.latitude, predio.longitude = centroide
+            predio.coordenadas_aproximadas = True
+            predio.celula_geo = celula_geo(*centroide)
+            predios.append(predio)
+    Predio.objects.bulk_update(
+        predios, ["latitude", "longitude", "coordenadas_aproximadas", "celula_geo"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apartamentos", "0010_busca_texto_completo"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="predio",
+            name="celula_geo",
+            field=models.BigIntegerField(
+                db_index=True,
+                editable=False,
+                null=True,
+                verbose_name="célula geográfica",
+            ),
+        ),
+        migrations.AddField(
+            model_name="predio",
+            name="coordenadas_aproximadas",
+            field=models.BooleanField(
+                default=False,
+                editable=False,
+                verbose_name="coordenadas aproximadas pelo CEP",
+            ),
+        ),
+        migrations.AddField(
+            model_name="predio",
+            name="latitude",
+            field=models.DecimalField(
+                blank=True,
+                decimal_places=6,
+                max_digits=9,
+                null=True,
+                verbose_name="latitude",
+            ),
+        ),
+        migrations.AddField(
+            model_name="predio",
+            name="longitude",
+            field=models.DecimalField(
+                blank=True,
+                decimal_places=6,
+                max_digits=9,
+                null=True,
+                verbose_name="longitude",
+            ),
+        ),
+        migrations.RunPython(localizar_predios_pelo_cep, migrations.RunPython.noop),
+    ]
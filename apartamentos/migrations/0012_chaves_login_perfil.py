@@ -0,0 +1,57 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def chave_login(valor):
+    # Cópia congelada de apartamentos.utils.chave_login como estava nesta migração
+    return (valor or "").strip().casefold()
+
+
+def popular_chaves_login(apps, schema_editor):
+    Perfil = apps.get_model("apartamentos", "Perfil")
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split("."))
+    # Usuários antigos sem perfil também ganham um, senão não seriam encontrados no login
+    com_perfil = Perfil.objects.values("usuario_id")
+    Perfil.objects.bulk_create([Perfil(usuario=usuario) for usuario in User.objects.exclude(pk__in=com_perfil)],
+                               batch_size=500)
+    perfis = list(Perfil.objects.select_related("usuario"))
+    for perfil in perfis:
+        perfil.chave_username = chave_login(perfil.usuario.username)
+        perfil.chave_email = chave_login(perfil.usuario.email)
+    Perfil.objects.bulk_update(perfis, ["chave_username", "chave_email"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apartamentos", "0011_localizacao_predio"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="perfil",
+            name="chave_email",
+            field=models.CharField(
+                db_index=True,
+                default="",
+                editable=False,
+                max_length=254,
+                verbose_name="chave de login (e-mail)",
+            ),
+        ),
+        migrations.AddField(
+            model_name="perfil",
+            name="chave_username",
+            field=models.CharField(
+                db_index=True,
+                default="",
+                editable=False,
+                max_length=150,
+                verbose_name="chave de login (username)",
+            ),
+        ),
+        migrations.RunPython(popular_chaves_login, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.3 on 2026-10-18 13:32
+
+from django.db import migrations, models
+
+
+def regerar_variantes(apps, schema_editor):
+    # Variantes geradas antes deste campo não têm os nomes gravados pelo storage; voltam para
+    # variantes_prontas=False e são refeitas com `processar_imagens --enfileirar-existentes`
+    for modelo in ("FotoApartamento", "Predio", "Perfil"):
+        apps.get_model("apartamentos", modelo).objects.filter(variantes_prontas=True).update(variantes_prontas=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apartamentos", "0012_chaves_login_perfil"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fotoapartamento",
+            name="variantes_arquivos",
+            field=models.JSONField(
+                default=dict, editable=False, verbose_name="arquivos das variantes"
+            ),
+        ),
+        migrations.AddField(
+            model_name="perfil",
+            name="variantes_arquivos",
+            field=models.JSONField(
+                default=dict, editable=False, verbose_name="arquivos das variantes"
+            ),
+        ),
+        migrations.AddField(
+            model_name="predio",
+            name="variantes_arquivos",
+            field=models.JSONField(
+                default=dict, editable=False, verbose_name="arquivos das variantes"
+            ),
+        ),
+        migrations.RunPython(regerar_variantes, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,11 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import MinValueValidator, MaxValueValidator
+from .utils import chave_login, normalizar_texto, termos_busca
+from .imagens import Variantes, VARIANTES_POR_CAMPO
+from .geo import celula_geo, centroide_do_cep
 
 class Comodidade(models.Model):
     nome = models.CharField(_("nome da comodidade"), max_length=100, unique=True)
@@ -36,14 +40,66 @@ class Predio(models.Model):
     nome = models.CharField(_("nome do prédio/condomínio"), max_length=255)
     endereco_completo = models.CharField(_("endereço completo"), max_length=255)
     cidade = models.CharField(_("cidade"), max_length=100)
+    # Cidade sem acentos e em minúsculas, usada na busca e no autocompletar (ver utils.normalizar_texto)
+    cidade_normalizada = models.CharField(_("cidade normalizada"), max_length=100, db_index=True, editable=False,
+                                          default='')
     estado = models.CharField(_("estado (UF)"), max_length=2)
     cep = models.CharField(_("CEP"), max_length=9)
+    # Coordenadas informadas pelo proprietário ou, na falta delas, o centroide da faixa do CEP (ver geo.py)
+    latitude = models.DecimalField(_("latitude"), max_digits=9, decimal_places=6, null=True, blank=True)
+    longitude = models.DecimalField(_("longitude"), max_digits=9, decimal_places=6, null=True, blank=True)
+    coordenadas_aproximadas = models.BooleanField(_("coordenadas aproximadas pelo CEP"), default=False,
+                                                  editable=False)
+    # Célula da grade espacial (curva Z) usada nas buscas por raio e por área do mapa
+    celula_geo = models.BigIntegerField(_("célula geográfica"), null=True, db_index=True, editable=False)
     foto_fachada = models.ImageField(_("foto da fachada"), upload_to='predios/fachadas/%Y/%m/%d/', blank=True, null=True)
+    variantes_prontas = models.BooleanField(_("variantes da imagem geradas"), default=False, editable=False)
+    # Nomes com que o storage gravou as variantes ({chave_variante: nome}, ver imagens.gerar_variantes)
+    variantes_arquivos = models.JSONField(_("arquivos das variantes"), default=dict, editable=False)
     data_cadastro = models.DateTimeField(_("data de cadastro"), auto_now_add=True)
     class Meta:
         verbose_name = _("Prédio / Condomínio"); verbose_name_plural = _("Prédios / Condomínios"); ordering = ['nome']
     def __str__(self): return f"{self.nome} - {self.cidade}, {self.estado}"
 
+    @property
+    def variantes(self):
+        return Variantes(self.foto_fachada.name, self.foto_fachada.storage,
+                         VARIANTES_POR_CAMPO[('apartamentos.Predio', 'foto_fachada')], self.variantes_prontas,
+                         self.variantes_arquivos)
+
+    def preencher_localizacao(self):
+        # Coordenadas que vieram do CEP acompanham o CEP; as informadas pelo proprietário são mantidas
+        if self.coordenadas_aproximadas or self.latitude is None or self.longitude is None:
+            centroide = centroide_do_cep(self.cep)
+            self.latitude, self.longitude = centroide or (None, None)
+            self.coordenadas_aproximadas = centroide is not None
+        self.celula_geo = celula_geo(self.latitude, self.longitude) if self.latitude is not None else None
+
+    def save(self, *args, **kwargs):
+        self.cidade_normalizada = normalizar_texto(self.cidade)
+        self.preencher_localizacao()
+        if kwargs.get('update_fields') is not None:
+            campos = set(kwargs['update_fields'])
+            if 'cidade' in campos:
+                campos.add('cidade_normalizada')
+            if campos & {'cep', 'latitude', 'longitude'}:
+                campos |= {'latitude', 'longitude', 'coordenadas_aproximadas', 'celula_geo'}
+            kwargs['update_fields'] = campos
+        super().save(*args, **kwargs)
+
+class ApartamentoQuerySet(models.QuerySet):
+    def com_foto_capa(self):
+        """
+        Anota o nome do arquivo da foto de capa de cada apartamento (a foto marcada
+        como principal ou, na falta dela, a primeira da galeria) na própria consulta.
+        Assim get_foto_principal() não precisa de consultas extras por apartamento.
+        """
+        fotos = FotoApartamento.objects.filter(apartamento=models.OuterRef('pk')).order_by('-principal', 'pk')
+        return self.annotate(foto_capa_nome=models.Subquery(fotos.values('imagem')[:1]),
+                             foto_capa_variantes=models.Subquery(fotos.values('variantes_prontas')[:1]),
+                             foto_capa_arquivos=models.Subquery(fotos.values('variantes_arquivos')[:1],
+                                                                output_field=models.JSONField()))
+
 class Apartamento(models.Model):
     predio = models.ForeignKey(Predio, on_delete=models.CASCADE, related_name='apartamentos', verbose_name=_("prédio / condomínio"))
     proprietario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='meus_apartamentos', verbose_name=_("proprietário"))
@@ -73,11 +129,69 @@ class Apartamento(models.Model):
     )
     data_cadastro = models.DateTimeField(_("data de cadastro"), auto_now_add=True)
     data_atualizacao = models.DateTimeField(_("data de atualização"), auto_now=True)
+    # Radicais (sem acentos) do título, descrição e dados do prédio, indexados em texto completo:
+    # tsvector + GIN no PostgreSQL e FTS5 no SQLite (ver busca.py e a migração 0010)
+    documento_busca = models.TextField(_("documento de busca"), default='', editable=False)
+    objects = ApartamentoQuerySet.as_manager()
+    # Agregados de avaliações, mantidos pelos sinais de Avaliacao (ver signals.py).
+    # Permitem exibir e ordenar por nota sem consultar a tabela de avaliações.
+    avaliacoes_total = models.PositiveIntegerField(_("total de avaliações"), default=0, editable=False)
+    avaliacoes_soma = models.PositiveIntegerField(_("soma das notas"), default=0, editable=False)
+    nota_media = models.FloatField(_("nota média"), default=0, editable=False)
+    avaliacoes_nota_1 = models.PositiveIntegerField(_("avaliações com nota 1"), default=0, editable=False)
+    avaliacoes_nota_2 = models.PositiveIntegerField(_("avaliações com nota 2"), default=0, editable=False)
+    avaliacoes_nota_3 = models.PositiveIntegerField(_("avaliações com nota 3"), default=0, editable=False)
+    avaliacoes_nota_4 = models.PositiveIntegerField(_("avaliações com nota 4"), default=0, editable=False)
+    avaliacoes_nota_5 = models.PositiveIntegerField(_("avaliações com nota 5"), default=0, editable=False)
+
+    CAMPOS_AGREGADOS = (
+        'avaliacoes_total', 'avaliacoes_soma', 'nota_media', 'avaliacoes_nota_1', 'avaliacoes_nota_2',
+        'avaliacoes_nota_3', 'avaliacoes_nota_4', 'avaliacoes_nota_5',
+    )
+
     class Meta:
         verbose_name = _("Apartamento / Unidade"); verbose_name_plural = _("Apartamentos / Unidades"); ordering = ['predio', 'titulo']
+        indexes = [models.Index(fields=['-nota_media', '-avaliacoes_total'], name='apartamento_nota_idx')]
     def __str__(self): return f"{self.predio.nome} - {self.titulo}"
 
+    CAMPOS_BUSCA = ('titulo', 'descricao', 'predio')
+    CAMPOS_BUSCA_PREDIO = ('nome', 'endereco_completo', 'cidade', 'estado')
+
+    def gerar_documento_busca(self, predio=None):
+        predio = predio or self.predio
+        textos = (self.titulo, *(getattr(predio, campo) for campo in self.CAMPOS_BUSCA_PREDIO), self.descricao)
+        return ' '.join(termo for texto in textos for termo in termos_busca(texto))
+
+    def save(self, *args, **kwargs):
+        campos = kwargs.get('update_fields')
+        if campos is None or set(campos) & set(self.CAMPOS_BUSCA):
+            self.documento_busca = self.gerar_documento_busca()
+            if campos is not None:
+                kwargs['update_fields'] = {*campos, 'documento_busca'}
+        # Um save comum (ex: formulário de edição) não deve sobrescrever os agregados de avaliação
+        # com valores desatualizados em memória; eles são alterados apenas via update() atômico.
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.CAMPOS_AGREGADOS
+            ]
+        super().save(*args, **kwargs)
+
+    def get_histograma_notas(self):
+        """Retorna [(nota, quantidade, percentual), ...] da nota 5 para a 1."""
+        histograma = []
+        for nota in range(5, 0, -1):
+            quantidade = getattr(self, f'avaliacoes_nota_{nota}')
+            percentual = round(100 * quantidade / self.avaliacoes_total) if self.avaliacoes_total else 0
+            histograma.append((nota, quantidade, percentual))
+        return histograma
+
     def get_foto_principal(self):
+        # Caminho rápido: a foto de capa já veio anotada pela consulta (ver ApartamentoQuerySet.com_foto_capa)
+        if hasattr(self, 'foto_capa_nome'):
+            if self.foto_capa_nome: return FotoApartamento._meta.get_field('imagem').storage.url(self.foto_capa_nome)
+            if self.foto_principal: return self.foto_principal.url
+            return None
         foto_marcada_como_principal = self.fotos.filter(principal=True).first()
         if foto_marcada_como_principal: return foto_marcada_como_principal.imagem.url
         primeira_foto_da_galeria = self.fotos.first()
@@ -85,6 +199,18 @@ class Apartamento(models.Model):
         if self.foto_principal: return self.foto_principal.url
         return None
 
+    def get_variantes_capa(self):
+        """Variantes (srcset) da foto de capa; falso se não houver foto ou se ainda não foram geradas."""
+        campo = FotoApartamento._meta.get_field('imagem')
+        if hasattr(self, 'foto_capa_nome'):
+            nome, prontas, arquivos = self.foto_capa_nome, self.foto_capa_variantes, self.foto_capa_arquivos
+        else:
+            foto = self.fotos.order_by('-principal', 'pk').first()
+            nome, prontas, arquivos = (foto.imagem.name, foto.variantes_prontas, foto.variantes_arquivos) if foto \
+                else (None, False, None)
+        return Variantes(nome, campo.storage, VARIANTES_POR_CAMPO[('apartamentos.FotoApartamento', 'imagem')],
+                         prontas, arquivos)
+
 # ... (Restante dos modelos Perfil, Reserva, Avaliacao, FotoApartamento - sem alterações) ...
 class Perfil(models.Model):
     class CargoUsuario(models.TextChoices):
@@ -95,11 +221,77 @@ class Perfil(models.Model):
     usuario = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='perfil')
     cargo = models.CharField(_("cargo"), max_length=20, choices=CargoUsuario.choices, default=CargoUsuario.CLIENTE)
     foto_perfil = models.ImageField(_("foto de perfil"), upload_to='usuarios/fotos_perfil/%Y/%m/%d/', blank=True, null=True)
+    variantes_prontas = models.BooleanField(_("variantes da imagem geradas"), default=False, editable=False)
+    # Nomes com que o storage gravou as variantes ({chave_variante: nome}, ver imagens.gerar_variantes)
+    variantes_arquivos = models.JSONField(_("arquivos das variantes"), default=dict, editable=False)
     telefone = models.CharField(_("telefone"), max_length=20, blank=True)
     bio = models.TextField(_("biografia"), blank=True)
+    # Username e e-mail do usuário normalizados (utils.chave_login) e indexados, para o login do EmailBackend
+    # usar igualdade simples em vez de UPPER(...) = UPPER(...), que não aproveita os índices de auth_user
+    chave_username = models.CharField(_("chave de login (username)"), max_length=150, db_index=True,
+                                      editable=False, default='')
+    chave_email = models.CharField(_("chave de login (e-mail)"), max_length=254, db_index=True, editable=False,
+                                   default='')
     class Meta:
         verbose_name = _("Perfil de Usuário"); verbose_name_plural = _("Perfis de Usuários")
     def __str__(self): return f"Perfil de {self.usuario.username}"
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        perfil = super().from_db(db, field_names, values)
+        perfil._guardar_estado()
+        return perfil
+
+    def _guardar_estado(self, campos=None):
+        # Valores como estão no banco, para saber o que mudou (campos adiados ficam de fora);
+        # com `campos`, atualiza só os que acabaram de ser gravados
+        estado = {} if campos is None else getattr(self, '_estado_salvo', {})
+        for campo in self._meta.concrete_fields:
+            if campo.attname in self.__dict__ and (campos is None or campo.name in campos):
+                estado[campo.attname] = self._valor_comparavel(campo)
+        self._estado_salvo = estado
+
+    def _valor_comparavel(self, campo):
+        valor = self.__dict__[campo.attname]
+        if isinstance(campo, models.FileField):
+            # Upload novo ainda não gravado conta como alteração mesmo com o mesmo nome
+            return (getattr(valor, 'name', valor) or '', getattr(valor, '_committed', True))
+        return valor
+
+    def campos_alterados(self):
+        """Nomes (attname) dos campos diferentes do que foi lido/gravado por último."""
+        estado = getattr(self, '_estado_salvo', {})
+        return {attname for attname, valor in estado.items()
+                if attname in self.__dict__ and self._valor_comparavel(self._meta.get_field(attname)) != valor}
+
+    def save(self, *args, **kwargs):
+        """
+        Perfis já gravados só escrevem os campos alterados, e nada se não houver alteração
+        (o sinal de User chama save() a cada User.save(), inclusive no last_login do login).
+        """
+        if not self._state.adding and kwargs.get('update_fields') is None and hasattr(self, '_estado_salvo'):
+            alterados = {self._meta.get_field(attname).name for attname in self.campos_alterados()}
+            if not alterados:
+                return
+            if 'foto_perfil' in alterados:
+                # Zerados pelo pre_save quando chega foto nova ou a foto é removida
+                alterados.update({'variantes_prontas', 'variantes_arquivos'})
+            kwargs['update_fields'] = alterados
+        super().save(*args, **kwargs)
+        self._guardar_estado(kwargs.get('update_fields'))
+
+    def atualizar_chaves_login(self, usuario=None):
+        """Recalcula as chaves de login a partir do usuário; retorna True se alguma mudou."""
+        usuario = usuario or self.usuario
+        chaves = (chave_login(usuario.username), chave_login(usuario.email))
+        if chaves == (self.chave_username, self.chave_email):
+            return False
+        self.chave_username, self.chave_email = chaves
+        return True
+    @property
+    def variantes(self):
+        return Variantes(self.foto_perfil.name, self.foto_perfil.storage,
+                         VARIANTES_POR_CAMPO[('apartamentos.Perfil', 'foto_perfil')], self.variantes_prontas,
+                         self.variantes_arquivos)
 
 class Reserva(models.Model):
     class StatusReserva(models.TextChoices):
@@ -112,10 +304,35 @@ class Reserva(models.Model):
     data_checkout = models.DateField(_("data de check-out"))
     status = models.CharField(_("status"), max_length=20, choices=StatusReserva.choices, default=StatusReserva.PENDENTE)
     data_reserva = models.DateTimeField(_("data da reserva"), auto_now_add=True)
+    # Usada como Last-Modified/ETag dos feeds de calendário; inclua-a no update_fields ao salvar parcialmente
+    data_atualizacao = models.DateTimeField(_("última atualização"), auto_now=True)
     class Meta:
         verbose_name = _("Reserva"); verbose_name_plural = _("Reservas"); ordering = ['-data_reserva']
+        # Contadores e listas por status do painel do proprietário (ver services.resumo_painel_proprietario)
+        indexes = [models.Index(fields=['apartamento', 'status', 'data_checkin'], name='reserva_apto_status_idx')]
     def __str__(self): return f"Reserva de {self.apartamento} por {self.hospede.username}"
 
+    # Status que ocupam o apartamento (usados na busca por datas e no formulário de reserva)
+    STATUS_BLOQUEANTES = (StatusReserva.CONFIRMADA, StatusReserva.PENDENTE)
+
+# Índice de disponibilidade: um registro por dia ocupado por uma reserva bloqueante.
+# A busca por datas consulta apenas os dias do intervalo pedido, em vez de varrer
+# todo o histórico de reservas. Mantido pelos sinais de Reserva (ver signals.py).
+class OcupacaoDiaria(models.Model):
+    apartamento = models.ForeignKey(Apartamento, on_delete=models.CASCADE, related_name='ocupacoes')
+    reserva = models.ForeignKey(Reserva, on_delete=models.CASCADE, related_name='ocupacoes')
+    data = models.DateField(_("data ocupada"))
+    class Meta:
+        verbose_name = _("Ocupação Diária"); verbose_name_plural = _("Ocupações Diárias")
+        constraints = [
+            models.UniqueConstraint(fields=['reserva', 'data'], name='ocupacao_unica_por_reserva_e_dia'),
+            # Garantia final contra reserva dupla: um dia de um apartamento só pode ser ocupado por uma reserva
+            # bloqueante. Funciona como uma constraint de exclusão portátil (PostgreSQL e SQLite).
+            models.UniqueConstraint(fields=['apartamento', 'data'], name='ocupacao_unica_por_apto_e_dia'),
+        ]
+        indexes = [models.Index(fields=['data', 'apartamento'], name='ocupacao_data_apto_idx')]
+    def __str__(self): return f"{self.apartamento} ocupado em {self.data:%d/%m/%Y}"
+
 class Avaliacao(models.Model):
     reserva = models.OneToOneField(Reserva, on_delete=models.CASCADE, related_name='avaliacao')
     nota = models.IntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)], help_text="Nota de 1 a 5")
@@ -127,6 +344,60 @@ class FotoApartamento(models.Model):
     apartamento = models.ForeignKey(Apartamento, on_delete=models.CASCADE, related_name='fotos')
     imagem = models.ImageField(upload_to='apartamentos/fotos/')
     principal = models.BooleanField(default=False)
+    variantes_prontas = models.BooleanField(_("variantes da imagem geradas"), default=False, editable=False)
+    # Nomes com que o storage gravou as variantes ({chave_variante: nome}, ver imagens.gerar_variantes)
+    variantes_arquivos = models.JSONField(_("arquivos das variantes"), default=dict, editable=False)
     class Meta:
         ordering = ['-principal']
-    def __str__(self): return f"Foto de {self.apartamento.titulo}"
\ No newline at end of file
+    def __str__(self): return f"Foto de {self.apartamento.titulo}"
+    @property
+    def variantes(self):
+        return Variantes(self.imagem.name, self.imagem.storage,
+                         VARIANTES_POR_CAMPO[('apartamentos.FotoApartamento', 'imagem')], self.variantes_prontas,
+                         self.variantes_arquivos)
+
+# Caixa de saída de e-mails: gravada na mesma transação da mudança de status e
+# enviada em segundo plano pelo comando `manage.py enviar_emails`.
+class EmailPendente(models.Model):
+    class StatusEnvio(models.TextChoices):
+        PENDENTE = 'PENDENTE', _('Pendente')
+        ENVIADO = 'ENVIADO', _('Enviado')
+        FALHOU = 'FALHOU', _('Falhou')
+    destinatario = models.EmailField(_("destinatário"))
+    assunto = models.CharField(_("assunto"), max_length=255)
+    corpo = models.TextField(_("corpo"))
+    remetente = models.CharField(_("remetente"), max_length=255)
+    status = models.CharField(_("status"), max_length=20, choices=StatusEnvio.choices, default=StatusEnvio.PENDENTE)
+    tentativas = models.PositiveSmallIntegerField(_("tentativas"), default=0)
+    proxima_tentativa = models.DateTimeField(_("próxima tentativa"), default=timezone.now)
+    ultimo_erro = models.TextField(_("último erro"), blank=True)
+    data_criacao = models.DateTimeField(_("data de criação"), auto_now_add=True)
+    data_envio = models.DateTimeField(_("data de envio"), blank=True, null=True)
+    class Meta:
+        verbose_name = _("E-mail Pendente"); verbose_name_plural = _("E-mails Pendentes"); ordering = ['data_criacao']
+        indexes = [models.Index(fields=['status', 'proxima_tentativa'], name='email_fila_idx')]
+    def __str__(self): return f"{self.assunto} para {self.destinatario} ({self.get_status_display()})"
+
+
+# Fila de geração de variantes de imagem (ver imagens.py e o comando processar_imagens),
+# alimentada pelos sinais de upload e processada fora da requisição, como a caixa de saída de e-mails.
+class ImagemPendente(models.Model):
+    class StatusProcessamento(models.TextChoices):
+        PENDENTE = 'PENDENTE', _('Pendente')
+        PROCESSADA = 'PROCESSADA', _('Processada')
+        FALHOU = 'FALHOU', _('Falhou')
+    modelo = models.CharField(_("modelo"), max_length=100)
+    objeto_id = models.PositiveBigIntegerField(_("ID do objeto"))
+    campo = models.CharField(_("campo"), max_length=50)
+    nome_arquivo = models.CharField(_("arquivo"), max_length=255)
+    status = models.CharField(_("status"), max_length=20, choices=StatusProcessamento.choices,
+                              default=StatusProcessamento.PENDENTE)
+    tentativas = models.PositiveSmallIntegerField(_("tentativas"), default=0)
+    proxima_tentativa = models.DateTimeField(_("próxima tentativa"), default=timezone.now)
+    ultimo_erro = models.TextField(_("último erro"), blank=True)
+    data_criacao = models.DateTimeField(_("data de criação"), auto_now_add=True)
+    data_processamento = models.DateTimeField(_("data de processamento"), blank=True, null=True)
+    class Meta:
+        verbose_name = _("Imagem Pendente"); verbose_name_plural = _("Imagens Pendentes"); ordering = ['data_criacao']
+        indexes = [models.Index(fields=['status', 'proxima_tentativa'], name='imagem_fila_idx')]
+    def __str__(self): return f"{self.nome_arquivo} ({self.get_status_display()})"
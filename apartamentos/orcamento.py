@@ -0,0 +1,86 @@
+# apartamentos/orcamento.py
+"""
+Orçamento de estadias: diárias (ou meses, em estadias longas) mais os adicionais
+das comodidades, calculado para uma página inteira de apartamentos de uma vez.
+
+Os orçamentos ficam em cache por (apartamento, check-in, check-out). A chave leva
+a versão do apartamento (cache.versao_apartamento), que os sinais já trocam quando
+o apartamento ou as suas comodidades mudam, então preços novos valem na hora.
+"""
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import DateField, Sum
+
+from .cache import versoes_apartamentos
+from .models import ApartamentoComodidade
+
+CHAVE_ORCAMENTO = 'apartamentos:orcamento:{}:{}:{}:{}'
+TEMPO_ORCAMENTO = 60 * 60
+# A partir deste número de noites, apartamentos com preço mensal são cobrados por mês
+DIAS_MES = 30
+
+
+@dataclass(frozen=True)
+class Orcamento:
+    noites: int
+    meses: int
+    diarias: int
+    valor_hospedagem: Decimal
+    valor_adicionais: Decimal
+
+    @property
+    def total(self):
+        return self.valor_hospedagem + self.valor_adicionais
+
+
+def calcular_orcamento(preco_diaria, preco_mensal, adicionais_por_diaria, noites):
+    """
+    Regra de preço de uma estadia. Com preço mensal e pelo menos DIAS_MES noites,
+    cada mês fechado sai pelo preço mensal e as noites restantes pela diária, sem
+    passar do preço de mais um mês. Os adicionais das comodidades são por diária.
+    """
+    preco_diaria, adicionais_por_diaria = Decimal(preco_diaria), Decimal(adicionais_por_diaria or 0)
+    meses, diarias = 0, noites
+    hospedagem = preco_diaria * noites
+    if preco_mensal and noites >= DIAS_MES:
+        meses, diarias = divmod(noites, DIAS_MES)
+        preco_mensal = Decimal(preco_mensal)
+        hospedagem = preco_mensal * meses + min(preco_diaria * diarias, preco_mensal)
+    return Orcamento(noites=noites, meses=meses, diarias=diarias, valor_hospedagem=hospedagem,
+                     valor_adicionais=adicionais_por_diaria * noites)
+
+
+def orcar_estadias(apartamentos, data_checkin, data_checkout):
+    """
+    Orça a mesma estadia para vários apartamentos (instâncias já carregadas).
+    Retorna {id do apartamento: Orcamento}; vazio se o período for inválido.
+
+    Os que não estão em cache custam uma única consulta agrupada pelos adicionais.
+    """
+    data_checkin, data_checkout = DateField().to_python(data_checkin), DateField().to_python(data_checkout)
+    noites = (data_checkout - data_checkin).days
+    apartamentos = list(apartamentos)
+    if noites <= 0 or not apartamentos:
+        return {}
+    versoes = versoes_apartamentos([apartamento.pk for apartamento in apartamentos])
+    chaves = {CHAVE_ORCAMENTO.format(apartamento.pk, versoes[apartamento.pk], data_checkin, data_checkout): apartamento
+              for apartamento in apartamentos}
+    orcamentos = {chaves[chave].pk: orcamento for chave, orcamento in cache.get_many(chaves).items()}
+    faltantes = {chave: apartamento for chave, apartamento in chaves.items() if apartamento.pk not in orcamentos}
+    if faltantes:
+        adicionais = dict(ApartamentoComodidade.objects.filter(
+            apartamento_id__in=[apartamento.pk for apartamento in faltantes.values()])
+            .values('apartamento_id').annotate(soma=Sum('preco_adicional')).values_list('apartamento_id', 'soma')
+            .order_by())
+        novos = {chave: calcular_orcamento(apartamento.preco_diaria, apartamento.preco_mensal,
+                                           adicionais.get(apartamento.pk), noites)
+                 for chave, apartamento in faltantes.items()}
+        cache.set_many(novos, TEMPO_ORCAMENTO)
+        orcamentos.update({faltantes[chave].pk: orcamento for chave, orcamento in novos.items()})
+    return orcamentos
+
+
+def orcar_estadia(apartamento, data_checkin, data_checkout):
+    return orcar_estadias([apartamento], data_checkin, data_checkout).get(apartamento.pk)
@@ -0,0 +1,204 @@
+# apartamentos/paginacao.py
+"""
+Paginação por cursor (keyset) para as listagens.
+
+Em vez de COUNT(*) + OFFSET, cada página é buscada com um WHERE sobre os
+valores da ordenação do último (ou primeiro) item da página atual, então a
+página N custa o mesmo que a página 1. O cursor é um token opaco na URL
+(?cursor=...) com esses valores e a direção da navegação.
+"""
+import base64
+import binascii
+import copy
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from django.utils.http import urlencode
+
+PROXIMA = 'p'
+ANTERIOR = 'a'
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+class _EncoderCursor(DjangoJSONEncoder):
+    # O DjangoJSONEncoder corta datetimes em milissegundos; o cursor precisa do valor exato.
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+class PaginaCursor:
+    """Página de resultados com a mesma interface básica do Page do Django (has_next, has_previous...)."""
+
+    def __init__(self, object_list, url_proxima=None, url_anterior=None, total=None, total_exato=True,
+                 cursor_proximo=None, cursor_anterior=None):
+        self.object_list = object_list
+        self.url_proxima = url_proxima
+        self.url_anterior = url_anterior
+        self.total = total
+        self.total_exato = total_exato
+        self.cursor_proximo = cursor_proximo
+        self.cursor_anterior = cursor_anterior
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.cursor_proximo is not None
+
+    def has_previous(self):
+        return self.cursor_anterior is not None
+
+    def com_links(self, parametros, parametro='cursor'):
+        """
+        Cópia da página com os links montados a partir de `parametros` ((nome, valores), ...), para
+        páginas guardadas em cache: cada requisição ganha links com os seus próprios parâmetros.
+        """
+        pares = [(nome, valor) for nome, valores in parametros if nome not in (parametro, 'page')
+                 for valor in valores]
+
+        def url(cursor):
+            return f'?{urlencode(pares + [(parametro, cursor)])}' if cursor is not None else None
+
+        pagina = copy.copy(self)
+        pagina.url_proxima, pagina.url_anterior = url(self.cursor_proximo), url(self.cursor_anterior)
+        return pagina
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def _campos_ordenacao(queryset, ordenacao):
+    """Retorna [(nome do campo, Field, descendente)] e garante o pk como desempate no final."""
+    ordenacao = list(ordenacao)
+    if not any(campo.lstrip('-') in ('pk', 'id') for campo in ordenacao):
+        ordenacao.append('-pk' if ordenacao and ordenacao[-1].startswith('-') else 'pk')
+    campos = []
+    for campo in ordenacao:
+        nome = campo.lstrip('-')
+        if nome in queryset.query.annotations:
+            # Anotações (ex: a relevância da busca) também servem de cursor
+            campos.append((nome, queryset.query.annotations[nome].output_field, campo.startswith('-')))
+            continue
+        field = queryset.model._meta.pk if nome == 'pk' else queryset.model._meta.get_field(nome)
+        campos.append((field.attname if nome != 'pk' else 'pk', field, campo.startswith('-')))
+    return campos
+
+
+def codificar_cursor(direcao, valores):
+    dados = json.dumps({'d': direcao, 'v': valores}, cls=_EncoderCursor, separators=(',', ':'))
+    return base64.urlsafe_b64encode(dados.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(token, campos):
+    """Retorna (direção, valores) já convertidos para os tipos Python dos campos."""
+    try:
+        dados = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        direcao, valores = dados['d'], dados['v']
+        if direcao not in (PROXIMA, ANTERIOR) or len(valores) != len(campos):
+            raise CursorInvalido(token)
+        valores = [field.to_python(valor) for (_, field, _), valor in zip(campos, valores)]
+        # Os cursores gerados nunca têm nulos, e `campo__lt=None` não é um filtro válido
+        if any(valor is None for valor in valores):
+            raise CursorInvalido(token)
+        return direcao, valores
+    except (binascii.Error, ValueError, KeyError, TypeError, ValidationError) as e:
+        raise CursorInvalido(token) from e
+
+
+def _filtro_apos(campos, valores, inverter):
+    """
+    Monta (a > x) OR (a = x AND b > y) OR ... respeitando a direção de cada campo.
+    Com inverter=True, busca os itens antes do cursor.
+    """
+    filtro = Q()
+    iguais = {}
+    for (nome, _, descendente), valor in zip(campos, valores):
+        maior = descendente == inverter
+        filtro |= Q(**iguais, **{f'{nome}__{"gt" if maior else "lt"}': valor})
+        iguais[nome] = valor
+    return filtro
+
+
+def contar_limitado(queryset, limite=1000):
+    """
+    Conta os resultados sem varrer tudo: conta no máximo limite+1 linhas.
+    Acima do limite, usa a estimativa do planejador no PostgreSQL (ou o próprio
+    limite nos outros bancos). Retorna (total, exato).
+    """
+    total = queryset.order_by()[:limite + 1].count()
+    if total <= limite:
+        return total, True
+    conexao = connections[queryset.db]
+    if conexao.vendor == 'postgresql':
+        sql, params = queryset.order_by().query.sql_with_params()
+        with conexao.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plano = cursor.fetchone()[0]
+        if isinstance(plano, str):
+            plano = json.loads(plano)
+        return max(int(plano[0]['Plan']['Plan Rows']), limite), False
+    return limite, False
+
+
+def paginar_por_cursor(request, queryset, ordenacao, tamanho, contar=False, parametro='cursor', links=True):
+    """
+    Pagina o queryset pela ordenação informada (campos do próprio modelo ou anotações,
+    com '-' para decrescente; o pk entra como desempate). Um cursor inválido volta para a
+    primeira página. Com contar=True, a página traz um total estimado (contar_limitado).
+    Com links=False, a página leva só os cursores (para ir ao cache; ver PaginaCursor.com_links).
+    """
+    campos = _campos_ordenacao(queryset, ordenacao)
+    token = request.GET.get(parametro)
+    direcao, valores = PROXIMA, None
+    if token:
+        try:
+            direcao, valores = decodificar_cursor(token, campos)
+        except CursorInvalido:
+            direcao, valores = PROXIMA, None
+
+    voltando = direcao == ANTERIOR
+    ordem = [f'{"-" if descendente != voltando else ""}{nome}' for nome, _, descendente in campos]
+    pagina_qs = queryset
+    if valores is not None:
+        pagina_qs = pagina_qs.filter(_filtro_apos(campos, valores, inverter=voltando))
+    itens = list(pagina_qs.order_by(*ordem)[:tamanho + 1])
+    ha_mais = len(itens) > tamanho
+    itens = itens[:tamanho]
+    if voltando:
+        itens.reverse()
+
+    def cursor(direcao_link, item):
+        return codificar_cursor(direcao_link, [getattr(item, nome) for nome, _, _ in campos])
+
+    tem_proxima = ha_mais if not voltando else True
+    tem_anterior = ha_mais if voltando else valores is not None
+    cursor_proximo = cursor(PROXIMA, itens[-1]) if itens and tem_proxima else None
+    cursor_anterior = cursor(ANTERIOR, itens[0]) if itens and tem_anterior else None
+    total, exato = contar_limitado(queryset) if contar else (None, True)
+    pagina = PaginaCursor(itens, total=total, total_exato=exato, cursor_proximo=cursor_proximo,
+                          cursor_anterior=cursor_anterior)
+    return pagina.com_links(request.GET.lists(), parametro) if links else pagina
+
+
+class PaginacaoCursorMixin:
+    """
+    Troca a paginação por OFFSET do ListView pela paginação por cursor.
+    As views definem ordenacao_cursor e paginate_by.
+    """
+    ordenacao_cursor = ('-pk',)
+
+    def paginate_queryset(self, queryset, page_size):
+        pagina = paginar_por_cursor(self.request, queryset, self.ordenacao_cursor, page_size)
+        return None, pagina, pagina.object_list, pagina.has_other_pages()
@@ -0,0 +1,165 @@
+# apartamentos/roteamento.py
+"""
+Roteamento de leitura/escrita entre o banco primário e réplicas de leitura.
+
+Escritas vão sempre para o primário ('default'). Leituras vão para uma das
+réplicas de settings.REPLICAS_LEITURA apenas dentro de uma requisição segura
+(GET/HEAD/OPTIONS) marcada pelo RoteamentoBancoMiddleware; fora de requisições
+(comandos, testes, threads) e em POSTs, tudo fica no primário.
+
+Leia o que escreveu: quando uma requisição escreve no banco, o navegador
+recebe um cookie que mantém as leituras dele no primário por
+settings.JANELA_LEITURA_PROPRIA segundos, o atraso tolerado de replicação.
+Assim o hóspede vê a própria reserva logo depois de criá-la.
+
+Quem preenche um cache lê do primário (ler_do_primario): a versão de cache já
+foi trocada pela escrita, e um valor lido de uma réplica atrasada ficaria
+guardado sob a versão nova até expirar.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, replace
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+COOKIE_LEITURA_PROPRIA = 'ler_primario_ate'
+METODOS_SEGUROS = ('GET', 'HEAD', 'OPTIONS')
+# Sessões são gravadas no login e lidas logo na requisição seguinte: réplica atrasada deslogaria o usuário.
+# O DatabaseCache ('django_cache') guarda versões de invalidação: lidas da réplica, voltariam atrasadas.
+APPS_SEMPRE_NO_PRIMARIO = {'sessions', 'django_cache'}
+
+
+@dataclass
+class EstadoRoteamento:
+    usar_primario: bool = True
+    escreveu: bool = False
+
+
+# None fora de requisições: sem estado, nenhuma leitura vai para réplica
+_estado = ContextVar('estado_roteamento', default=None)
+
+
+@contextmanager
+def ler_do_primario():
+    """Mantém no primário as leituras feitas dentro do bloco (inclusive nas threads que copiam o contexto)."""
+    estado = _estado.get()
+    if estado is None or estado.usar_primario:
+        yield
+        return
+    # Estado próprio do bloco: consultas paralelas da mesma requisição continuam podendo usar a réplica
+    estado_bloco = replace(estado, usar_primario=True)
+    token = _estado.set(estado_bloco)
+    try:
+        yield
+    finally:
+        _estado.reset(token)
+        estado.escreveu = estado.escreveu or estado_bloco.escreveu
+
+
+class RoteadorLeituraEscrita:
+    """DATABASE_ROUTERS: leituras nas réplicas quando permitido, escritas no primário."""
+
+    def db_for_read(self, model, **hints):
+        estado = _estado.get()
+        replicas = getattr(settings, 'REPLICAS_LEITURA', ())
+        if (estado is None or estado.usar_primario or not replicas
+                or model._meta.app_label in APPS_SEMPRE_NO_PRIMARIO
+                # Dentro de uma transação no primário, ler fora dela veria outro estado
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        estado = _estado.get()
+        if estado is not None:
+            estado.escreveu = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primário e réplicas têm os mesmos dados
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # As réplicas recebem o esquema pela replicação
+        return db == DEFAULT_DB_ALIAS
+
+
+class _ConteudoComEstado:
+    """Itera o conteúdo de uma resposta em streaming com o estado de roteamento da requisição."""
+
+    def __init__(self, conteudo, estado):
+        self.conteudo, self.estado = iter(conteudo), estado
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        token = _estado.set(self.estado)
+        try:
+            return next(self.conteudo)
+        finally:
+            _estado.reset(token)
+
+
+class RoteamentoBancoMiddleware:
+    """
+    Define, por requisição, se as leituras podem ir para as réplicas e renova o
+    cookie de leitura própria quando a requisição escreve. Deve vir antes dos
+    middlewares que consultam o banco (sessão, autenticação).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        estado = self._estado_da_requisicao(request)
+        token = _estado.set(estado)
+        try:
+            response = self.get_response(request)
+        finally:
+            _estado.reset(token)
+        return self._finalizar(response, estado)
+
+    async def __acall__(self, request):
+        # O ORM assíncrono (sync_to_async) copia o contexto para a thread da consulta: o roteador vê o estado
+        estado = self._estado_da_requisicao(request)
+        token = _estado.set(estado)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _estado.reset(token)
+        return self._finalizar(response, estado)
+
+    def _estado_da_requisicao(self, request):
+        return EstadoRoteamento(usar_primario=request.method not in METODOS_SEGUROS
+                                or self._dentro_da_janela(request))
+
+    @staticmethod
+    def _finalizar(response, estado):
+        if response.streaming and not getattr(response, 'is_async', False):
+            # Feeds em streaming consultam o banco depois que a view retorna
+            response.streaming_content = _ConteudoComEstado(response.streaming_content, estado)
+        if estado.escreveu:
+            janela = settings.JANELA_LEITURA_PROPRIA
+            # Sem assinatura: forjar o cookie só faz o próprio navegador ler do primário
+            response.set_cookie(COOKIE_LEITURA_PROPRIA, str(int(time.time()) + janela), max_age=janela,
+                                httponly=True, samesite='Lax')
+        return response
+
+    @staticmethod
+    def _dentro_da_janela(request):
+        try:
+            return int(request.COOKIES.get(COOKIE_LEITURA_PROPRIA, 0)) > time.time()
+        except ValueError:
+            return False
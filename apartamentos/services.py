@@ -1,36 +1,85 @@
-from django.core.mail import send_mail
+import hashlib
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
 from django.template.loader import render_to_string
+from django.utils import timezone
 from django.contrib.auth.models import User
-from .models import Reserva
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, OperationalError, transaction
+from django.db.models import Count, F, FloatField, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+from .orcamento import calcular_orcamento, orcar_estadia
+from .models import Apartamento, ApartamentoComodidade, Avaliacao, EmailPendente, ImagemPendente, Reserva, OcupacaoDiaria
+
+REMETENTE_PADRAO = 'nao-responda@aluguelpro.com'
+
+# Novas tentativas quando o banco recusa a transação por concorrência (SQLite ocupado, deadlock no PostgreSQL).
+TENTATIVAS_RESERVA = 5
+ESPERA_BASE_RESERVA = 0.02  # segundos; dobra a cada tentativa, com variação aleatória
+MENSAGEM_CONFLITO = "Conflito de datas! O período selecionado (ou parte dele) já está ocupado."
+
+
+def enfileirar_email(destinatario: str, assunto: str, template: str, contexto: dict):
+    """
+    Renderiza um e-mail e o grava na caixa de saída (EmailPendente).
+
+    Deve ser chamada dentro da mesma transação da mudança que gerou o e-mail:
+    se a transação for desfeita, o e-mail também não é enviado. O envio real é
+    feito pelo comando `manage.py enviar_emails`, fora do ciclo da requisição.
+
+    :return: O EmailPendente criado, ou None se o usuário não tiver e-mail cadastrado.
+    """
+    if not destinatario:
+        return None
+    return EmailPendente.objects.create(
+        destinatario=destinatario,
+        assunto=assunto,
+        corpo=render_to_string(template, contexto),
+        remetente=REMETENTE_PADRAO,
+    )
+
 
 def aprovar_reserva_service(reserva: Reserva, usuario: User):
     """
     Executa a lógica de negócio para aprovar uma reserva.
-    ... (código existente) ...
+
+    Só reservas pendentes podem ser aprovadas. Os dias são ocupados na mesma transação
+    (ver atualizar_ocupacao_reserva); se já estiverem ocupados por outra reserva (uma
+    cancelada cujos dias foram reservados depois, ou sobreposições antigas), a constraint
+    de OcupacaoDiaria recusa a gravação e nada muda.
+
+    :param reserva: A instância da Reserva a ser aprovada.
+    :param usuario: O usuário que está tentando executar a ação.
+    :raises PermissionError: Se o usuário não for o proprietário do apartamento.
+    :raises ValidationError: Se a reserva não estiver pendente (code='reserva_nao_pendente') ou
+        se o período já estiver ocupado (code='conflito_reserva').
     """
     if usuario != reserva.apartamento.proprietario:
         raise PermissionError("Usuário não tem permissão para aprovar esta reserva.")
 
-    reserva.status = Reserva.StatusReserva.CONFIRMADA
-    reserva.save(update_fields=['status'])
-
-    # --- LÓGICA DE E-MAIL ADICIONADA ---
     try:
-        contexto_email = {
-            'hospede': reserva.hospede,
-            'apartamento': reserva.apartamento,
-            'reserva': reserva,
-        }
-        corpo_email = render_to_string('emails/reserva_aprovada.txt', contexto_email)
-        send_mail(
-            subject=f'Sua reserva para "{reserva.apartamento.titulo}" foi APROVADA!',
-            message=corpo_email,
-            from_email='nao-responda@aluguelpro.com',
-            recipient_list=[reserva.hospede.email],
-            fail_silently=False,
-        )
-    except Exception as e:
-        print(f"ERRO ao enviar e-mail de aprovação: {e}")
+        with transaction.atomic():
+            # Status lido com a linha bloqueada: dois cliques (ou aprovar e recusar juntos) não passam ambos
+            status = Reserva.objects.select_for_update().filter(pk=reserva.pk).values_list('status', flat=True).first()
+            if status != Reserva.StatusReserva.PENDENTE:
+                raise ValidationError("Só reservas pendentes podem ser aprovadas.", code='reserva_nao_pendente')
+            reserva.status = Reserva.StatusReserva.CONFIRMADA
+            reserva.save(update_fields=['status', 'data_atualizacao'])
+
+            # O e-mail vai para a caixa de saída na mesma transação da mudança de status.
+            enfileirar_email(
+                destinatario=reserva.hospede.email,
+                assunto=f'Sua reserva para "{reserva.apartamento.titulo}" foi APROVADA!',
+                template='emails/reserva_aprovada.txt',
+                contexto={'hospede': reserva.hospede, 'apartamento': reserva.apartamento, 'reserva': reserva,
+                          'orcamento': orcar_estadia(reserva.apartamento, reserva.data_checkin, reserva.data_checkout)},
+            )
+    except IntegrityError as e:
+        reserva.status = status
+        raise ValidationError(MENSAGEM_CONFLITO, code='conflito_reserva') from e
 
 
 def recusar_reserva_service(reserva: Reserva, usuario: User):
@@ -45,24 +94,270 @@ def recusar_reserva_service(reserva: Reserva, usuario: User):
     if usuario != reserva.apartamento.proprietario:
         raise PermissionError("Usuário não tem permissão para recusar esta reserva.")
 
-    # Ação Principal: Mudar o status.
-    reserva.status = Reserva.StatusReserva.CANCELADA
-    reserva.save(update_fields=['status'])
+    with transaction.atomic():
+        # Ação Principal: Mudar o status.
+        reserva.status = Reserva.StatusReserva.CANCELADA
+        reserva.save(update_fields=['status', 'data_atualizacao'])
 
-    # --- LÓGICA DE E-MAIL ADICIONADA ---
-    try:
-        contexto_email = {
-            'hospede': reserva.hospede,
-            'apartamento': reserva.apartamento,
-            'reserva': reserva,
-        }
-        corpo_email = render_to_string('emails/reserva_recusada.txt', contexto_email)
-        send_mail(
-            subject=f'Atualização sobre sua reserva para "{reserva.apartamento.titulo}"',
-            message=corpo_email,
-            from_email='nao-responda@aluguelpro.com',
-            recipient_list=[reserva.hospede.email],
-            fail_silently=False,
+        enfileirar_email(
+            destinatario=reserva.hospede.email,
+            assunto=f'Atualização sobre sua reserva para "{reserva.apartamento.titulo}"',
+            template='emails/reserva_recusada.txt',
+            contexto={'hospede': reserva.hospede, 'apartamento': reserva.apartamento, 'reserva': reserva},
         )
-    except Exception as e:
-        print(f"ERRO ao enviar e-mail de recusa: {e}")
\ No newline at end of file
+
+
+def criar_reserva_service(apartamento: Apartamento, hospede: User, data_checkin, data_checkout) -> Reserva:
+    """
+    Cria uma reserva pendente sem risco de reserva dupla, mesmo com pedidos simultâneos.
+
+    A verificação de conflito e a gravação acontecem na mesma transação, com a
+    linha do apartamento bloqueada (SELECT ... FOR UPDATE no PostgreSQL; no SQLite
+    a transação já nasce com o bloqueio de escrita, ver DATABASES). A constraint
+    única de OcupacaoDiaria (apartamento, data) é a garantia final: se duas
+    transações passarem juntas pela verificação, a segunda falha ao gravar os dias.
+    Erros transitórios de concorrência são repetidos até TENTATIVAS_RESERVA vezes.
+
+    :raises ValidationError: Se o período já estiver ocupado (code='conflito_reserva').
+    """
+    # Dentro de uma transação externa não dá para repetir: o erro precisa subir para quem a abriu.
+    tentativas = 1 if transaction.get_connection().in_atomic_block else TENTATIVAS_RESERVA
+    for tentativa in range(1, tentativas + 1):
+        try:
+            with transaction.atomic():
+                Apartamento.objects.select_for_update().filter(pk=apartamento.pk).values_list('pk').first()
+                conflito = OcupacaoDiaria.objects.filter(apartamento=apartamento,
+                                                         data__range=(data_checkin, data_checkout)).exists()
+                if conflito:
+                    raise ValidationError(MENSAGEM_CONFLITO, code='conflito_reserva')
+                reserva = Reserva.objects.create(apartamento=apartamento, hospede=hospede, data_checkin=data_checkin,
+                                                 data_checkout=data_checkout, status=Reserva.StatusReserva.PENDENTE)
+                # O aviso ao proprietário vai para a caixa de saída; o envio acontece fora da requisição.
+                notificar_nova_reserva(reserva)
+            return reserva
+        except IntegrityError as e:
+            raise ValidationError(MENSAGEM_CONFLITO, code='conflito_reserva') from e
+        except OperationalError:
+            if tentativa == tentativas:
+                raise
+            time.sleep(ESPERA_BASE_RESERVA * (2 ** (tentativa - 1)) * random.uniform(0.5, 1.5))
+
+
+def notificar_nova_reserva(reserva: Reserva):
+    """
+    Enfileira o aviso de nova solicitação de reserva para o proprietário.
+    """
+    apartamento = reserva.apartamento
+    proprietario = apartamento.proprietario
+    enfileirar_email(
+        destinatario=proprietario.email,
+        assunto=f'Nova Solicitação de Reserva para "{apartamento.titulo}"',
+        template='emails/notificacao_nova_reserva.txt',
+        contexto={'proprietario': proprietario, 'hospede': reserva.hospede, 'apartamento': apartamento,
+                  'reserva': reserva,
+                  'orcamento': orcar_estadia(apartamento, reserva.data_checkin, reserva.data_checkout)},
+    )
+
+
+def atualizar_busca_do_predio(predio):
+    """
+    Refaz o documento de busca das unidades de um prédio alterado. O bulk_update
+    dispara os triggers/colunas geradas do índice de texto (ver busca.py).
+    """
+    apartamentos = []
+    for apartamento in predio.apartamentos.only('pk', 'titulo', 'descricao', 'documento_busca'):
+        documento = apartamento.gerar_documento_busca(predio)
+        if documento != apartamento.documento_busca:
+            apartamento.documento_busca = documento
+            apartamentos.append(apartamento)
+    Apartamento.objects.bulk_update(apartamentos, ['documento_busca'], batch_size=500)
+
+
+def atualizar_ocupacao_reserva(reserva: Reserva):
+    """
+    Sincroniza o índice de disponibilidade (OcupacaoDiaria) com uma reserva.
+
+    Reservas bloqueantes (pendentes ou confirmadas) ocupam todos os dias de
+    check-in a check-out, inclusive, mantendo a mesma regra de conflito usada
+    pelo ReservaForm. Reservas canceladas liberam os seus dias.
+
+    :param reserva: A instância da Reserva que foi criada ou alterada.
+    """
+    OcupacaoDiaria.objects.filter(reserva=reserva).delete()
+    if reserva.status not in Reserva.STATUS_BLOQUEANTES:
+        return
+    OcupacaoDiaria.objects.bulk_create(gerar_ocupacoes(reserva))
+
+
+def gerar_ocupacoes(reserva: Reserva):
+    """
+    Monta (sem salvar) os registros de OcupacaoDiaria de uma reserva bloqueante.
+    """
+    # As datas podem chegar como texto quando a reserva é criada diretamente (ex: '2025-01-01')
+    data_checkin = Reserva._meta.get_field('data_checkin').to_python(reserva.data_checkin)
+    data_checkout = Reserva._meta.get_field('data_checkout').to_python(reserva.data_checkout)
+    return [
+        OcupacaoDiaria(apartamento_id=reserva.apartamento_id, reserva=reserva,
+                       data=data_checkin + timedelta(days=i))
+        for i in range((data_checkout - data_checkin).days + 1)
+    ]
+
+
+def apartamentos_ocupados_no_periodo(data_checkin, data_checkout):
+    """
+    Retorna um queryset (subconsulta) com os IDs dos apartamentos que têm
+    algum dia ocupado entre data_checkin e data_checkout, inclusive.
+
+    O custo depende apenas do número de dias ocupados dentro do intervalo,
+    e não do tamanho total do histórico de reservas.
+    """
+    return OcupacaoDiaria.objects.filter(data__range=(data_checkin, data_checkout)).values('apartamento_id')
+
+
+
+def registrar_avaliacao_nos_agregados(apartamento_id, nota, delta=1):
+    """
+    Atualiza incrementalmente os agregados de avaliação de um apartamento.
+
+    Usa um único UPDATE com expressões F(), seguro para avaliações simultâneas.
+    A média é calculada a partir dos valores antigos da linha (semântica do SQL),
+    por isso soma e total são ajustados também dentro da expressão.
+
+    :param apartamento_id: ID do apartamento avaliado.
+    :param nota: A nota (1 a 5) adicionada ou removida.
+    :param delta: 1 ao adicionar uma avaliação, -1 ao remover.
+    """
+    nota = int(nota)
+    campo_nota = f'avaliacoes_nota_{nota}'
+    nova_soma = F('avaliacoes_soma') + delta * nota
+    novo_total = F('avaliacoes_total') + delta
+    Apartamento.objects.filter(pk=apartamento_id).update(
+        avaliacoes_total=novo_total,
+        avaliacoes_soma=nova_soma,
+        nota_media=Coalesce(Cast(nova_soma, FloatField()) / NullIf(novo_total, 0), Value(0.0)),
+        **{campo_nota: F(campo_nota) + delta},
+    )
+
+
+def recalcular_agregados_avaliacao(apartamento_ids=None):
+    """
+    Recalcula do zero os agregados de avaliação com uma única consulta agrupada.
+
+    :param apartamento_ids: Limita o recálculo a estes apartamentos. Se None, recalcula todos.
+    :return: Quantidade de apartamentos atualizados.
+    """
+    apartamentos = Apartamento.objects.all()
+    avaliacoes = Avaliacao.objects.all()
+    if apartamento_ids is not None:
+        apartamentos = apartamentos.filter(pk__in=apartamento_ids)
+        avaliacoes = avaliacoes.filter(reserva__apartamento_id__in=apartamento_ids)
+
+    zerados = {campo: 0 for campo in Apartamento.CAMPOS_AGREGADOS}
+    apartamentos.update(**zerados)
+
+    agregados = avaliacoes.values('reserva__apartamento_id').annotate(
+        total=Count('pk'), soma=Sum('nota'),
+        **{f'nota_{n}': Count('pk', filter=Q(nota=n)) for n in range(1, 6)},
+    )
+    atualizados = []
+    for linha in agregados.iterator():
+        apartamento = Apartamento(pk=linha['reserva__apartamento_id'])
+        apartamento.avaliacoes_total = linha['total']
+        apartamento.avaliacoes_soma = linha['soma']
+        apartamento.nota_media = linha['soma'] / linha['total']
+        for n in range(1, 6):
+            setattr(apartamento, f'avaliacoes_nota_{n}', linha[f'nota_{n}'])
+        atualizados.append(apartamento)
+    Apartamento.objects.bulk_update(atualizados, Apartamento.CAMPOS_AGREGADOS, batch_size=1000)
+    return len(atualizados)
+
+
+def enfileirar_variantes_imagem(instancia, campo: str):
+    """
+    Agenda a geração das variantes (imagens.VARIANTES_POR_CAMPO) de um arquivo
+    recém-enviado. O redimensionamento é feito pelo comando `manage.py processar_imagens`.
+    """
+    arquivo = getattr(instancia, campo)
+    if not arquivo:
+        return None
+    return ImagemPendente.objects.create(modelo=instancia._meta.label, objeto_id=instancia.pk, campo=campo,
+                                         nome_arquivo=arquivo.name)
+
+
+def _contar_por_apartamento(queryset):
+    """Subconsulta correlacionada (por OuterRef('pk') do apartamento) com a contagem de linhas do queryset."""
+    contagem = queryset.order_by().values('apartamento').annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(contagem), 0)
+
+
+def resumo_painel_proprietario(proprietario: User, dias: int = 30) -> dict:
+    """
+    Calcula os indicadores do painel do proprietário em duas consultas.
+
+    Cada contador é uma subconsulta por apartamento apoiada nos índices de
+    Reserva e OcupacaoDiaria, somada sobre os apartamentos do proprietário.
+    Ocupação e receita olham apenas as próximas `dias` noites confirmadas
+    (o dia do check-out não conta como noite), então não crescem com o histórico.
+
+    A receita usa a mesma regra de preço do orçamento (orcamento.calcular_orcamento:
+    meses fechados pelo preço mensal e adicionais das comodidades), com os preços
+    atuais do apartamento: cada estadia confirmada que toca a janela entra com a
+    fração do seu total correspondente às noites que caem dentro dela.
+
+    :return: dict com apartamentos, pendentes, confirmadas (a partir de hoje),
+             canceladas, noites_ocupadas, receita e taxa_ocupacao (0 a 100).
+    """
+    hoje = timezone.localdate()
+    fim = hoje + timedelta(days=dias - 1)
+    reservas = Reserva.objects.filter(apartamento=OuterRef('pk'))
+    noites = _contar_por_apartamento(OcupacaoDiaria.objects.filter(
+        apartamento=OuterRef('pk'), data__range=(hoje, fim), reserva__status=Reserva.StatusReserva.CONFIRMADA,
+        data__lt=F('reserva__data_checkout')))
+    resumo = Apartamento.objects.filter(proprietario=proprietario).aggregate(
+        apartamentos=Count('pk'),
+        pendentes=Coalesce(Sum(_contar_por_apartamento(reservas.filter(status=Reserva.StatusReserva.PENDENTE))), 0),
+        confirmadas=Coalesce(Sum(_contar_por_apartamento(
+            reservas.filter(status=Reserva.StatusReserva.CONFIRMADA, data_checkout__gte=hoje))), 0),
+        canceladas=Coalesce(Sum(_contar_por_apartamento(reservas.filter(status=Reserva.StatusReserva.CANCELADA))), 0),
+        noites_ocupadas=Coalesce(Sum(noites), 0),
+    )
+    adicionais = (ApartamentoComodidade.objects.filter(apartamento=OuterRef('apartamento')).order_by()
+                  .values('apartamento').annotate(soma=Sum('preco_adicional')).values('soma'))
+    estadias = (Reserva.objects.filter(apartamento__proprietario=proprietario, status=Reserva.StatusReserva.CONFIRMADA,
+                                       data_checkin__lte=fim, data_checkout__gt=hoje)
+                .annotate(adicionais=Subquery(adicionais))
+                .values_list('apartamento__preco_diaria', 'apartamento__preco_mensal', 'adicionais',
+                             'data_checkin', 'data_checkout'))
+    receita = Decimal('0')
+    for preco_diaria, preco_mensal, adicionais_por_diaria, data_checkin, data_checkout in estadias:
+        noites_estadia = (data_checkout - data_checkin).days
+        noites_na_janela = (min(data_checkout, fim + timedelta(days=1)) - max(data_checkin, hoje)).days
+        orcamento = calcular_orcamento(preco_diaria, preco_mensal, adicionais_por_diaria, noites_estadia)
+        receita += orcamento.total * noites_na_janela / noites_estadia
+    resumo['receita'] = receita.quantize(Decimal('0.01'))
+    capacidade = resumo['apartamentos'] * dias
+    resumo['taxa_ocupacao'] = round(100 * resumo['noites_ocupadas'] / capacidade, 1) if capacidade else 0
+    resumo['dias'] = dias
+    return resumo
+
+
+def reservas_na_janela(reservas, inicio, fim):
+    """
+    Restringe as reservas às que tocam a janela [inicio, fim) pedida pelo calendário.
+    Não filtra por status: os validadores de cache precisam enxergar as canceladas também.
+    """
+    return reservas.filter(data_checkin__lt=fim, data_checkout__gte=inicio)
+
+
+def validadores_calendario(reservas, *partes_chave):
+    """
+    Calcula (etag, last_modified) de um feed de calendário em uma única consulta.
+
+    Considera todas as reservas da janela, inclusive canceladas: cancelar atualiza
+    data_atualizacao, e a contagem muda quando uma reserva é removida, então
+    qualquer alteração que afete o feed muda o ETag.
+    """
+    resumo = reservas.order_by().aggregate(ultima=Max('data_atualizacao'), total=Count('pk'))
+    ultima = resumo['ultima']
+    chave = '|'.join(str(parte) for parte in (*partes_chave, ultima and ultima.isoformat(), resumo['total']))
+    return hashlib.md5(chave.encode()).hexdigest(), ultima
@@ -1,16 +1,304 @@
 # apartamentos/signals.py
-from django.db.models.signals import post_save
-from django.contrib.auth.models import User
+from functools import partial
+
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.contrib.auth.models import Group, Permission, User
+from django.db import transaction
 from django.dispatch import receiver
-from .models import Perfil
+from .models import Perfil, Predio, Apartamento, Comodidade, ApartamentoComodidade, Reserva, Avaliacao, FotoApartamento
+from .imagens import VARIANTES_POR_CAMPO, apagar_variantes
+from .utils import chave_login
+from .cache import (
+    invalidar_catalogo_cidades, invalidar_catalogo_comodidades, invalidar_apartamento, invalidar_usuario,
+    invalidar_permissoes, invalidar_busca
+)
+from .services import (
+    atualizar_ocupacao_reserva, registrar_avaliacao_nos_agregados, recalcular_agregados_avaliacao,
+    enfileirar_variantes_imagem, atualizar_busca_do_predio
+)
+
+# Campos da Reserva que mudam a disponibilidade (e portanto os resultados das buscas por data)
+CAMPOS_DISPONIBILIDADE = {'status', 'data_checkin', 'data_checkout', 'apartamento'}
+
+
+def _apos_commit(invalidar, *args, **kwargs):
+    # Dentro da transação, quem lesse entre a troca da versão e o commit guardaria os dados
+    # antigos sob a versão nova; fora de uma transação, roda na hora.
+    transaction.on_commit(partial(invalidar, *args, **kwargs))
+
 
 @receiver(post_save, sender=User)
-def criar_ou_atualizar_perfil_usuario(sender, instance, created, **kwargs):
+def criar_ou_atualizar_perfil_usuario(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Garante que um Perfil seja criado para cada novo User e que as chaves de
+    login do perfil acompanhem o username/e-mail, escrevendo só o que mudou.
+    """
+    perfil_carregado = User.perfil.is_cached(instance)
+    if created:
+        # Um perfil montado antes do user.save() (ex.: cadastro com o cargo escolhido) é gravado aqui, no INSERT
+        perfil = instance.perfil if perfil_carregado else Perfil(usuario=instance)
+        perfil.usuario = instance
+        perfil.atualizar_chaves_login(instance)
+        perfil.save()
+        instance.perfil = perfil
+    elif perfil_carregado:
+        # Perfil já em memória (ex.: alterado junto com o usuário): salva só os campos alterados, se houver
+        instance.perfil.atualizar_chaves_login(instance)
+        instance.perfil.save()
+    elif update_fields is None or {'username', 'email'} & set(update_fields):
+        # Sem buscar o perfil: um UPDATE condicional que não escreve nada se as chaves já estiverem certas.
+        # O update_last_login de cada login (update_fields={'last_login'}) nem chega aqui.
+        chave_username, chave_email = chave_login(instance.username), chave_login(instance.email)
+        Perfil.objects.filter(usuario=instance).exclude(chave_username=chave_username, chave_email=chave_email) \
+            .update(chave_username=chave_username, chave_email=chave_email)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidar_usuario_em_cache(sender, instance, **kwargs):
+    """O registro em cache do EmailBackend.get_user não pode sobreviver a uma alteração do usuário."""
+    _apos_commit(invalidar_usuario, instance.pk)
+
+
+@receiver(post_save, sender=User)
+def invalidar_permissoes_ao_salvar_usuario(sender, instance, created=False, update_fields=None, **kwargs):
+    # is_active/is_superuser mudam o conjunto de permissões; o update_last_login de cada login não
+    if not created and not (update_fields is not None and set(update_fields) <= {'last_login'}):
+        _apos_commit(invalidar_permissoes, instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def invalidar_permissoes_ao_mudar_grupos_do_usuario(sender, instance, action, reverse, pk_set, **kwargs):
+    """Entrada/saída de grupos ou permissões diretas: invalida só os usuários afetados."""
+    if not reverse:
+        # user.groups.add(...), user.user_permissions.clear(), ...
+        usuarios_ids = [instance.pk] if action in ('post_add', 'post_remove', 'post_clear') else []
+    elif action in ('post_add', 'post_remove'):
+        # group.user_set.add(...): pk_set são os usuários
+        usuarios_ids = pk_set or ()
+    elif action == 'pre_clear':
+        # group.user_set.clear(): os membros só são conhecidos antes de limpar
+        usuarios_ids = list(instance.user_set.values_list('pk', flat=True))
+    else:
+        usuarios_ids = []
+    for usuario_id in usuarios_ids:
+        _apos_commit(invalidar_permissoes, usuario_id)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidar_permissoes_ao_mudar_permissoes_do_grupo(sender, action, **kwargs):
+    # Mudança nas permissões de um grupo (ex.: criar_grupos) vale para todos os seus membros
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        _apos_commit(invalidar_permissoes)
+
+
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+def invalidar_permissoes_ao_alterar_grupo_ou_permissao(sender, **kwargs):
+    _apos_commit(invalidar_permissoes)
+
+@receiver(post_save, sender=Reserva)
+def atualizar_indice_disponibilidade(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Mantém o índice de disponibilidade em dia sempre que uma Reserva é
+    criada ou tem seu status/datas alterados.
+    """
+    if raw:
+        return
+    if update_fields and not {'status', 'data_checkin', 'data_checkout'} & set(update_fields):
+        return
+    atualizar_ocupacao_reserva(instance)
+
+
+
+@receiver(pre_save, sender=Avaliacao)
+def guardar_apartamento_anterior_da_avaliacao(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Avaliação que muda de reserva pode mudar de apartamento: guarda o apartamento
+    (e a cidade) gravados, para refazer os agregados e as buscas dos dois.
+    """
+    instance._apartamento_anterior_id = instance._cidade_anterior = None
+    if raw or instance._state.adding or (update_fields is not None and 'reserva' not in update_fields):
+        return
+    # Só encontra algo se a reserva gravada for de outro apartamento
+    anterior = Avaliacao.objects.filter(pk=instance.pk).exclude(
+        reserva__apartamento_id=instance.reserva.apartamento_id).values_list(
+        'reserva__apartamento_id', 'reserva__apartamento__predio__cidade_normalizada').first()
+    if anterior:
+        instance._apartamento_anterior_id, instance._cidade_anterior = anterior
+
+
+@receiver(post_save, sender=Avaliacao)
+def atualizar_agregados_ao_salvar_avaliacao(sender, instance, created, raw=False, **kwargs):
     """
-    Garante que um Perfil seja criado para cada novo User
-    e que seja salvo sempre que o User for salvo.
+    Soma a nova avaliação aos agregados do apartamento. Se uma avaliação
+    existente foi editada, recalcula os agregados apenas daquele apartamento
+    (e do anterior, se ela mudou de apartamento).
     """
+    if raw:
+        return
+    apartamento_id = instance.reserva.apartamento_id
     if created:
-        Perfil.objects.create(usuario=instance)
-    # Garante que o perfil seja salvo junto com o usuário
-    instance.perfil.save()
\ No newline at end of file
+        registrar_avaliacao_nos_agregados(apartamento_id, instance.nota)
+    else:
+        anterior_id = getattr(instance, '_apartamento_anterior_id', None)
+        recalcular_agregados_avaliacao(apartamento_ids=[apartamento_id, *([anterior_id] if anterior_id else [])])
+
+
+@receiver(post_delete, sender=Avaliacao)
+def atualizar_agregados_ao_remover_avaliacao(sender, instance, **kwargs):
+    """Retira a avaliação removida dos agregados do apartamento."""
+    apartamento_id = Reserva.objects.filter(pk=instance.reserva_id).values_list('apartamento_id', flat=True).first()
+    if apartamento_id:
+        registrar_avaliacao_nos_agregados(apartamento_id, instance.nota, delta=-1)
+
+
+@receiver(post_save, sender=Predio)
+@receiver(post_delete, sender=Predio)
+def invalidar_cidades_ao_alterar_predio(sender, **kwargs):
+    """O catálogo de cidades em cache é refeito na próxima consulta, e as buscas em cache também."""
+    _apos_commit(invalidar_catalogo_cidades)
+    # Um prédio pode ter trocado de cidade: invalida as buscas de todas as cidades
+    _apos_commit(invalidar_busca, estrutura=True)
+
+
+@receiver(post_save, sender=Comodidade)
+@receiver(post_delete, sender=Comodidade)
+def invalidar_comodidades_ao_alterar_comodidade(sender, **kwargs):
+    """O catálogo de comodidades (filtros e facetas da lista) é refeito na próxima consulta."""
+    _apos_commit(invalidar_catalogo_comodidades)
+    _apos_commit(invalidar_busca, estrutura=True)
+
+
+@receiver(post_save, sender=Predio)
+def atualizar_busca_ao_alterar_predio(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Nome, endereço e cidade do prédio fazem parte do documento de busca das suas unidades."""
+    if raw or created:
+        return
+    if update_fields is not None and not set(update_fields) & set(Apartamento.CAMPOS_BUSCA_PREDIO):
+        return
+    atualizar_busca_do_predio(instance)
+
+
+@receiver(pre_save, sender=FotoApartamento)
+@receiver(pre_save, sender=Predio)
+@receiver(pre_save, sender=Perfil)
+def marcar_imagem_enviada(sender, instance, raw=False, **kwargs):
+    """
+    Um arquivo ainda não gravado no storage (upload novo) invalida as variantes
+    atuais; o post_save agenda a geração das novas depois que o arquivo for salvo.
+    """
+    if raw:
+        return
+    instance._campos_imagem_novos = []
+    for (modelo, campo), _ in VARIANTES_POR_CAMPO.items():
+        if modelo != sender._meta.label:
+            continue
+        arquivo = getattr(instance, campo)
+        if arquivo and not arquivo._committed:
+            instance.variantes_prontas = False
+            instance._campos_imagem_novos.append(campo)
+        elif not arquivo and instance.variantes_arquivos:
+            # Imagem removida: as variantes saem junto (o processar_imagens só troca as de um upload novo)
+            _apagar_variantes_apos_commit(arquivo.storage, instance.variantes_arquivos)
+            instance.variantes_prontas, instance.variantes_arquivos = False, {}
+
+
+def _apagar_variantes_apos_commit(storage, arquivos):
+    nomes = list(arquivos.values())
+    transaction.on_commit(lambda: apagar_variantes(storage, nomes))
+
+
+@receiver(post_delete, sender=FotoApartamento)
+@receiver(post_delete, sender=Predio)
+@receiver(post_delete, sender=Perfil)
+def apagar_variantes_imagem(sender, instance, **kwargs):
+    """O django-cleanup apaga só o arquivo original; as variantes geradas são apagadas aqui."""
+    if instance.variantes_arquivos:
+        campo = next(campo for modelo, campo in VARIANTES_POR_CAMPO if modelo == sender._meta.label)
+        _apagar_variantes_apos_commit(getattr(instance, campo).storage, instance.variantes_arquivos)
+
+
+@receiver(post_save, sender=FotoApartamento)
+@receiver(post_save, sender=Predio)
+@receiver(post_save, sender=Perfil)
+def agendar_variantes_imagem(sender, instance, raw=False, **kwargs):
+    """Coloca os uploads novos na fila de variantes, fora do caminho da requisição."""
+    for campo in getattr(instance, '_campos_imagem_novos', ()):
+        enfileirar_variantes_imagem(instance, campo)
+    instance._campos_imagem_novos = []
+
+
+@receiver(post_save, sender=Apartamento)
+@receiver(post_delete, sender=Apartamento)
+@receiver(post_save, sender=FotoApartamento)
+@receiver(post_delete, sender=FotoApartamento)
+@receiver(post_save, sender=ApartamentoComodidade)
+@receiver(post_delete, sender=ApartamentoComodidade)
+@receiver(post_save, sender=Reserva)
+@receiver(post_delete, sender=Reserva)
+def invalidar_fragmentos_do_apartamento(sender, instance, raw=False, **kwargs):
+    """Troca a versão dos fragmentos em cache da página de detalhe do apartamento afetado."""
+    if raw:
+        return
+    _apos_commit(invalidar_apartamento, instance.pk if sender is Apartamento else instance.apartamento_id)
+
+
+@receiver(pre_save, sender=Apartamento)
+def guardar_cidade_anterior_do_apartamento(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Unidade que muda de prédio pode mudar de cidade: as buscas da cidade antiga também precisam mudar."""
+    instance._cidade_anterior = None
+    if raw or instance._state.adding or (update_fields is not None and 'predio' not in update_fields):
+        return
+    # Só encontra algo se o prédio gravado for outro
+    instance._cidade_anterior = Predio.objects.filter(apartamentos=instance.pk).exclude(pk=instance.predio_id) \
+        .values_list('cidade_normalizada', flat=True).first()
+
+
+@receiver(post_save, sender=Apartamento)
+@receiver(post_delete, sender=Apartamento)
+@receiver(post_save, sender=FotoApartamento)
+@receiver(post_delete, sender=FotoApartamento)
+@receiver(post_save, sender=ApartamentoComodidade)
+@receiver(post_delete, sender=ApartamentoComodidade)
+@receiver(post_save, sender=Reserva)
+@receiver(post_delete, sender=Reserva)
+@receiver(post_save, sender=Avaliacao)
+@receiver(post_delete, sender=Avaliacao)
+def invalidar_buscas_do_apartamento(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Troca a versão das buscas em cache da cidade do apartamento afetado (e das buscas
+    sem cidade). Reservas só contam quando mudam a disponibilidade.
+    """
+    if raw:
+        return
+    if sender is Reserva and update_fields is not None and not set(update_fields) & CAMPOS_DISPONIBILIDADE:
+        return
+    if sender is Apartamento:
+        apartamento = instance
+    elif sender is Avaliacao:
+        apartamento = None
+    else:
+        apartamento = instance.apartamento if type(instance).apartamento.is_cached(instance) else None
+    if apartamento is not None and Apartamento.predio.is_cached(apartamento):
+        cidade = apartamento.predio.cidade_normalizada
+    elif sender is Avaliacao:
+        cidade = Predio.objects.filter(apartamentos__reservas=instance.reserva_id) \
+            .values_list('cidade_normalizada', flat=True).first()
+    else:
+        apartamento_id = instance.pk if sender is Apartamento else instance.apartamento_id
+        cidade = Predio.objects.filter(apartamentos=apartamento_id).values_list('cidade_normalizada', flat=True).first()
+    _apos_commit(invalidar_busca, cidade, getattr(instance, '_cidade_anterior', None))
+
+
+@receiver(post_save, sender=Avaliacao)
+@receiver(post_delete, sender=Avaliacao)
+def invalidar_fragmentos_ao_alterar_avaliacao(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    apartamento_id = Reserva.objects.filter(pk=instance.reserva_id).values_list('apartamento_id', flat=True).first()
+    for afetado in (apartamento_id, getattr(instance, '_apartamento_anterior_id', None)):
+        if afetado:
+            _apos_commit(invalidar_apartamento, afetado)
@@ -0,0 +1,85 @@
+"""
+Teste de carga do criar_reserva_service: várias threads disputam as mesmas
+datas dos mesmos apartamentos. Nenhuma reserva bloqueante pode se sobrepor a
+outra, e a vazão alcançada (reservas por segundo) aparece no resumo do pytest.
+"""
+import random
+import threading
+import time
+from datetime import timedelta
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.utils import timezone
+
+from .models import Predio, Apartamento, Reserva
+from .services import criar_reserva_service
+
+THREADS = 8
+PEDIDOS_POR_THREAD = 25
+APARTAMENTOS = 3
+JANELA_DIAS = 60
+
+
+def pedir_reservas(semente, apartamentos, hospede, inicio, resultados, barreira):
+    rng = random.Random(semente)
+    criadas = conflitos = erros = 0
+    barreira.wait()
+    try:
+        for _ in range(PEDIDOS_POR_THREAD):
+            checkin = inicio + timedelta(days=rng.randrange(JANELA_DIAS))
+            checkout = checkin + timedelta(days=rng.randint(1, 5))
+            try:
+                criar_reserva_service(rng.choice(apartamentos), hospede, checkin, checkout)
+                criadas += 1
+            except ValidationError:
+                conflitos += 1
+            except Exception:
+                erros += 1
+    finally:
+        connection.close()
+    resultados.append((criadas, conflitos, erros))
+
+
+@pytest.mark.django_db(transaction=True)
+def test_reservas_simultaneas_nunca_se_sobrepoem(request, record_property):
+    proprietario = User.objects.create_user(username='dono_concorrencia')
+    predio = Predio.objects.create(nome='Prédio Concorrido', proprietario=proprietario, cidade='Recife')
+    apartamentos = [Apartamento.objects.create(titulo=f'Apto {i}', predio=predio, proprietario=proprietario,
+                                               area_m2=40, preco_diaria=100) for i in range(APARTAMENTOS)]
+    hospedes = [User.objects.create_user(username=f'hospede_concorrencia{i}') for i in range(THREADS)]
+    inicio = timezone.localdate() + timedelta(days=1)
+
+    resultados, barreira = [], threading.Barrier(THREADS)
+    threads = [threading.Thread(target=pedir_reservas, args=(i, apartamentos, hospedes[i], inicio, resultados, barreira))
+               for i in range(THREADS)]
+    comeco = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duracao = time.perf_counter() - comeco
+
+    criadas, conflitos, erros = (sum(coluna) for coluna in zip(*resultados))
+    assert erros == 0
+    assert criadas + conflitos == THREADS * PEDIDOS_POR_THREAD
+    assert Reserva.objects.count() == criadas > 0
+
+    for apartamento in apartamentos:
+        periodos = list(Reserva.objects.filter(apartamento=apartamento, status__in=Reserva.STATUS_BLOQUEANTES)
+                        .order_by('data_checkin').values_list('data_checkin', 'data_checkout'))
+        for (_, checkout_anterior), (checkin, _) in zip(periodos, periodos[1:]):
+            # Mesma regra do ReservaForm: os dias de check-in e check-out contam como ocupados
+            assert checkin > checkout_anterior, f'Reserva dupla em {apartamento}: {periodos}'
+
+    vazao = (criadas + conflitos) / duracao
+    record_property('reservas_por_segundo', round(criadas / duracao, 1))
+    relator = request.config.pluginmanager.get_plugin('terminalreporter')
+    captura = request.config.pluginmanager.get_plugin('capturemanager')
+    if relator and captura:
+        with captura.global_and_fixture_disabled():
+            relator.write_line('')
+            relator.write_line(f'Reservas simultâneas: {THREADS} threads, {criadas} criadas, {conflitos} conflitos '
+                               f'em {duracao:.2f}s ({criadas / duracao:.1f} reservas/s, {vazao:.1f} pedidos/s)')
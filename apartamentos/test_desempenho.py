@@ -0,0 +1,228 @@
+"""
+Orçamento de desempenho das rotas de apartamentos/urls.py.
+
+Cada rota é chamada com duas massas de dados de tamanhos diferentes. O teste
+falha se o número de consultas SQL crescer com a quantidade de registros
+(sinal de N+1 em view ou template) ou se passar do orçamento da rota.
+O tempo de cada chamada é registrado (record_property) e exibido no resumo.
+"""
+import io
+import time
+from datetime import timedelta
+
+import pytest
+from django.contrib.auth.models import User, Group
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .ical import TIPO_APARTAMENTO, TIPO_PROPRIETARIO, url_ics
+from .models import (
+    Predio, Apartamento, Comodidade, ApartamentoComodidade, FotoApartamento, Reserva, Avaliacao
+)
+
+# Máximo de consultas SQL por rota (inclui sessão, usuário e permissões).
+# Nas listas, as facetas são duas consultas: a agregada e o GROUP BY por comodidade.
+ORCAMENTO_CONSULTAS = {
+    'lista_apartamentos': 5,
+    'lista_apartamentos_por_datas': 7,  # + catálogo de cidades frio (cidade da chave do cache da busca)
+    'lista_apartamentos_por_texto': 5,
+    'lista_apartamentos_por_raio': 5,
+    'lista_apartamentos_mapa': 1,
+    'autocompletar_cidades': 1,
+    'detalhe_apartamento': 9,
+    'lista_predios': 2,
+    'detalhe_predio': 6,
+    'painel_proprietario': 11,  # + estadias confirmadas da janela (receita pela regra do orçamento)
+    'minhas_reservas': 5,
+    'detalhe_reserva': 7,
+    'reserva_calendario_data': 6,
+    'calendario_portfolio_data': 6,
+    'calendario_ics_apartamento': 3,
+    'calendario_ics_proprietario': 3,
+    'aprovar_reserva': 11,  # + status relido com a linha bloqueada
+    'recusar_reserva': 8,
+}
+
+RESULTADOS = {}
+ESCRITAS = {}
+
+
+def semear(escala, prefixo):
+    """
+    Cria uma massa de dados proporcional à escala: prédios, unidades com fotos e
+    comodidades, reservas em todos os status e avaliações.
+    """
+    proprietario = User.objects.create_user(username=f'{prefixo}-dono', password='senha')
+    proprietario.groups.add(Group.objects.get(name='Proprietários'))
+    hospedes = [User.objects.create_user(username=f'{prefixo}-hospede{i}', password='senha') for i in range(escala)]
+    for hospede in hospedes:
+        hospede.groups.add(Group.objects.get(name='Clientes'))
+    comodidades = [Comodidade.objects.create(nome=f'{prefixo} comodidade {i}') for i in range(escala + 1)]
+
+    hoje = timezone.localdate()
+    status = [Reserva.StatusReserva.PENDENTE, Reserva.StatusReserva.CONFIRMADA, Reserva.StatusReserva.CANCELADA]
+    apartamentos = []
+    for p in range(escala):
+        predio = Predio.objects.create(nome=f'Prédio {p}', proprietario=proprietario, cidade=f'Cidade {prefixo}',
+                                       estado='PE', cep=f'50{p % 1000:03d}-000')
+        for a in range(escala):
+            apartamento = Apartamento.objects.create(titulo=f'Apto {p}-{a}', predio=predio, proprietario=proprietario,
+                                                     area_m2=50, preco_diaria=150)
+            apartamentos.append(apartamento)
+            for c in comodidades:
+                ApartamentoComodidade.objects.create(apartamento=apartamento, comodidade=c, preco_adicional=10)
+            FotoApartamento.objects.create(apartamento=apartamento, imagem=f'apartamentos/fotos/{p}-{a}.jpg')
+            FotoApartamento.objects.create(apartamento=apartamento, imagem=f'apartamentos/fotos/{p}-{a}-capa.jpg',
+                                           principal=True)
+            for i, hospede in enumerate(hospedes):
+                inicio = hoje + timedelta(days=10 * i + a)
+                Reserva.objects.create(apartamento=apartamento, hospede=hospede, data_checkin=inicio,
+                                       data_checkout=inicio + timedelta(days=3), status=status[(i + a) % len(status)])
+                passada = Reserva.objects.create(apartamento=apartamento, hospede=hospede,
+                                                 data_checkin=hoje - timedelta(days=30 + 5 * i),
+                                                 data_checkout=hoje - timedelta(days=28 + 5 * i),
+                                                 status=Reserva.StatusReserva.CONFIRMADA)
+                Avaliacao.objects.create(reserva=passada, nota=1 + (i + a) % 5, comentario='Boa estadia')
+    return {'proprietario': proprietario, 'hospede': hospedes[0], 'apartamento': apartamentos[0],
+            'predio': apartamentos[0].predio, 'cidade': f'Cidade {prefixo}'}
+
+
+@pytest.fixture(scope='module')
+def cenarios(django_db_setup, django_db_blocker):
+    """
+    Semeia uma massa pequena e uma grande uma única vez para o módulo inteiro.
+    Cada teste roda na sua própria transação, então aprovar/recusar não vazam.
+    """
+    with django_db_blocker.unblock():
+        call_command('criar_grupos', stdout=io.StringIO())
+        dados = {'pequena': semear(escala=2, prefixo='p'), 'grande': semear(escala=4, prefixo='g')}
+    yield dados
+    with django_db_blocker.unblock():
+        Predio.objects.all().delete()
+        User.objects.all().delete()
+        Comodidade.objects.all().delete()
+        Group.objects.all().delete()
+
+
+def rotas(cenario):
+    """Retorna {nome: (método, url, usuário logado)} para cada rota do app."""
+    apartamento, predio = cenario['apartamento'], cenario['predio']
+    proprietario, hospede = cenario['proprietario'], cenario['hospede']
+    pendente = Reserva.objects.filter(apartamento__proprietario=proprietario,
+                                      status=Reserva.StatusReserva.PENDENTE).order_by('pk')
+    reserva_hospede = Reserva.objects.filter(hospede=hospede).order_by('pk').first()
+    hoje = timezone.localdate()
+    lista = reverse('apartamentos:lista_apartamentos')
+    busca_datas = (f"{reverse('apartamentos:lista_apartamentos')}?predio__cidade={cenario['cidade']}"
+                   f"&data_checkin={hoje + timedelta(days=5)}&data_checkout={hoje + timedelta(days=7)}")
+    return {
+        'lista_apartamentos': ('get', reverse('apartamentos:lista_apartamentos'), None),
+        'lista_apartamentos_por_datas': ('get', busca_datas, None),
+        'lista_apartamentos_por_texto': ('get', f"{reverse('apartamentos:lista_apartamentos')}?q=apto+predio", None),
+        'lista_apartamentos_por_raio': ('get', f"{lista}?lat=-8.05&lng=-34.88&raio=10", None),
+        'lista_apartamentos_mapa': ('get', f"{lista}?formato=mapa&sul=-8.2&oeste=-35&norte=-7.9&leste=-34.7", None),
+        'autocompletar_cidades': ('get', f"{reverse('apartamentos:autocompletar_cidades')}?q=cid", None),
+        'detalhe_apartamento': ('get', reverse('apartamentos:detalhe_apartamento', args=[apartamento.pk]), hospede),
+        'lista_predios': ('get', reverse('apartamentos:lista_predios'), None),
+        'detalhe_predio': ('get', reverse('apartamentos:detalhe_predio', args=[predio.pk]), proprietario),
+        'painel_proprietario': ('get', reverse('apartamentos:painel_proprietario'), proprietario),
+        'minhas_reservas': ('get', reverse('apartamentos:minhas_reservas'), hospede),
+        'detalhe_reserva': ('get', reverse('apartamentos:detalhe_reserva', args=[reserva_hospede.pk]), hospede),
+        'reserva_calendario_data': ('get', reverse('apartamentos:reserva_calendario_data', args=[apartamento.pk]),
+                                    proprietario),
+        'calendario_portfolio_data': ('get', reverse('apartamentos:calendario_portfolio_data'), proprietario),
+        'calendario_ics_apartamento': ('get', url_ics(TIPO_APARTAMENTO, apartamento.pk), None),
+        'calendario_ics_proprietario': ('get', url_ics(TIPO_PROPRIETARIO, proprietario.pk), None),
+        'aprovar_reserva': ('post', reverse('apartamentos:aprovar_reserva', args=[pendente[0].pk]), proprietario),
+        'recusar_reserva': ('post', reverse('apartamentos:recusar_reserva', args=[pendente[1].pk]), proprietario),
+    }
+
+
+def medir(client, nome, cenario):
+    metodo, url, usuario = rotas(cenario)[nome]
+    client.logout()
+    cache.clear()  # Mede sempre o caminho frio, com o cache vazio
+    if usuario:
+        client.force_login(usuario)
+    with CaptureQueriesContext(connection) as consultas:
+        inicio = time.perf_counter()
+        response = getattr(client, metodo)(url)
+        if response.streaming:
+            b''.join(response.streaming_content)  # As consultas do streaming rodam ao consumir o conteúdo
+        duracao_ms = (time.perf_counter() - inicio) * 1000
+    assert response.status_code == 200, f'{nome} retornou {response.status_code}'
+    return len(consultas), duracao_ms
+
+
+@pytest.fixture(scope='module', autouse=True)
+def resumo_tempos(request):
+    yield
+    relator = request.config.pluginmanager.get_plugin('terminalreporter')
+    captura = request.config.pluginmanager.get_plugin('capturemanager')
+    if relator and captura and (RESULTADOS or ESCRITAS):
+        with captura.global_and_fixture_disabled():
+            relator.write_line('')
+            if RESULTADOS:
+                relator.write_line('Consultas e tempo por rota (massa pequena -> massa grande):')
+            for nome, (consultas, pequena, grande) in sorted(RESULTADOS.items()):
+                relator.write_line(f'  {nome:32} {consultas:3} consultas {pequena:8.1f} ms -> {grande:8.1f} ms')
+            if ESCRITAS:
+                relator.write_line('Escritas por fluxo de conta:')
+            for nome, (escritas, comandos) in sorted(ESCRITAS.items()):
+                relator.write_line(f'  {nome:32} {escritas:3} escritas em {comandos} comandos')
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('nome', sorted(ORCAMENTO_CONSULTAS))
+def test_consultas_por_rota_nao_crescem_com_os_dados(client, cenarios, nome, record_property):
+    consultas_pequena, tempo_pequena = medir(client, nome, cenarios['pequena'])
+    consultas_grande, tempo_grande = medir(client, nome, cenarios['grande'])
+
+    RESULTADOS[nome] = (consultas_grande, tempo_pequena, tempo_grande)
+    record_property('consultas', consultas_grande)
+    record_property('tempo_ms', round(tempo_grande, 1))
+
+    assert consultas_grande == consultas_pequena, (
+        f'{nome}: {consultas_pequena} consultas com a massa pequena e {consultas_grande} com a grande (N+1?)')
+    assert consultas_grande <= ORCAMENTO_CONSULTAS[nome], (
+        f'{nome}: {consultas_grande} consultas, orçamento de {ORCAMENTO_CONSULTAS[nome]}')
+
+
+# Máximo de comandos de escrita (INSERT/UPDATE/DELETE) por fluxo de conta. Eram 4 e 4: o login regravava
+# o Perfil inteiro a cada last_login, e o cadastro fazia um UPDATE extra do Perfil depois do INSERT.
+ORCAMENTO_ESCRITAS = {
+    'login': 3,  # sessão (INSERT + UPDATE) e last_login
+    'cadastro': 3,  # User, Perfil e o vínculo com o grupo
+}
+
+
+def contar_escritas(consultas):
+    return sum(c['sql'].lstrip().split(' ', 1)[0].upper() in ('INSERT', 'UPDATE', 'DELETE') for c in consultas)
+
+
+@pytest.mark.django_db
+def test_escritas_por_login_e_cadastro(client, record_property):
+    call_command('criar_grupos', stdout=io.StringIO())
+    User.objects.create_user(username='bench-login', email='bench@example.com', password='senha-bench-1')
+    fluxos = {
+        'login': lambda: client.post(reverse('login'), {'username': 'bench@example.com', 'password': 'senha-bench-1'}),
+        'cadastro': lambda: client.post(reverse('apartamentos:signup'), {
+            'username': 'bench-novo', 'email': 'novo@example.com', 'first_name': 'Novo', 'last_name': 'Usuário',
+            'password1': 'Senha-Bench-123', 'password2': 'Senha-Bench-123', 'papel': 'PROPRIETARIO'}),
+    }
+    for nome, fluxo in fluxos.items():
+        client.logout()
+        with CaptureQueriesContext(connection) as consultas:
+            response = fluxo()
+        assert response.status_code == 302, f'{nome} retornou {response.status_code}'
+        escritas = contar_escritas(consultas)
+        ESCRITAS[nome] = (escritas, len(consultas))
+        record_property(f'escritas_{nome}', escritas)
+        assert escritas <= ORCAMENTO_ESCRITAS[nome], f'{nome}: {escritas} escritas, orçamento de {ORCAMENTO_ESCRITAS[nome]}'
+
+    novo = User.objects.get(username='bench-novo')
+    assert novo.perfil.cargo == 'PROPRIETARIO' and novo.groups.filter(name='Proprietários').exists()
@@ -1,14 +1,52 @@
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from PIL import Image
+
 import pytest
-from django.contrib.auth.models import User
-from django.urls import reverse
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.contrib.auth.models import Group, Permission, User
+from django.core import mail
+from django.core.management import CommandError, call_command
+from django.core.exceptions import ValidationError
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, connections, transaction
+from django.test import AsyncClient, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
 
 # Modelos e Forms que já estávamos usando
-from .models import Predio, Apartamento, Reserva, Avaliacao
-from .forms import ReservaForm
+from .models import (
+    Predio, Apartamento, Reserva, Avaliacao, OcupacaoDiaria, EmailPendente, FotoApartamento, Perfil, ImagemPendente,
+    Comodidade, ApartamentoComodidade
+)
+from .backends import EmailBackend
+from .cache import invalidar_busca, obter_resultado_busca, versao_apartamento
+from .forms import PredioForm, ReservaForm
+from .geo import celula_geo, faixas_da_caixa
+from .orcamento import orcar_estadias
+from .paginacao import PROXIMA, codificar_cursor
+from .filters import contar_facetas
+from .ical import TIPO_APARTAMENTO, TIPO_PROPRIETARIO, url_ics
+from .roteamento import COOKIE_LEITURA_PROPRIA
+from .estaticos import WhiteNoiseMiddleware, remover_source_maps
 
 # --- AQUI ESTÁ A LINHA QUE FALTAVA ---
 # Importamos as funções de serviço que queremos testar.
-from .services import aprovar_reserva_service, recusar_reserva_service
+from .services import (
+    aprovar_reserva_service, recusar_reserva_service, recalcular_agregados_avaliacao, criar_reserva_service,
+    resumo_painel_proprietario
+)
 
 
 @pytest.fixture
@@ -107,6 +145,30 @@ def test_aprovar_reserva_service_falha_permissao(cenario_reserva):
         aprovar_reserva_service(reserva=reserva, usuario=outro_usuario)
 
 
+
+@pytest.mark.django_db
+def test_aprovar_reserva_so_pendente_e_sem_conflito(client, cenario_reserva):
+    apartamento, hospede = cenario_reserva['apartamento'], cenario_reserva['hospede']
+    hoje = timezone.localdate()
+    cancelada = criar_reserva_service(apartamento, hospede, hoje + timedelta(days=10), hoje + timedelta(days=12))
+    recusar_reserva_service(cancelada, cenario_reserva['proprietario'])
+    pendente = criar_reserva_service(apartamento, hospede, hoje + timedelta(days=11), hoje + timedelta(days=13))
+    client.force_login(cenario_reserva['proprietario'])
+
+    # Cancelada não volta a ser aprovada, mesmo que os dias estejam livres
+    response = client.post(reverse('apartamentos:aprovar_reserva', args=[cancelada.pk]))
+    assert response.status_code == 409 and response.json()['status'] == 'error'
+    # Reservas sobrepostas de antes da constraint: a segunda aprovação encontra os dias ocupados
+    Reserva.objects.filter(pk=cancelada.pk).update(status=Reserva.StatusReserva.PENDENTE)
+    response = client.post(reverse('apartamentos:aprovar_reserva', args=[cancelada.pk]))
+    assert response.status_code == 409 and 'Conflito de datas' in response.json()['message']
+    cancelada.refresh_from_db()
+    assert cancelada.status == Reserva.StatusReserva.PENDENTE
+
+    assert client.post(reverse('apartamentos:aprovar_reserva', args=[pendente.pk])).status_code == 200
+    assert client.post(reverse('apartamentos:aprovar_reserva', args=[pendente.pk])).status_code == 409
+
+
 @pytest.mark.django_db
 def test_recusar_reserva_service_sucesso(cenario_reserva):
     reserva = Reserva.objects.create(
@@ -132,4 +194,1004 @@ def test_recusar_reserva_service_falha_permissao(cenario_reserva):
         data_checkout='2025-12-05'
     )
     with pytest.raises(PermissionError, match="Usuário não tem permissão para recusar esta reserva."):
-        recusar_reserva_service(reserva=reserva, usuario=outro_usuario)
\ No newline at end of file
+        recusar_reserva_service(reserva=reserva, usuario=outro_usuario)
+
+
+@pytest.mark.django_db
+def test_indice_disponibilidade_acompanha_status_da_reserva(cenario_reserva):
+    reserva = Reserva.objects.create(
+        apartamento=cenario_reserva['apartamento'],
+        hospede=cenario_reserva['hospede'],
+        data_checkin='2026-01-10',
+        data_checkout='2026-01-13'
+    )
+    assert OcupacaoDiaria.objects.filter(reserva=reserva).count() == 4
+
+    recusar_reserva_service(reserva=reserva, usuario=cenario_reserva['proprietario'])
+    assert not OcupacaoDiaria.objects.filter(reserva=reserva).exists()
+
+
+@pytest.mark.django_db
+def test_busca_por_datas_exclui_apartamentos_ocupados(client, cenario_reserva):
+    hoje = timezone.localdate()
+    Reserva.objects.create(
+        apartamento=cenario_reserva['apartamento'],
+        hospede=cenario_reserva['hospede'],
+        data_checkin=hoje + timedelta(days=10),
+        data_checkout=hoje + timedelta(days=15)
+    )
+    url = reverse('apartamentos:lista_apartamentos')
+
+    conflito = {'data_checkin': (hoje + timedelta(days=15)).isoformat(),
+                'data_checkout': (hoje + timedelta(days=20)).isoformat()}
+    response = client.get(url, conflito)
+    assert cenario_reserva['apartamento'] not in response.context['apartamentos']
+
+    livre = {'data_checkin': (hoje + timedelta(days=16)).isoformat(),
+             'data_checkout': (hoje + timedelta(days=20)).isoformat()}
+    response = client.get(url, livre)
+    assert cenario_reserva['apartamento'] in response.context['apartamentos']
+
+
+@pytest.mark.django_db
+def test_agregados_de_avaliacao_acompanham_criacao_edicao_e_remocao(cenario_reserva):
+    apartamento = cenario_reserva['apartamento']
+    reservas = [
+        Reserva.objects.create(apartamento=apartamento, hospede=cenario_reserva['hospede'],
+                               data_checkin=f'2025-0{mes}-01', data_checkout=f'2025-0{mes}-05')
+        for mes in (1, 2)
+    ]
+    primeira = Avaliacao.objects.create(reserva=reservas[0], nota=5)
+    Avaliacao.objects.create(reserva=reservas[1], nota=2)
+    apartamento.refresh_from_db()
+    assert apartamento.avaliacoes_total == 2
+    assert apartamento.nota_media == 3.5
+    assert apartamento.avaliacoes_nota_5 == 1 and apartamento.avaliacoes_nota_2 == 1
+
+    primeira.nota = 4
+    primeira.save()
+    apartamento.refresh_from_db()
+    assert apartamento.nota_media == 3.0
+    assert apartamento.avaliacoes_nota_5 == 0 and apartamento.avaliacoes_nota_4 == 1
+
+    primeira.delete()
+    apartamento.refresh_from_db()
+    assert apartamento.avaliacoes_total == 1
+    assert apartamento.nota_media == 2.0
+
+
+@pytest.mark.django_db
+def test_avaliacao_que_muda_de_apartamento_refaz_os_agregados_dos_dois(cenario_reserva):
+    apartamento, hospede = cenario_reserva['apartamento'], cenario_reserva['hospede']
+    outro = Apartamento.objects.create(titulo='Apto 2', predio=apartamento.predio, proprietario=apartamento.proprietario,
+                                       area_m2=30, preco_diaria=50)
+    reserva = Reserva.objects.create(apartamento=apartamento, hospede=hospede,
+                                     data_checkin='2025-01-01', data_checkout='2025-01-05')
+    avaliacao = Avaliacao.objects.create(reserva=reserva, nota=5)
+
+    avaliacao.reserva = Reserva.objects.create(apartamento=outro, hospede=hospede,
+                                               data_checkin='2025-02-01', data_checkout='2025-02-05')
+    avaliacao.save()
+    apartamento.refresh_from_db()
+    outro.refresh_from_db()
+    assert (apartamento.avaliacoes_total, apartamento.avaliacoes_nota_5, apartamento.nota_media) == (0, 0, 0)
+    assert (outro.avaliacoes_total, outro.avaliacoes_nota_5, outro.nota_media) == (1, 1, 5.0)
+
+
+@pytest.mark.django_db
+def test_salvar_apartamento_nao_sobrescreve_agregados(cenario_reserva):
+    apartamento = Apartamento.objects.get(pk=cenario_reserva['apartamento'].pk)
+    reserva = Reserva.objects.create(apartamento=apartamento, hospede=cenario_reserva['hospede'],
+                                     data_checkin='2025-03-01', data_checkout='2025-03-05')
+    Avaliacao.objects.create(reserva=reserva, nota=5)
+    apartamento.titulo = 'Novo título'
+    apartamento.save()
+    apartamento.refresh_from_db()
+    assert apartamento.titulo == 'Novo título'
+    assert apartamento.avaliacoes_total == 1
+
+
+@pytest.mark.django_db
+def test_aprovar_reserva_enfileira_email_sem_enviar_na_requisicao(cenario_reserva):
+    hospede = cenario_reserva['hospede']
+    hospede.email = 'hospede@example.com'
+    hospede.save()
+    reserva = Reserva.objects.create(apartamento=cenario_reserva['apartamento'], hospede=hospede,
+                                     data_checkin='2026-02-01', data_checkout='2026-02-05')
+    aprovar_reserva_service(reserva=reserva, usuario=cenario_reserva['proprietario'])
+
+    assert len(mail.outbox) == 0
+    email = EmailPendente.objects.get()
+    assert email.destinatario == 'hospede@example.com'
+    assert email.status == EmailPendente.StatusEnvio.PENDENTE
+
+    call_command('enviar_emails')
+    assert len(mail.outbox) == 1
+    assert 'APROVADA' in mail.outbox[0].subject
+    email.refresh_from_db()
+    assert email.status == EmailPendente.StatusEnvio.ENVIADO
+
+
+@pytest.mark.django_db
+def test_enviar_emails_reagenda_com_espera_em_caso_de_falha(monkeypatch):
+    email = EmailPendente.objects.create(destinatario='a@example.com', assunto='Teste', corpo='Olá',
+                                         remetente='nao-responda@aluguelpro.com')
+
+    def falhar(*args, **kwargs):
+        raise ConnectionError('SMTP fora do ar')
+    monkeypatch.setattr('django.core.mail.EmailMessage.send', falhar)
+
+    call_command('enviar_emails', '--max-tentativas', '2')
+    email.refresh_from_db()
+    assert email.status == EmailPendente.StatusEnvio.PENDENTE
+    assert email.tentativas == 1
+    assert email.proxima_tentativa > timezone.now()
+
+    EmailPendente.objects.filter(pk=email.pk).update(proxima_tentativa=timezone.now())
+    call_command('enviar_emails', '--max-tentativas', '2')
+    email.refresh_from_db()
+    assert email.status == EmailPendente.StatusEnvio.FALHOU
+
+
+def _criar_apartamentos_com_fotos(predio, quantidade):
+    for i in range(quantidade):
+        apartamento = Apartamento.objects.create(titulo=f'Apto {i}', predio=predio, proprietario=predio.proprietario,
+                                                 area_m2=40, preco_diaria=100)
+        FotoApartamento.objects.create(apartamento=apartamento, imagem=f'apartamentos/fotos/{i}-a.jpg')
+        FotoApartamento.objects.create(apartamento=apartamento, imagem=f'apartamentos/fotos/{i}-b.jpg', principal=True)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_lista_resolve_foto_de_capa_sem_consultas_por_card(client, cenario_reserva):
+    predio = cenario_reserva['apartamento'].predio
+    url = reverse('apartamentos:lista_apartamentos')
+    _criar_apartamentos_com_fotos(predio, 1)
+    client.get(url)  # Aquece os catálogos em cache (comodidades das facetas)
+    invalidar_busca()  # ...mas mede o cálculo da página, não o resultado da busca em cache
+    with CaptureQueriesContext(connection) as poucos:
+        response = client.get(url)
+    assert '/media/apartamentos/fotos/0-b.jpg' in response.content.decode()
+
+    _criar_apartamentos_com_fotos(predio, 5)
+    with CaptureQueriesContext(connection) as muitos:
+        client.get(url)
+    assert len(muitos) == len(poucos)
+
+
+@pytest.mark.django_db
+def test_gerar_dados_sinteticos_preenche_perfis_e_indices():
+    call_command('gerar_dados_sinteticos', '--proprietarios', '3', '--hospedes', '10', '--predios', '4',
+                 '--apartamentos', '12', '--reservas', '120', '--lote', '5', stdout=io.StringIO())
+
+    assert User.objects.count() == Perfil.objects.count() == 13
+    assert Apartamento.objects.count() == 12
+    assert Reserva.objects.count() > 0
+
+    # Reservas bloqueantes de um mesmo apartamento nunca se sobrepõem
+    ocupacoes = OcupacaoDiaria.objects.all()
+    assert ocupacoes.count() == ocupacoes.values('apartamento', 'data').distinct().count()
+    bloqueantes = Reserva.objects.filter(status__in=Reserva.STATUS_BLOQUEANTES)
+    assert ocupacoes.values('reserva').distinct().count() == bloqueantes.count()
+
+    # Os agregados gerados em memória batem com o recálculo a partir das avaliações
+    antes = list(Apartamento.objects.order_by('pk').values_list('avaliacoes_total', 'avaliacoes_soma'))
+    recalcular_agregados_avaliacao()
+    assert list(Apartamento.objects.order_by('pk').values_list('avaliacoes_total', 'avaliacoes_soma')) == antes
+
+    # O índice de texto completo também é preenchido sem save()
+    assert not Apartamento.objects.filter(documento_busca='').exists()
+
+
+@pytest.mark.django_db
+def test_filtro_de_cidade_ignora_acentos_e_maiusculas(client, cenario_reserva):
+    predio = cenario_reserva['apartamento'].predio
+    predio.cidade = 'São Paulo'
+    predio.save()
+
+    response = client.get(reverse('apartamentos:lista_apartamentos'), {'predio__cidade': 'sao PAULO'})
+    assert list(response.context['apartamentos']) == [cenario_reserva['apartamento']]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_autocompletar_cidades_usa_catalogo_em_cache(client, cenario_reserva):
+    proprietario = cenario_reserva['proprietario']
+    for nome, cidade in [('A', 'São Paulo'), ('B', 'São Paulo'), ('C', 'São Luís'), ('D', 'Recife')]:
+        Predio.objects.create(nome=nome, proprietario=proprietario, cidade=cidade)
+    url = reverse('apartamentos:autocompletar_cidades')
+
+    assert client.get(url, {'q': 'sao'}).json() == {'cidades': ['São Paulo', 'São Luís']}
+    with CaptureQueriesContext(connection) as consultas:
+        assert client.get(url, {'q': 'SÃO L'}).json() == {'cidades': ['São Luís']}
+    assert len(consultas) == 0
+    # Limite fora da faixa: no mínimo 1 (um negativo cortaria o fim da lista)
+    assert client.get(url, {'q': 'sao', 'limite': '-1'}).json() == {'cidades': ['São Paulo']}
+
+    # Salvar um prédio invalida o catálogo
+    Predio.objects.create(nome='E', proprietario=proprietario, cidade='Salvador')
+    assert client.get(url, {'q': 'sa'}).json() == {'cidades': ['São Paulo', 'Salvador', 'São Luís']}
+
+
+@pytest.mark.django_db
+def test_paginacao_por_cursor_percorre_a_lista_nos_dois_sentidos(client, cenario_reserva):
+    predio = cenario_reserva['apartamento'].predio
+    for i in range(20):
+        Apartamento.objects.create(titulo=f'Apto {i}', predio=predio, proprietario=cenario_reserva['proprietario'],
+                                   area_m2=40, preco_diaria=100)
+    # Mesma data de cadastro para todos: o desempate pelo id precisa manter a ordem estável
+    Apartamento.objects.update(data_cadastro=timezone.now())
+    url = reverse('apartamentos:lista_apartamentos')
+    client.get(url)  # Aquece os catálogos em cache (comodidades das facetas)
+    invalidar_busca()  # ...mas mede o cálculo de cada página, não o resultado da busca em cache
+
+    paginas, consultas, proxima = [], [], ''
+    while proxima is not None:
+        with CaptureQueriesContext(connection) as capturadas:
+            page_obj = client.get(url + proxima).context['page_obj']
+        consultas.append(len(capturadas))
+        paginas.append([apartamento.pk for apartamento in page_obj])
+        proxima = page_obj.url_proxima
+
+    assert [len(pagina) for pagina in paginas] == [9, 9, 3]
+    assert sum(paginas, []) == list(Apartamento.objects.order_by('-data_cadastro', '-pk').values_list('pk', flat=True))
+    assert len(set(consultas)) == 1
+    assert page_obj.total == 21 and page_obj.total_exato
+
+    anterior = client.get(url + page_obj.url_anterior).context['page_obj']
+    assert [apartamento.pk for apartamento in anterior] == paginas[1]
+    assert [apartamento.pk for apartamento in client.get(url + anterior.url_anterior).context['page_obj']] == paginas[0]
+
+    # Buscas equivalentes saem da mesma página em cache, mas cada uma com links dos próprios parâmetros
+    primeira = client.get(url + '?quartos=&ordenar=recentes').context['page_obj']
+    segunda = client.get(url + '?ordenar=recentes').context['page_obj']
+    assert primeira.url_proxima == segunda.url_proxima
+    assert segunda.url_proxima.startswith('?ordenar=recentes&cursor=')
+
+
+@pytest.mark.django_db
+def test_cursor_invalido_volta_para_a_primeira_pagina(client, cenario_reserva):
+    for cursor in ('nao-e-um-cursor', codificar_cursor(PROXIMA, [None, None])):
+        response = client.get(reverse('apartamentos:lista_apartamentos'), {'cursor': cursor})
+        assert response.status_code == 200
+        assert list(response.context['apartamentos']) == [cenario_reserva['apartamento']]
+
+
+@pytest.mark.django_db
+def test_criar_reserva_service_recusa_periodo_ocupado(cenario_reserva):
+    apartamento, hospede = cenario_reserva['apartamento'], cenario_reserva['hospede']
+    hoje = timezone.localdate()
+    reserva = criar_reserva_service(apartamento, hospede, hoje + timedelta(days=10), hoje + timedelta(days=12))
+    assert reserva.status == Reserva.StatusReserva.PENDENTE
+
+    with pytest.raises(ValidationError) as erro:
+        criar_reserva_service(apartamento, hospede, hoje + timedelta(days=12), hoje + timedelta(days=14))
+    assert erro.value.code == 'conflito_reserva'
+    assert Reserva.objects.count() == 1
+
+    # Mesmo gravando por fora do serviço, a constraint do índice impede a sobreposição
+    with pytest.raises(IntegrityError), transaction.atomic():
+        Reserva.objects.create(apartamento=apartamento, hospede=hospede, data_checkin=hoje + timedelta(days=11),
+                               data_checkout=hoje + timedelta(days=13))
+
+
+def _imagem_enviada(nome='sala.png', tamanho=(2000, 1500)):
+    buffer = io.BytesIO()
+    Image.new('RGB', tamanho, 'teal').save(buffer, 'PNG')
+    return SimpleUploadedFile(nome, buffer.getvalue(), content_type='image/png')
+
+
+@pytest.mark.django_db
+def test_upload_gera_variantes_fora_da_requisicao(client, cenario_reserva, settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    apartamento = cenario_reserva['apartamento']
+    foto = FotoApartamento.objects.create(apartamento=apartamento, imagem=_imagem_enviada(), principal=True)
+
+    # O upload só agenda o trabalho: nada foi redimensionado ainda e a página usa o original
+    pendente = ImagemPendente.objects.get()
+    assert (pendente.modelo, pendente.objeto_id, pendente.nome_arquivo) == (
+        'apartamentos.FotoApartamento', foto.pk, foto.imagem.name)
+    assert not foto.variantes
+    assert not (tmp_path / 'apartamentos/fotos/sala__card-320.webp').exists()
+    # A página da busca fica em cache com o original; as variantes novas a invalidam
+    assert 'sala__card-320.webp' not in client.get(reverse('apartamentos:lista_apartamentos')).content.decode()
+
+    call_command('processar_imagens', stdout=io.StringIO())
+
+    foto.refresh_from_db()
+    assert foto.variantes_prontas
+    with Image.open(tmp_path / 'apartamentos/fotos/sala__card-640.webp') as card:
+        assert card.size == (640, 480)
+    with Image.open(tmp_path / 'apartamentos/fotos/sala__carrossel-1920.jpg') as carrossel:
+        assert carrossel.size == (1440, 1080)  # cabe em 1920x1080 sem cortar a foto 4:3
+    assert foto.variantes.card.webp == ('/media/apartamentos/fotos/sala__card-320.webp 320w, '
+                                        '/media/apartamentos/fotos/sala__card-640.webp 640w')
+    ImagemPendente.objects.get(status=ImagemPendente.StatusProcessamento.PROCESSADA)
+
+    html = client.get(reverse('apartamentos:lista_apartamentos')).content.decode()
+    assert 'sala__card-320.webp 320w' in html and 'type="image/webp"' in html
+
+
+
+class StorageComSufixo(FileSystemStorage):
+    """Como o Cloudinary com use_filename: grava cada upload com um sufixo aleatório no nome."""
+    contador = 0
+
+    def get_available_name(self, name, max_length=None):
+        StorageComSufixo.contador += 1
+        raiz, extensao = os.path.splitext(name)
+        return super().get_available_name(f'{raiz}_x{StorageComSufixo.contador}{extensao}', max_length)
+
+
+@pytest.mark.django_db
+def test_variantes_usam_os_nomes_gravados_e_saem_com_a_imagem(cenario_reserva, settings, tmp_path,
+                                                               django_capture_on_commit_callbacks):
+    settings.MEDIA_ROOT = tmp_path
+    settings.STORAGES = {**settings.STORAGES, 'default': {'BACKEND': f'{__name__}.StorageComSufixo'}}
+    foto = FotoApartamento.objects.create(apartamento=cenario_reserva['apartamento'], imagem=_imagem_enviada())
+    call_command('processar_imagens', stdout=io.StringIO())
+
+    foto.refresh_from_db()
+    primeiras = set(foto.variantes_arquivos.values())
+    assert len(primeiras) == 10 and all(nome.startswith('apartamentos/fotos/sala') for nome in primeiras)
+    # As URLs saem dos nomes devolvidos pelo storage, não do nome pedido
+    assert foto.variantes.card.src == f"/media/{foto.variantes_arquivos['card-640.jpg']}"
+    assert all((tmp_path / nome).exists() for nome in primeiras)
+
+    # Imagem trocada: as variantes da anterior são apagadas depois de gerar as novas
+    foto.imagem = _imagem_enviada('quarto.png')
+    foto.save()
+    call_command('processar_imagens', stdout=io.StringIO())
+    foto.refresh_from_db()
+    assert not any((tmp_path / nome).exists() for nome in primeiras)
+    segundas = set(foto.variantes_arquivos.values())
+    assert all((tmp_path / nome).exists() for nome in segundas)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        foto.delete()
+    assert not any((tmp_path / nome).exists() for nome in segundas)
+
+
+
+@pytest.mark.django_db(transaction=True)
+def test_versoes_de_cache_so_mudam_no_commit(cenario_reserva):
+    # As invalidações rodam em on_commit; por isso os testes que dependem delas usam transaction=True
+    apartamento = cenario_reserva['apartamento']
+    versao = versao_apartamento(apartamento.pk)
+    with transaction.atomic():
+        apartamento.titulo = 'Título novo'
+        apartamento.save()
+        # Até o commit, quem lê ainda vê o título antigo: guardá-lo sob uma versão nova o deixaria preso no cache
+        assert versao_apartamento(apartamento.pk) == versao
+    assert versao_apartamento(apartamento.pk) != versao
+
+    versao = versao_apartamento(apartamento.pk)
+    with pytest.raises(ValueError), transaction.atomic():
+        apartamento.save()
+        raise ValueError
+    assert versao_apartamento(apartamento.pk) == versao
+
+
+@pytest.mark.django_db(transaction=True)
+def test_detalhe_reaproveita_fragmentos_ate_o_apartamento_mudar(client, cenario_reserva):
+    apartamento = cenario_reserva['apartamento']
+    wifi = Comodidade.objects.create(nome='Wi-Fi')
+    item = ApartamentoComodidade.objects.create(apartamento=apartamento, comodidade=wifi, preco_adicional=15)
+    url = reverse('apartamentos:detalhe_apartamento', args=[apartamento.pk])
+
+    with CaptureQueriesContext(connection) as frio:
+        assert '+ R$ 15,00' in client.get(url).content.decode()
+    with CaptureQueriesContext(connection) as quente:
+        client.get(url)
+    # Galeria, comodidades, datas ocupadas e avaliações vêm do cache
+    assert len(quente) == len(frio) - 4
+
+    item.preco_adicional = 25
+    item.save()
+    assert '+ R$ 25,00' in client.get(url).content.decode()
+
+    hoje = timezone.localdate()
+    Reserva.objects.create(apartamento=apartamento, hospede=cenario_reserva['hospede'],
+                           data_checkin=hoje + timedelta(days=3), data_checkout=hoje + timedelta(days=5))
+    assert (hoje + timedelta(days=3)).strftime('%d/%m/%Y') in client.get(url).content.decode()
+
+
+@pytest.mark.django_db
+def test_resumo_do_painel_em_duas_consultas(cenario_reserva):
+    apartamento, hospede = cenario_reserva['apartamento'], cenario_reserva['hospede']
+    outro = Apartamento.objects.create(titulo='Apto 2', predio=apartamento.predio, proprietario=apartamento.proprietario,
+                                       area_m2=30, preco_diaria=50)
+    mensal = Apartamento.objects.create(titulo='Apto 3', predio=apartamento.predio,
+                                        proprietario=apartamento.proprietario, area_m2=40, preco_diaria=150,
+                                        preco_mensal=3000)
+    ApartamentoComodidade.objects.create(apartamento=mensal, comodidade=Comodidade.objects.create(nome='Garagem'),
+                                         preco_adicional=10)
+    hoje = timezone.localdate()
+    confirmada = Reserva.StatusReserva.CONFIRMADA
+    # 3 noites dentro da janela (o dia do check-out não conta)
+    Reserva.objects.create(apartamento=apartamento, hospede=hospede, data_checkin=hoje + timedelta(days=2),
+                           data_checkout=hoje + timedelta(days=5), status=confirmada)
+    # Só 2 das noites caem nos próximos 30 dias
+    Reserva.objects.create(apartamento=outro, hospede=hospede, data_checkin=hoje + timedelta(days=2),
+                           data_checkout=hoje + timedelta(days=4))
+    Reserva.objects.create(apartamento=outro, hospede=hospede, data_checkin=hoje + timedelta(days=28),
+                           data_checkout=hoje + timedelta(days=40), status=confirmada)
+    Reserva.objects.create(apartamento=outro, hospede=hospede, data_checkin=hoje - timedelta(days=90),
+                           data_checkout=hoje - timedelta(days=85), status=Reserva.StatusReserva.CANCELADA)
+    # 60 noites a preço mensal (2 meses de 3000 + 60 diárias de garagem), 30 delas dentro da janela
+    Reserva.objects.create(apartamento=mensal, hospede=hospede, data_checkin=hoje - timedelta(days=10),
+                           data_checkout=hoje + timedelta(days=50), status=confirmada)
+
+    with CaptureQueriesContext(connection) as consultas:
+        resumo = resumo_painel_proprietario(cenario_reserva['proprietario'])
+    assert len(consultas) == 2
+    assert (resumo['apartamentos'], resumo['pendentes'], resumo['confirmadas'], resumo['canceladas']) == (3, 1, 3, 1)
+    assert resumo['noites_ocupadas'] == 35
+    # A mesma regra do orçamento, proporcional às noites dentro da janela
+    assert resumo['receita'] == 3 * 200 + 2 * 50 + (2 * 3000 + 60 * 10) * 30 // 60
+    assert resumo['taxa_ocupacao'] == round(100 * 35 / 90, 1)
+
+
+@pytest.mark.django_db
+def test_feed_do_calendario_usa_janela_e_responde_304_sem_alteracoes(client, cenario_reserva):
+    apartamento, hospede = cenario_reserva['apartamento'], cenario_reserva['hospede']
+    hoje = timezone.localdate()
+    dentro = Reserva.objects.create(apartamento=apartamento, hospede=hospede, data_checkin=hoje + timedelta(days=3),
+                                    data_checkout=hoje + timedelta(days=5))
+    Reserva.objects.create(apartamento=apartamento, hospede=hospede, data_checkin=hoje + timedelta(days=200),
+                           data_checkout=hoje + timedelta(days=202))
+    client.force_login(cenario_reserva['proprietario'])
+    url = reverse('apartamentos:reserva_calendario_data', args=[apartamento.pk])
+    janela = {'start': f'{hoje}T00:00:00-03:00', 'end': f'{hoje + timedelta(days=42)}T00:00:00-03:00'}
+
+    response = client.get(url, janela)
+    assert [evento['start'] for evento in response.json()] == [dentro.data_checkin.isoformat()]
+    assert response.json()[0]['title'] == 'Hóspede: hospede_teste_reserva'
+
+    revalidacao = client.get(url, janela, HTTP_IF_NONE_MATCH=response['ETag'])
+    assert revalidacao.status_code == 304
+
+    # Cancelar a reserva muda o ETag e ela some do feed
+    recusar_reserva_service(dentro, cenario_reserva['proprietario'])
+    atualizado = client.get(url, janela, HTTP_IF_NONE_MATCH=response['ETag'])
+    assert atualizado.status_code == 200 and atualizado.json() == []
+
+    assert client.get(url, {'start': 'ontem', 'end': 'amanhã'}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_feed_ical_em_streaming_com_chave_assinada_e_304(client, cenario_reserva):
+    apartamento, hospede = cenario_reserva['apartamento'], cenario_reserva['hospede']
+    hoje = timezone.localdate()
+    reserva = Reserva.objects.create(apartamento=apartamento, hospede=hospede, data_checkin=hoje + timedelta(days=3),
+                                     data_checkout=hoje + timedelta(days=5))
+    Reserva.objects.create(apartamento=apartamento, hospede=hospede, data_checkin=hoje + timedelta(days=10),
+                           data_checkout=hoje + timedelta(days=12), status=Reserva.StatusReserva.CANCELADA)
+    url = url_ics(TIPO_APARTAMENTO, apartamento.pk)
+
+    response = client.get(url)
+    assert response.status_code == 200 and response.streaming
+    assert response['Content-Type'].startswith('text/calendar')
+    conteudo = b''.join(response.streaming_content).decode()
+    assert conteudo.startswith('BEGIN:VCALENDAR\r\n') and conteudo.endswith('END:VCALENDAR\r\n')
+    assert conteudo.count('BEGIN:VEVENT') == 1
+    assert f'UID:reserva-{reserva.pk}@' in conteudo and 'STATUS:TENTATIVE' in conteudo
+    # O check-out também fica bloqueado: DTEND (exclusivo) é o dia seguinte
+    assert f'DTEND;VALUE=DATE:{reserva.data_checkout + timedelta(days=1):%Y%m%d}' in conteudo
+    assert 'hospede_teste_reserva' not in conteudo
+
+    assert client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code == 304
+    aprovar_reserva_service(reserva, cenario_reserva['proprietario'])
+    atualizado = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+    assert atualizado.status_code == 200
+    assert 'STATUS:CONFIRMED' in b''.join(atualizado.streaming_content).decode()
+
+    portfolio = client.get(url_ics(TIPO_PROPRIETARIO, cenario_reserva['proprietario'].pk))
+    assert b''.join(portfolio.streaming_content).decode().count('BEGIN:VEVENT') == 1
+    adulterada = url.replace('.ics', 'x.ics')
+    assert client.get(adulterada).status_code == 404
+
+
+@pytest.mark.django_db(transaction=True)
+def test_orcamento_soma_adicionais_usa_mensal_e_fica_em_cache(client, cenario_reserva):
+    apartamento = cenario_reserva['apartamento']
+    mensal = Apartamento.objects.create(titulo='Apto Mensal', predio=apartamento.predio,
+                                        proprietario=apartamento.proprietario, area_m2=40, preco_diaria=100,
+                                        preco_mensal=2000)
+    ApartamentoComodidade.objects.create(apartamento=apartamento, comodidade=Comodidade.objects.create(nome='Garagem'),
+                                         preco_adicional=15)
+    hoje = timezone.localdate()
+
+    orcamentos = orcar_estadias([apartamento, mensal], hoje, hoje + timedelta(days=3))
+    assert orcamentos[apartamento.pk].total == 3 * 200 + 3 * 15
+    assert orcamentos[mensal.pk].total == 300
+    # 65 noites com preço mensal: 2 meses + 5 diárias
+    longa = orcar_estadias([mensal], hoje, hoje + timedelta(days=65))[mensal.pk]
+    assert (longa.meses, longa.diarias, longa.total) == (2, 5, 2 * 2000 + 5 * 100)
+
+    with CaptureQueriesContext(connection) as consultas:
+        orcar_estadias([apartamento, mensal], hoje, hoje + timedelta(days=3))
+    assert len(consultas) == 0
+
+    # Mudar um adicional troca a versão do apartamento e o orçamento é refeito
+    ApartamentoComodidade.objects.filter(apartamento=apartamento).update(preco_adicional=0)
+    ApartamentoComodidade.objects.get(apartamento=apartamento).save()
+    assert orcar_estadias([apartamento], hoje, hoje + timedelta(days=3))[apartamento.pk].total == 600
+
+    response = client.get(reverse('apartamentos:lista_apartamentos'),
+                          {'data_checkin': hoje + timedelta(days=1), 'data_checkout': hoje + timedelta(days=4)})
+    assert 'R$ 600,00' in response.content.decode()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_busca_por_texto_ranqueada_sem_acentos_e_com_radicais(client, cenario_reserva):
+    apartamento = cenario_reserva['apartamento']
+    predio = apartamento.predio
+    vista = Apartamento.objects.create(titulo='Cobertura com varandas', descricao='Vista para a praia, varanda gourmet',
+                                       predio=predio, proprietario=apartamento.proprietario, area_m2=90,
+                                       preco_diaria=500)
+    Apartamento.objects.create(titulo='Studio', descricao='Uma varanda pequena', predio=predio,
+                               proprietario=apartamento.proprietario, area_m2=25, preco_diaria=120)
+    url = reverse('apartamentos:lista_apartamentos')
+
+    # "Varanda" casa com "varandas" e a unidade que mais cita o termo vem primeiro
+    response = client.get(url, {'q': 'VARANDA'})
+    assert [a.titulo for a in response.context['apartamentos']] == ['Cobertura com varandas', 'Studio']
+    assert [a.pk for a in client.get(url, {'q': 'praias gourmet'}).context['apartamentos']] == [vista.pk]
+
+    # Dados do prédio entram no documento e são atualizados quando o prédio muda
+    predio.nome = 'Edifício Solar das Águas'
+    predio.save()
+    resultados = client.get(url, {'q': 'aguas solar'}).context['apartamentos']
+    assert len(resultados) == 3
+    assert client.get(url, {'q': 'solar', 'predio__cidade': 'outra cidade'}).context['apartamentos'] == []
+
+    # A paginação por cursor percorre os resultados pela relevância, sem repetir nem pular
+    for i in range(10):
+        Apartamento.objects.create(titulo=f'Flat {i}', descricao='varanda ' * (i % 3 + 1), predio=predio,
+                                   proprietario=apartamento.proprietario, area_m2=30, preco_diaria=150)
+    vistos, parametros = [], {'q': 'varanda'}
+    while True:
+        pagina = client.get(url, parametros).context['page_obj']
+        vistos += [a.pk for a in pagina]
+        if not pagina.has_next():
+            break
+        parametros = {'q': 'varanda', 'cursor': pagina.url_proxima.split('cursor=')[1]}
+    assert len(vistos) == len(set(vistos)) == 12
+
+
+@pytest.mark.django_db
+def test_filtros_e_facetas_da_lista(client, cenario_reserva):
+    apartamento = cenario_reserva['apartamento']
+    predio, proprietario = apartamento.predio, apartamento.proprietario
+    wifi, piscina, garagem = (Comodidade.objects.create(nome=nome) for nome in ('Wi-Fi', 'Piscina', 'Garagem'))
+    grande = Apartamento.objects.create(titulo='Casa', predio=predio, proprietario=proprietario, area_m2=180,
+                                        preco_diaria=450, numero_quartos=5, numero_banheiros=3)
+    medio = Apartamento.objects.create(titulo='Médio', predio=predio, proprietario=proprietario, area_m2=70,
+                                       preco_diaria=180, numero_quartos=2)
+    for unidade, comodidades in ((grande, (wifi, piscina, garagem)), (medio, (wifi, piscina)), (apartamento, (wifi,))):
+        for comodidade in comodidades:
+            ApartamentoComodidade.objects.create(apartamento=unidade, comodidade=comodidade)
+    url = reverse('apartamentos:lista_apartamentos')
+
+    def titulos(**parametros):
+        return sorted(a.titulo for a in client.get(url, parametros).context['apartamentos'])
+
+    # "Todas as comodidades": sem linhas repetidas por causa do JOIN
+    assert titulos(comodidades=[wifi.pk, piscina.pk]) == ['Casa', 'Médio']
+    assert titulos(comodidades=[wifi.pk, piscina.pk, garagem.pk]) == ['Casa']
+    assert titulos(quartos=4) == ['Casa']
+    assert titulos(quartos=2, banheiros=1) == ['Médio']
+    assert titulos(area_min=60, area_max=100) == ['Médio']
+    assert titulos(preco_min=150, preco_max=250, comodidades=[wifi.pk]) == ['Apto para Reservas', 'Médio']
+
+    # Facetas de todos os resultados em duas consultas, a agregada e o GROUP BY por comodidade, sem
+    # subconsulta por comodidade (com o catálogo de comodidades já em cache)
+    contar_facetas(Apartamento.objects.all())
+    with CaptureQueriesContext(connection) as consultas:
+        facetas = contar_facetas(Apartamento.objects.filter(comodidades=wifi))
+    assert len(consultas) == 2 and 'GROUP BY' in consultas[1]['sql'] and 'EXISTS' not in consultas[0]['sql']
+    assert facetas['total'] == 3
+    assert facetas['quartos'] == [(1, '1', 1), (2, '2', 1), (3, '3', 0), (4, '4+', 1)]
+    assert facetas['comodidades'] == [(garagem.pk, 'Garagem', 1), (piscina.pk, 'Piscina', 2), (wifi.pk, 'Wi-Fi', 3)]
+    assert [total for _, _, total in facetas['precos']] == [0, 2, 0, 1]
+
+    response = client.get(url, {'comodidades': [piscina.pk]})
+    assert [total for _, _, total in response.context['facetas']['quartos']] == [0, 1, 0, 1]
+
+
+@pytest.mark.django_db
+def test_localizacao_pelo_cep_e_busca_por_raio_e_area_do_mapa(client, cenario_reserva):
+    apartamento = cenario_reserva['apartamento']
+    proprietario = apartamento.proprietario
+    # Sem coordenadas, o prédio vai para o centroide do CEP; trocar o CEP reposiciona
+    predio = apartamento.predio
+    predio.cep = '01310-100'
+    predio.save(update_fields=['cep'])
+    predio.refresh_from_db()
+    assert predio.coordenadas_aproximadas and predio.celula_geo is not None
+    assert -24 < predio.latitude < -23 and -47 < predio.longitude < -46
+    predio.cep = '20040-002'
+    predio.save()
+    assert -23 < predio.latitude < -22.5
+
+    # Coordenadas informadas pelo proprietário têm prioridade sobre o CEP
+    form = PredioForm(data={'nome': 'Copacabana', 'endereco_completo': 'Av. Atlântica, 1', 'cidade': 'Rio de Janeiro',
+                            'estado': 'RJ', 'cep': '20040-002', 'latitude': '-22.971', 'longitude': '-43.182'})
+    assert form.is_valid(), form.errors
+    form.instance.proprietario = proprietario
+    praia = form.save()
+    assert not praia.coordenadas_aproximadas and praia.latitude == Decimal('-22.971000')
+    perto = Apartamento.objects.create(titulo='Perto da praia', predio=praia, proprietario=proprietario,
+                                       area_m2=40, preco_diaria=300)
+    longe = Apartamento.objects.create(
+        titulo='Em Curitiba', proprietario=proprietario, area_m2=40, preco_diaria=150,
+        predio=Predio.objects.create(nome='Curitiba', proprietario=proprietario, cep='80010-000'))
+
+    # As faixas de células cobrem todo ponto da caixa
+    caixa = (-23.1, -43.5, -22.8, -43.1)
+    faixas = faixas_da_caixa(*caixa)
+    for lat in (-23.1, -23.0, -22.9, -22.8):
+        for lng in (-43.5, -43.3, -43.1):
+            assert any(inicio <= celula_geo(lat, lng) < fim for inicio, fim in faixas)
+
+    url = reverse('apartamentos:lista_apartamentos')
+
+    def titulos(**parametros):
+        return [a.titulo for a in client.get(url, parametros).context['apartamentos']]
+
+    assert sorted(titulos(sul=-23.1, oeste=-43.5, norte=-22.8, leste=-43.1)) == ['Apto para Reservas',
+                                                                                  'Perto da praia']
+    # Por raio, os mais próximos primeiro; a ~5 km do centro só sobra a unidade da praia
+    assert titulos(lat=-22.97, lng=-43.18, raio=50) == ['Perto da praia', 'Apto para Reservas']
+    assert titulos(lat=-22.97, lng=-43.18, raio=5) == ['Perto da praia']
+    assert titulos(lat=-25.43, lng=-49.27, raio=20) == ['Em Curitiba']
+    # Parâmetros inválidos são ignorados
+    assert len(titulos(sul='abc', oeste=-43.5, norte=-22.8, leste=-43.1)) == 3
+
+    # Modo mapa: só as unidades da área visível, com as coordenadas do prédio
+    dados = client.get(url, {'formato': 'mapa', 'sul': -26, 'oeste': -50, 'norte': -25, 'leste': -49}).json()
+    assert dados == {'truncado': False, 'apartamentos': [{
+        'id': longe.pk, 'titulo': 'Em Curitiba', 'preco_diaria': '150.00', 'lat': float(longe.predio.latitude),
+        'lng': float(longe.predio.longitude), 'url': reverse('apartamentos:detalhe_apartamento', args=[longe.pk])}]}
+    assert perto.pk not in [a['id'] for a in dados['apartamentos']]
+
+
+
+@pytest.mark.django_db
+def test_mapa_sem_area_ignora_predios_sem_coordenadas(client, cenario_reserva):
+    apartamento = cenario_reserva['apartamento']
+    assert apartamento.predio.latitude is None
+    proprietario = apartamento.proprietario
+    curitiba = Apartamento.objects.create(
+        titulo='Em Curitiba', proprietario=proprietario, area_m2=40, preco_diaria=150,
+        predio=Predio.objects.create(nome='Curitiba', proprietario=proprietario, cep='80010-000'))
+
+    response = client.get(reverse('apartamentos:lista_apartamentos'), {'formato': 'mapa'})
+    assert response.status_code == 200
+    assert [marcador['id'] for marcador in response.json()['apartamentos']] == [curitiba.pk]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_login_por_chave_normalizada_e_usuario_em_cache(client):
+    usuario = User.objects.create_user(username='Maria.Silva', email='Maria@Example.com', password='senha-forte-1')
+    outro = User.objects.create_user(username='maria@example.com', email='outra@example.com', password='x')
+    assert (usuario.perfil.chave_username, usuario.perfil.chave_email) == ('maria.silva', 'maria@example.com')
+    backend = EmailBackend()
+
+    # Uma única consulta indexada, por username ou e-mail e sem diferença de caixa
+    with CaptureQueriesContext(connection) as consultas:
+        assert backend.authenticate(None, username=' MARIA.silva ', password='senha-forte-1') == usuario
+    assert len(consultas) == 1
+    assert backend.authenticate(None, username='maria@EXAMPLE.com', password='senha-forte-1') == usuario
+    assert backend.authenticate(None, username='maria@example.com', password='x') is None  # a conta mais antiga vence
+    assert backend.authenticate(None, username='maria.silva', password='errada') is None
+    assert backend.authenticate(None, username='ninguem', password='senha-forte-1') is None
+
+    # Trocar o e-mail atualiza a chave
+    usuario.email = 'maria.nova@example.com'
+    usuario.save()
+    assert backend.authenticate(None, username='Maria.Nova@example.com', password='senha-forte-1') == usuario
+
+    # get_user vem do cache depois da primeira leitura, e salvar o usuário invalida
+    assert backend.get_user(usuario.pk) == usuario
+    with CaptureQueriesContext(connection) as consultas:
+        assert backend.get_user(usuario.pk).email == 'maria.nova@example.com'
+    assert len(consultas) == 0
+    usuario.is_active = False
+    usuario.save()
+    assert backend.get_user(usuario.pk) is None
+    outro.delete()
+    assert backend.get_user(outro.pk) is None
+
+    # Páginas autenticadas seguem funcionando pelo usuário em cache
+    assert client.login(username='MARIA.SILVA', password='senha-forte-1') is False  # inativo
+    usuario.is_active = True
+    usuario.save()
+    assert client.login(username='MARIA.SILVA', password='senha-forte-1')
+    client.get(reverse('apartamentos:minhas_reservas'))
+    with CaptureQueriesContext(connection) as consultas:
+        assert client.get(reverse('apartamentos:minhas_reservas')).context['user'] == usuario
+    assert not any('FROM "auth_user" WHERE "auth_user"."id"' in c['sql'] for c in consultas)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_permissoes_em_cache_entre_requisicoes_e_invalidadas_pelos_grupos(client):
+    call_command('criar_grupos', stdout=io.StringIO())
+    proprietarios = Group.objects.get(name='Proprietários')
+    usuario = User.objects.create_user(username='dono_perm', password='senha')
+    usuario.groups.add(proprietarios)
+    client.force_login(usuario)
+    url = reverse('apartamentos:painel_proprietario')
+    assert client.get(url).status_code == 200
+
+    def consultas_de_permissao():
+        with CaptureQueriesContext(connection) as consultas:
+            status = client.get(url).status_code
+        return status, sum('auth_permission' in c['sql'] for c in consultas)
+
+    # A partir da segunda requisição, PermissionRequiredMixin e {{ perms }} não consultam o banco
+    assert consultas_de_permissao() == (200, 0)
+    assert EmailBackend().has_perm(User.objects.get(pk=usuario.pk), 'apartamentos.add_predio')
+
+    # Sair do grupo invalida só esse usuário
+    usuario.groups.remove(proprietarios)
+    assert client.get(url).status_code == 403
+    proprietarios.user_set.add(usuario)
+    assert consultas_de_permissao()[0] == 200
+
+    # Mudar as permissões do grupo vale para todos os membros
+    proprietarios.permissions.remove(Permission.objects.get(codename='add_apartamento'))
+    assert client.get(url).status_code == 403
+    call_command('criar_grupos', stdout=io.StringIO())
+    assert client.get(url).status_code == 200
+    proprietarios.user_set.clear()
+    assert client.get(url).status_code == 403
+
+
+@pytest.mark.django_db
+def test_perfil_so_grava_campos_alterados():
+    usuario = User.objects.create_user(username='ana', email='ana@example.com', password='x')
+    perfil = Perfil.objects.get(usuario=usuario)
+    with CaptureQueriesContext(connection) as consultas:
+        perfil.save()
+        usuario.last_login = timezone.now()
+        usuario.save(update_fields=['last_login'])
+    assert [c['sql'].split()[0] for c in consultas] == ['UPDATE']  # só o last_login
+
+    perfil.telefone = '81 99999-0000'
+    with CaptureQueriesContext(connection) as consultas:
+        perfil.save()
+    assert len(consultas) == 1 and '"telefone"' in consultas[0]['sql'] and '"bio"' not in consultas[0]['sql']
+
+    # Trocar o e-mail sem o perfil em memória: um UPDATE condicional das chaves, sem SELECT
+    usuario = User.objects.get(pk=usuario.pk)
+    usuario.email = 'Ana.Nova@example.com'
+    with CaptureQueriesContext(connection) as consultas:
+        usuario.save()
+    assert [c['sql'].split()[0] for c in consultas] == ['UPDATE', 'UPDATE']
+    assert Perfil.objects.get(pk=perfil.pk).chave_email == 'ana.nova@example.com'
+    assert Perfil.objects.get(pk=perfil.pk).telefone == '81 99999-0000'
+
+
+@pytest.mark.django_db(transaction=True, databases=['default', 'replica'])
+def test_leituras_vao_para_a_replica_e_quem_escreve_le_do_primario(client, cenario_reserva, settings):
+    settings.REPLICAS_LEITURA = ['replica']
+    apartamento, hospede = cenario_reserva['apartamento'], cenario_reserva['hospede']
+
+    def consultas_por_banco(requisicao):
+        with CaptureQueriesContext(connections['default']) as primario, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = requisicao()
+        return response, len(primario), len(replica)
+
+    # Página anônima: o próprio apartamento vem da réplica; os fragmentos que vão para o cache, do primário
+    response, no_primario, na_replica = consultas_por_banco(
+        lambda: client.get(reverse('apartamentos:detalhe_apartamento', args=[apartamento.pk])))
+    assert response.status_code == 200 and no_primario > 0 and na_replica == 1
+    # Com os fragmentos em cache, nada mais vai ao primário
+    response, no_primario, na_replica = consultas_por_banco(
+        lambda: client.get(reverse('apartamentos:detalhe_apartamento', args=[apartamento.pk])))
+    assert response.status_code == 200 and no_primario == 0 and na_replica == 1
+    # Fora de requisições (comandos, serviços) tudo fica no primário
+    with CaptureQueriesContext(connections['replica']) as replica:
+        list(Apartamento.objects.all())
+    assert len(replica) == 0
+
+    # O POST da reserva escreve no primário e marca o navegador para ler do primário por um tempo
+    client.force_login(hospede)
+    hoje = timezone.localdate()
+    response, _, na_replica = consultas_por_banco(lambda: client.post(
+        reverse('apartamentos:detalhe_apartamento', args=[apartamento.pk]),
+        {'data_checkin': hoje + timedelta(days=3), 'data_checkout': hoje + timedelta(days=5)}))
+    assert response.status_code == 302 and na_replica == 0
+    assert COOKIE_LEITURA_PROPRIA in response.cookies
+    response, no_primario, na_replica = consultas_por_banco(
+        lambda: client.get(reverse('apartamentos:minhas_reservas')))
+    assert na_replica == 0 and list(response.context['reservas']) == list(Reserva.objects.filter(hospede=hospede))
+
+    # Passada a janela, as leituras do mesmo usuário voltam para a réplica (a sessão segue no primário)
+    client.cookies[COOKIE_LEITURA_PROPRIA] = '0'
+    response, no_primario, na_replica = consultas_por_banco(
+        lambda: client.get(reverse('apartamentos:minhas_reservas')))
+    assert response.status_code == 200 and na_replica > 0
+    assert no_primario == 1  # django_session
+
+
+
+@pytest.fixture
+def replica_atrasada(settings, tmp_path):
+    """Aponta a réplica para uma cópia do banco tirada agora (como REPLICA_SQLITE): escritas seguintes não chegam nela."""
+    settings.REPLICAS_LEITURA = ['replica']
+    copia = tmp_path / 'replica.sqlite3'
+    connections['default'].ensure_connection()
+    with closing(sqlite3.connect(copia)) as destino:
+        connections['default'].connection.backup(destino)
+    replica = connections['replica']
+    replica.close()
+    nome_original, replica.settings_dict['NAME'] = replica.settings_dict['NAME'], str(copia)
+    yield
+    replica.close()
+    replica.settings_dict['NAME'] = nome_original
+
+
+@pytest.mark.django_db(transaction=True, databases=['default', 'replica'])
+def test_cache_preenchido_com_replica_atrasada_le_do_primario(client, cenario_reserva, replica_atrasada):
+    apartamento = cenario_reserva['apartamento']
+    apartamento.titulo = 'Cobertura reformada'
+    apartamento.save()
+    ApartamentoComodidade.objects.create(apartamento=apartamento, comodidade=Comodidade.objects.create(nome='Sauna'))
+    assert not Apartamento.objects.using('replica').filter(titulo='Cobertura reformada').exists()
+
+    # A versão já mudou: a página nova da busca e os fragmentos são montados com o que está no primário
+    assert 'Cobertura reformada' in client.get(reverse('apartamentos:lista_apartamentos')).content.decode()
+    url = reverse('apartamentos:detalhe_apartamento', args=[apartamento.pk])
+    assert 'Sauna' in client.get(url).content.decode()
+
+    # Usuário e permissões em cache também: um usuário criado depois da cópia consegue entrar
+    novo = User.objects.create_user('bruno', 'bruno@example.com', 'senha-forte-123')
+    client.force_login(novo)
+    assert client.get(reverse('apartamentos:minhas_reservas')).status_code == 200
+
+
+@pytest.mark.django_db(transaction=True)
+def test_busca_em_cache_por_versao_da_cidade(client, cenario_reserva):
+    apartamento, hospede = cenario_reserva['apartamento'], cenario_reserva['hospede']
+    apartamento.predio.cidade = 'Recife'
+    apartamento.predio.save()
+    outro_predio = Predio.objects.create(nome='Outro', proprietario=apartamento.proprietario, cidade='Natal')
+    url = reverse('apartamentos:lista_apartamentos')
+    hoje = timezone.localdate()
+    busca = {'predio__cidade': 'Recife', 'data_checkin': hoje + timedelta(days=3),
+             'data_checkout': hoje + timedelta(days=5)}
+
+    def titulos(parametros):
+        return [a.titulo for a in client.get(url, parametros).context['apartamentos']]
+
+    assert titulos(busca) == ['Apto para Reservas']
+    # A mesma busca, escrita de outro jeito, sai do cache sem consultar o banco
+    with CaptureQueriesContext(connection) as consultas:
+        assert titulos({**busca, 'predio__cidade': ' RECIFE '}) == ['Apto para Reservas']
+    assert len(consultas) == 0
+
+    # Escrita em outra cidade não invalida a busca restrita a Recife
+    Apartamento.objects.create(titulo='Em Natal', predio=outro_predio, proprietario=apartamento.proprietario,
+                               area_m2=30, preco_diaria=90)
+    with CaptureQueriesContext(connection) as consultas:
+        titulos(busca)
+    assert len(consultas) == 0
+    assert 'Em Natal' in titulos({})
+
+    # Uma reserva bloqueante no período tira o apartamento da busca em cache
+    Reserva.objects.create(apartamento=apartamento, hospede=hospede, data_checkin=hoje + timedelta(days=4),
+                           data_checkout=hoje + timedelta(days=6))
+    assert titulos(busca) == []
+
+    # Unidade que muda para um prédio de outra cidade sai das buscas da cidade antiga
+    sem_datas = {'predio__cidade': 'Recife'}
+    assert titulos(sem_datas) == ['Apto para Reservas']
+    apartamento.predio = outro_predio
+    apartamento.save()
+    assert titulos(sem_datas) == []
+    assert sorted(titulos({'predio__cidade': 'Natal'})) == ['Apto para Reservas', 'Em Natal']
+
+
+def test_busca_expirada_e_recalculada_uma_vez_so():
+    chamadas = []
+
+    def calcular():
+        chamadas.append(1)
+        time.sleep(0.2)
+        return {'page_obj': None, 'facetas': None}
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        resultados = list(executor.map(lambda _: obter_resultado_busca((('q', ('praia',)),), calcular), range(8)))
+    assert len(chamadas) == 1
+    assert all(resultado == {'page_obj': None, 'facetas': None} for resultado in resultados)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_views_assincronas_no_modo_asgi(settings, cenario_reserva):
+    settings.ROOT_URLCONF = 'config.urls_asgi'
+    apartamento, hospede, proprietario = (cenario_reserva['apartamento'], cenario_reserva['hospede'],
+                                          cenario_reserva['proprietario'])
+    hoje = timezone.localdate()
+    reserva = Reserva.objects.create(apartamento=apartamento, hospede=hospede, data_checkin=hoje + timedelta(days=3),
+                                     data_checkout=hoje + timedelta(days=5))
+    url_lista = reverse('apartamentos:lista_apartamentos')
+    url_detalhe = reverse('apartamentos:detalhe_apartamento', args=[apartamento.pk])
+    assert iscoroutinefunction(resolve(url_lista).func) and iscoroutinefunction(resolve(url_detalhe).func)
+
+    async def navegar():
+        client = AsyncClient()
+        respostas = [await client.get(url_lista), await client.get(url_detalhe)]
+        await client.aforce_login(hospede)
+        respostas.append(await client.post(reverse('apartamentos:aprovar_reserva', args=[reserva.pk])))
+        await client.aforce_login(proprietario)
+        respostas.append(await client.get(reverse('apartamentos:reserva_calendario_data', args=[apartamento.pk])))
+        respostas.append(await client.post(reverse('apartamentos:aprovar_reserva', args=[reserva.pk])))
+        respostas.append(await client.post(reverse('apartamentos:aprovar_reserva', args=[reserva.pk])))
+        return respostas
+
+    lista, detalhe, aprovacao_negada, calendario, aprovacao, repetida = async_to_sync(navegar)()
+    assert [a.titulo for a in lista.context['apartamentos']] == ['Apto para Reservas']
+    assert lista.context['page_obj'].total == 1
+    # Datas ocupadas e avaliações consultadas em paralelo antes de renderizar
+    assert detalhe.status_code == 200 and 'Datas Já Reservadas' in detalhe.content.decode()
+    assert aprovacao_negada.status_code == 403
+    assert [evento['title'] for evento in calendario.json()] == ['Hóspede: hospede_teste_reserva']
+    assert aprovacao.json()['status'] == 'success'
+    assert repetida.status_code == 409
+    reserva.refresh_from_db()
+    assert reserva.status == Reserva.StatusReserva.CONFIRMADA
+
+
+def test_collectstatic_gera_pacotes_com_hash_pre_comprimidos_e_imutaveis(settings, tmp_path):
+    estaticos = tmp_path / 'static'
+    (estaticos / 'vendor/lib/images').mkdir(parents=True)
+    (estaticos / 'js').mkdir()
+    (estaticos / 'vendor/lib/images/icone.png').write_bytes(b'png')
+    (estaticos / 'vendor/lib/lib.css').write_text(
+        '.icone { background: url(images/icone.png) }\n' + '.x { color: red }\n' * 200)
+    (estaticos / 'js/a.js').write_text('var a = 1\n')
+    (estaticos / 'js/b.js').write_text('(function () { window.b = a })()\n')
+    settings.STATICFILES_DIRS = [estaticos]
+    # Sem os estáticos do admin: só os arquivos do teste e os pacotes
+    settings.STATICFILES_FINDERS = ['django.contrib.staticfiles.finders.FileSystemFinder',
+                                    'apartamentos.estaticos.PacotesFinder']
+    settings.STATIC_ROOT = tmp_path / 'coletados'
+    settings.PACOTES_ESTATICOS = {'pacotes/app.css': ['vendor/lib/lib.css'], 'pacotes/app.js': ['js/a.js', 'js/b.js']}
+    settings.PACOTES_ESTATICOS_DIR = tmp_path / 'build'
+    settings.STORAGES = {**settings.STORAGES, 'staticfiles': {
+        'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'}}
+
+    call_command('collectstatic', interactive=False, verbosity=0)
+
+    manifesto = json.loads((settings.STATIC_ROOT / 'staticfiles.json').read_text())['paths']
+    css = (settings.STATIC_ROOT / manifesto['pacotes/app.css']).read_text()
+    # url() relativa reescrita para o pacote e apontando para a imagem com hash; sem source maps
+    assert f'url("../{manifesto["vendor/lib/images/icone.png"]}")' in css
+    js = (settings.STATIC_ROOT / manifesto['pacotes/app.js']).read_text()
+    assert 'var a = 1' in js and ';\n/* js/b.js */' in js
+    # Os .map não são publicados: baixar_estaticos_externos tira as referências, que o manifesto recusaria
+    assert remover_source_maps('x=1\n//# sourceMappingURL=x.js.map\n/*# sourceMappingURL=y.css.map */') == 'x=1\n\n'
+    for extensao in ('.gz', '.br'):
+        assert (settings.STATIC_ROOT / (manifesto['pacotes/app.css'] + extensao)).exists()
+
+    middleware = WhiteNoiseMiddleware(lambda request: None)
+    response = middleware(RequestFactory().get(f'/static/{manifesto["pacotes/app.css"]}', HTTP_ACCEPT_ENCODING='br'))
+    assert response['Content-Encoding'] == 'br'
+    assert 'immutable' in response['Cache-Control'] and 'max-age=315360000' in response['Cache-Control']
+
+
+def test_baixar_estaticos_externos_confere_o_sha256(settings, tmp_path, monkeypatch):
+    publicado = b'x=1\n//# sourceMappingURL=lib.js.map\n'
+    monkeypatch.setattr('urllib.request.urlopen', lambda url, timeout: io.BytesIO(publicado))
+    settings.STATICFILES_DIRS = [tmp_path]
+
+    settings.ESTATICOS_EXTERNOS = {'vendor/lib.js': ('https://cdn.exemplo/lib.js', '0' * 64)}
+    with pytest.raises(CommandError, match=hashlib.sha256(publicado).hexdigest()):
+        call_command('baixar_estaticos_externos', stdout=io.StringIO())
+    assert not (tmp_path / 'vendor/lib.js').exists()
+
+    settings.ESTATICOS_EXTERNOS = {'vendor/lib.js': ('https://cdn.exemplo/lib.js', hashlib.sha256(publicado).hexdigest())}
+    call_command('baixar_estaticos_externos', stdout=io.StringIO())
+    assert (tmp_path / 'vendor/lib.js').read_text() == 'x=1\n'
@@ -3,13 +3,15 @@ from .views import (
     ApartamentoListView, ApartamentoDetailView, PredioListView, PredioDetailView,
     SignUpView, perfil_view, PainelProprietarioView, MinhasReservasListView,
     PredioCreateView, ApartamentoCreateView, ApartamentoUpdateView, ApartamentoDeleteView,
-    aprovar_reserva, recusar_reserva, ReservaDetailView, reserva_calendario_data
+    aprovar_reserva, recusar_reserva, ReservaDetailView, reserva_calendario_data, autocompletar_cidades_view,
+    calendario_portfolio_data, calendario_ics
 )
 
 app_name = 'apartamentos'
 
 urlpatterns = [
     path('', ApartamentoListView.as_view(), name='lista_apartamentos'),
+    path('cidades/autocompletar/', autocompletar_cidades_view, name='autocompletar_cidades'),
     path('predios/', PredioListView.as_view(), name='lista_predios'),
     path('predios/<int:pk>/', PredioDetailView.as_view(), name='detalhe_predio'),
     path('apartamento/<int:pk>/', ApartamentoDetailView.as_view(), name='detalhe_apartamento'),
@@ -30,6 +32,8 @@ urlpatterns = [
     path('reserva/<int:pk>/', ReservaDetailView.as_view(), name='detalhe_reserva'),
 
     path('apartamento/<int:pk_apartamento>/calendario-data/', reserva_calendario_data, name='reserva_calendario_data'),
+    path('painel/calendario-data/', calendario_portfolio_data, name='calendario_portfolio_data'),
+    path('calendario/<str:chave>.ics', calendario_ics, name='calendario_ics'),
 
     path('apartamento/<int:pk>/editar/', ApartamentoUpdateView.as_view(), name='editar_apartamento'),
 ]
@@ -0,0 +1,21 @@
+"""Rotas do app no modo ASGI: as mesmas de urls.py, com as views assíncronas de views_async.py onde existem."""
+from django.urls import path
+
+from . import views_async
+from .urls import urlpatterns as urlpatterns_sincronas
+
+app_name = 'apartamentos'
+
+VIEWS_ASSINCRONAS = {
+    'lista_apartamentos': views_async.ApartamentoListView.as_view(),
+    'detalhe_apartamento': views_async.ApartamentoDetailView.as_view(),
+    'aprovar_reserva': views_async.aprovar_reserva,
+    'recusar_reserva': views_async.recusar_reserva,
+    'reserva_calendario_data': views_async.reserva_calendario_data,
+}
+
+urlpatterns = [
+    path(str(rota.pattern), VIEWS_ASSINCRONAS[rota.name], name=rota.name) if rota.name in VIEWS_ASSINCRONAS
+    else rota
+    for rota in urlpatterns_sincronas
+]
@@ -0,0 +1,64 @@
+# apartamentos/utils.py
+import re
+import unicodedata
+
+
+def normalizar_texto(texto):
+    """
+    Normaliza um texto para busca: remove acentos, ignora maiúsculas/minúsculas
+    e colapsa espaços. Ex: '  São  Paulo ' -> 'sao paulo'.
+    """
+    if not texto:
+        return ''
+    decomposto = unicodedata.normalize('NFKD', texto)
+    sem_acentos = ''.join(c for c in decomposto if not unicodedata.combining(c))
+    return ' '.join(sem_acentos.casefold().split())
+
+
+def chave_login(valor):
+    """
+    Chave de login: username/e-mail sem espaços nas pontas e sem diferença de caixa,
+    mas com acentos (ao contrário de normalizar_texto, 'joão' e 'joao' são contas diferentes).
+    """
+    return (valor or '').strip().casefold()
+
+
+# Palavras sem valor de busca, já sem acentos (comparadas depois de normalizar_texto)
+PALAVRAS_VAZIAS = frozenset(
+    'a ao aos as com da das de do dos e em na nas no nos o os ou para pela pelas pelo pelos por um uma uns umas'
+    .split())
+
+# Sufixos de plural do português (sem acentos), do mais longo para o mais curto: sufixo -> substituição
+_SUFIXOS_PLURAL = (('oes', 'ao'), ('aes', 'ao'), ('ais', 'al'), ('eis', 'el'), ('ois', 'ol'), ('ns', 'm'),
+                   ('les', 'l'), ('res', 'r'), ('zes', 'z'))
+_SUFIXOS_DIMINUTIVO = ('zinho', 'zinha', 'inho', 'inha')
+
+
+def radical(palavra):
+    """
+    Stemmer leve para o português, aplicado a palavras já normalizadas: tira o
+    plural, o diminutivo e a vogal final (quartos, quartinho -> quart; praias -> prai).
+    É o mesmo no índice e na consulta, então só precisa ser consistente, não exato.
+    """
+    if len(palavra) < 4 or palavra.isdigit():
+        return palavra
+    for sufixo, troca in _SUFIXOS_PLURAL:
+        if palavra.endswith(sufixo) and len(palavra) > len(sufixo):
+            palavra = palavra[:-len(sufixo)] + troca
+            break
+    else:
+        if palavra.endswith('s') and not palavra.endswith(('ss', 'us')):
+            palavra = palavra[:-1]
+    for sufixo in _SUFIXOS_DIMINUTIVO:
+        if palavra.endswith(sufixo) and len(palavra) - len(sufixo) >= 3:
+            palavra = palavra[:-len(sufixo)]
+            break
+    if len(palavra) > 3 and palavra[-1] in 'aeo':
+        palavra = palavra[:-1]
+    return palavra
+
+
+def termos_busca(texto):
+    """Radicais das palavras de um texto, sem acentos e sem palavras vazias: 'Ótimos quartos' -> ['otim', 'quart']."""
+    return [radical(palavra) for palavra in re.findall(r'[a-z0-9]+', normalizar_texto(texto))
+            if palavra not in PALAVRAS_VAZIAS]
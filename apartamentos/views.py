@@ -1,23 +1,40 @@
-from django.http import HttpResponse, JsonResponse
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
+from datetime import date, timedelta
+
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, TemplateView
 from django.views.generic.edit import FormMixin
 from django.views.decorators.http import require_POST
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin, UserPassesTestMixin
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.contrib.auth.models import Group
+from django.contrib.auth.models import Group, User
 from django.utils import timezone
-from django.db.models import Avg
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, Prefetch, Q
 from django.forms import inlineformset_factory
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.views import View
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import http_date, quote_etag, urlencode
 
-from .services import aprovar_reserva_service, recusar_reserva_service
-from .filters import ApartamentoFilter
+from .services import (
+    aprovar_reserva_service, recusar_reserva_service, criar_reserva_service, apartamentos_ocupados_no_periodo,
+    resumo_painel_proprietario, reservas_na_janela, validadores_calendario
+)
+from .filters import ApartamentoFilter, contar_facetas
+from .ical import TIPO_APARTAMENTO, TIPO_PROPRIETARIO, gerar_ics, ler_chave_ics, url_ics
+from .orcamento import orcar_estadia, orcar_estadias
+from .geo import caixa_do_raio, expressao_distancia_km, filtro_caixa, ler_caixa, ler_circulo
+from .cache import (
+    autocompletar_cidades, cidade_do_prefixo, obter_resultado_busca, versao_apartamento,
+    TEMPO_FRAGMENTOS_APARTAMENTO
+)
+from .paginacao import PaginacaoCursorMixin, paginar_por_cursor
+from .utils import normalizar_texto
 from .models import Apartamento, Predio, Reserva, Avaliacao, FotoApartamento, Perfil
 from .forms import (
     CustomUserCreationForm, PredioForm, ApartamentoForm,
@@ -25,33 +42,51 @@ from .forms import (
     AvaliacaoForm
 )
 
+# Maior janela start/end aceita pelos feeds de calendário, em dias (a visão anual do FullCalendar cabe)
+JANELA_MAXIMA_CALENDARIO = 400
+# Período exportado nos feeds iCalendar, em dias antes e depois de hoje
+JANELA_ICS_PASSADO = 30
+JANELA_ICS_FUTURO = 730
+# Máximo de unidades devolvidas de uma vez no modo mapa da listagem
+MAXIMO_MARCADORES = 500
+# Parâmetros da busca por área do mapa (geo.ler_caixa) e por raio (geo.ler_circulo)
+PARAMETROS_LOCALIZACAO = ('sul', 'oeste', 'norte', 'leste', 'lat', 'lng', 'raio')
+
 
 # ... (HomePageView, SignUpView, perfil_view, ApartamentoListView, PredioListView, PredioDetailView, ApartamentoDetailView, ReservaDetailView, PainelProprietarioView, MinhasReservasListView, PredioCreateView - sem alterações) ...
 class HomePageView(TemplateView): template_name = 'homepage.html'
 
 
+# Papel escolhido no cadastro -> (cargo do perfil, grupo de permissões)
+PAPEIS_CADASTRO = {
+    'CLIENTE': (Perfil.CargoUsuario.CLIENTE, 'Clientes'),
+    'PROPRIETARIO': (Perfil.CargoUsuario.PROPRIETARIO, 'Proprietários'),
+}
+
+
 class SignUpView(CreateView):
     form_class = CustomUserCreationForm
     success_url = reverse_lazy('login')
     template_name = 'registration/signup.html'
 
     def form_valid(self, form):
-        response = super().form_valid(form)
-        user = self.object
-        papel_escolhido = form.cleaned_data.get('papel')
-        try:
-            if papel_escolhido == 'CLIENTE':
-                grupo = Group.objects.get(name='Clientes')
-                user.groups.add(grupo)
-                user.perfil.cargo = Perfil.CargoUsuario.CLIENTE
-            elif papel_escolhido == 'PROPRIETARIO':
-                grupo = Group.objects.get(name='Proprietários')
-                user.groups.add(grupo)
-                user.perfil.cargo = Perfil.CargoUsuario.PROPRIETARIO
-            user.perfil.save()
-        except Group.DoesNotExist:
-            pass
-        return response
+        """
+        Usuário, perfil com o cargo escolhido e grupo em uma transação, sem reescritas:
+        o perfil vai pronto no INSERT feito pelo sinal de criação do User.
+        """
+        papel = PAPEIS_CADASTRO.get(form.cleaned_data.get('papel'))
+        with transaction.atomic():
+            user = form.save(commit=False)
+            # Papel desconhecido ou ausente: perfil com o cargo padrão e nenhum grupo
+            user.perfil = Perfil(cargo=papel[0]) if papel else Perfil()
+            user.save()
+            grupo_id = papel and Group.objects.filter(name=papel[1]).values_list('pk', flat=True).first()
+            if grupo_id:
+                # Sem o m2m_changed de User.groups: o único receptor invalida as permissões em cache, e um
+                # usuário recém-criado não tem vínculos a conferir nem permissões em cache
+                User.groups.through.objects.bulk_create([User.groups.through(user_id=user.pk, group_id=grupo_id)])
+        self.object = user
+        return redirect(self.get_success_url())
 
 
 @login_required
@@ -71,46 +106,184 @@ def perfil_view(request):
     return render(request, 'apartamentos/perfil_edit.html', context)
 
 
+def _ler_periodo(dados):
+    """Lê data_checkin/data_checkout (AAAA-MM-DD) de um QueryDict; retorna (checkin, checkout) ou None."""
+    try:
+        data_checkin = date.fromisoformat(dados.get('data_checkin', ''))
+        data_checkout = date.fromisoformat(dados.get('data_checkout', ''))
+    except ValueError:
+        return None
+    return data_checkin, data_checkout
+
+
+def _links_faixas_preco(request, facetas):
+    """Links das faixas de preço da faceta, mantendo os demais filtros (e voltando para a primeira página)."""
+    links = []
+    for minimo, maximo, total in facetas['precos']:
+        parametros = request.GET.copy()
+        parametros.pop('cursor', None)
+        for nome, valor in (('preco_min', minimo), ('preco_max', maximo)):
+            if valor is None:
+                parametros.pop(nome, None)
+            else:
+                parametros[nome] = valor
+        ativa = (request.GET.get('preco_min') or None) == (minimo and str(minimo)) and \
+                (request.GET.get('preco_max') or None) == (maximo and str(maximo))
+        links.append({'minimo': minimo, 'maximo': maximo, 'total': total, 'ativa': ativa,
+                      'url': f'?{parametros.urlencode()}'})
+    return links
+
+
+def _parametros_normalizados(request):
+    """Parâmetros da busca em forma canônica (ordem, brancos, acentos/caixa de cidade e texto), para o cache."""
+    parametros = []
+    for nome in sorted(request.GET):
+        valores = [valor.strip() for valor in request.GET.getlist(nome) if valor.strip()]
+        if nome in ('predio__cidade', 'q'):
+            valores = [normalizar_texto(valor) for valor in valores]
+        if valores:
+            parametros.append((nome, tuple(sorted(valores))))
+    return tuple(parametros)
+
+
+def _parametros_sem_localizacao(request):
+    parametros = request.GET.copy()
+    for nome in (*PARAMETROS_LOCALIZACAO, 'cursor', 'formato'):
+        parametros.pop(nome, None)
+    return parametros.urlencode()
+
+
+def _consulta_marcadores(queryset):
+    """Modo mapa da listagem (?formato=mapa): só o que o marcador precisa, como valores, até MAXIMO_MARCADORES."""
+    campos = ('pk', 'titulo', 'preco_diaria', 'predio__latitude', 'predio__longitude')
+    # Prédios sem coordenadas (sem CEP conhecido) não têm onde aparecer no mapa; latitude e longitude andam juntas
+    return queryset.filter(predio__latitude__isnull=False).order_by('-data_cadastro', '-pk').values(
+        *campos)[:MAXIMO_MARCADORES + 1]
+
+
+def _montar_marcadores(linhas):
+    marcadores = [{'id': linha['pk'], 'titulo': linha['titulo'], 'preco_diaria': str(linha['preco_diaria']),
+                   'lat': float(linha['predio__latitude']), 'lng': float(linha['predio__longitude']),
+                   'url': reverse('apartamentos:detalhe_apartamento', args=[linha['pk']])}
+                  for linha in linhas[:MAXIMO_MARCADORES]]
+    # truncado avisa o mapa para pedir uma área menor (aproximar o zoom)
+    return {'apartamentos': marcadores, 'truncado': len(linhas) > MAXIMO_MARCADORES}
+
+
+def _marcadores_mapa(queryset):
+    """As unidades da área visível do mapa (para JSON), lidas sem instanciar modelos."""
+    return _montar_marcadores(list(_consulta_marcadores(queryset)))
+
+
 class ApartamentoListView(View):
     template_name = 'apartamentos/apartamento_list.html'
+    por_pagina = 9
 
     def get(self, request, *args, **kwargs):
-        base_queryset = Apartamento.objects.filter(disponivel=True).select_related('predio')
-        filterset = ApartamentoFilter(request.GET, queryset=base_queryset)
-        queryset_filtrado = filterset.qs
-        data_checkin_str = request.GET.get('data_checkin', '')
-        data_checkout_str = request.GET.get('data_checkout', '')
-        if data_checkin_str and data_checkout_str:
-            try:
-                data_checkin = timezone.datetime.strptime(data_checkin_str, '%Y-%m-%d').date()
-                data_checkout = timezone.datetime.strptime(data_checkout_str, '%Y-%m-%d').date()
-                status_bloqueantes = [Reserva.StatusReserva.CONFIRMADA, Reserva.StatusReserva.PENDENTE]
-                apartamentos_indisponiveis_ids = Reserva.objects.filter(status__in=status_bloqueantes,
-                                                                        data_checkin__lte=data_checkout,
-                                                                        data_checkout__gte=data_checkin).values_list(
-                    'apartamento_id', flat=True)
-                queryset_filtrado = queryset_filtrado.exclude(pk__in=apartamentos_indisponiveis_ids)
-            except ValueError:
-                pass
-        final_queryset = queryset_filtrado.distinct().order_by('-data_cadastro')
-        paginator = Paginator(final_queryset, 9)
-        page_number = request.GET.get('page')
-        try:
-            page_obj = paginator.page(page_number)
-        except (PageNotAnInteger, EmptyPage):
-            page_obj = paginator.page(1)
+        filterset, periodo, circulo, caixa = self.ler_busca(request)
+        # Buscas iguais reaproveitam o resultado em cache até algo mudar nos apartamentos, reservas ou
+        # prédios (ver cache.obter_resultado_busca); restritas a uma cidade, só alterações nela contam
+        resultado = obter_resultado_busca(_parametros_normalizados(request),
+                                          lambda: self.calcular_resultado(request, periodo, circulo, caixa),
+                                          cidade=cidade_do_prefixo(request.GET.get('predio__cidade', '')))
+        return self.responder(request, resultado, filterset, periodo, caixa)
+
+    @staticmethod
+    def ler_busca(request):
+        """Formulário de filtros (sem consultar) e o período, o raio e a área do mapa pedidos."""
+        filterset = ApartamentoFilter(request.GET, queryset=Apartamento.objects.none())
+        periodo = _ler_periodo(request.GET)
+        circulo = ler_circulo(request.GET)
+        caixa = caixa_do_raio(*circulo) if circulo else ler_caixa(request.GET)
+        return filterset, periodo, circulo, caixa
+
+    def responder(self, request, resultado, filterset, periodo, caixa):
+        if request.GET.get('formato') == 'mapa':
+            return JsonResponse(resultado)
+        # A página em cache leva só os itens e os cursores; os links saem dos parâmetros desta requisição
+        page_obj = resultado['page_obj'].com_links(_parametros_normalizados(request))
+        facetas = resultado['facetas']
+        if periodo:
+            # Total da estadia de todos os cards da página de uma vez (ver orcamento.orcar_estadias)
+            orcamentos = orcar_estadias(page_obj.object_list, *periodo)
+            for apartamento in page_obj.object_list:
+                apartamento.orcamento = orcamentos.get(apartamento.pk)
         context = {'apartamentos': page_obj.object_list, 'page_obj': page_obj,
                    'is_paginated': page_obj.has_other_pages(), 'filter': filterset,
-                   'cidades_disponiveis': Predio.objects.order_by('cidade').values_list('cidade', flat=True).distinct(),
-                   'is_search': bool(request.GET)}
+                   'is_search': bool(request.GET), 'facetas': facetas,
+                   'faixas_preco': _links_faixas_preco(request, facetas),
+                   'comodidades_marcadas': request.GET.getlist('comodidades'),
+                   # A área do mapa / o raio continuam valendo quando o formulário é reenviado
+                   'campos_localizacao': [(nome, request.GET[nome]) for nome in PARAMETROS_LOCALIZACAO
+                                          if request.GET.get(nome)],
+                   'busca_localizada': bool(caixa),
+                   'parametros_sem_localizacao': _parametros_sem_localizacao(request),
+                   'parametros_periodo': urlencode({'data_checkin': periodo[0], 'data_checkout': periodo[1]})
+                   if periodo else ''}
         return render(request, self.template_name, context)
 
+    def calcular_resultado(self, request, periodo, circulo, caixa):
+        """Roda a busca: página de resultados + facetas, ou os marcadores no modo mapa."""
+        queryset_filtrado = self.filtrar(request, periodo, circulo, caixa)
+        if request.GET.get('formato') == 'mapa':
+            return _marcadores_mapa(queryset_filtrado)
+        # Contagens por quartos, comodidade e faixa de preço de todos os resultados, em uma consulta
+        facetas = contar_facetas(queryset_filtrado)
+        # Paginação por cursor: a página N custa o mesmo que a primeira (sem COUNT(*) completo nem OFFSET)
+        page_obj = paginar_por_cursor(request, queryset_filtrado.distinct(),
+                                      self.ordenacao(request, queryset_filtrado, circulo), self.por_pagina,
+                                      contar=True, links=False)
+        return {'page_obj': page_obj, 'facetas': facetas}
+
+    @staticmethod
+    def filtrar(request, periodo, circulo, caixa):
+        """Queryset dos resultados da busca, ainda sem ordenação."""
+        base_queryset = Apartamento.objects.filter(disponivel=True).select_related('predio').com_foto_capa()
+        queryset_filtrado = ApartamentoFilter(request.GET, queryset=base_queryset).qs
+        if periodo:
+            # Consulta o índice de disponibilidade (OcupacaoDiaria) em vez de varrer todas as reservas
+            apartamentos_indisponiveis_ids = apartamentos_ocupados_no_periodo(*periodo)
+            queryset_filtrado = queryset_filtrado.exclude(pk__in=apartamentos_indisponiveis_ids)
+        # Busca por raio (?lat=&lng=&raio=) ou pela área visível do mapa (?sul=&oeste=&norte=&leste=): as
+        # células da grade (índice de celula_geo) recortam os candidatos antes da conta exata (ver geo.py)
+        if caixa:
+            queryset_filtrado = queryset_filtrado.filter(filtro_caixa(*caixa, prefixo='predio__'))
+        if circulo:
+            queryset_filtrado = queryset_filtrado.annotate(
+                distancia_km=expressao_distancia_km(circulo[0], circulo[1], prefixo='predio__')
+            ).filter(distancia_km__lte=circulo[2])
+        return queryset_filtrado
+
+    @staticmethod
+    def ordenacao(request, queryset_filtrado, circulo):
+        if request.GET.get('ordenar') == 'avaliacao':
+            return '-nota_media', '-avaliacoes_total', '-data_cadastro'
+        if 'relevancia' in queryset_filtrado.query.annotations:
+            # Com busca por texto (?q=), os mais relevantes vêm primeiro
+            return '-relevancia', '-data_cadastro'
+        if circulo:
+            # Na busca por raio, os mais próximos vêm primeiro
+            return 'distancia_km', '-data_cadastro'
+        return ('-data_cadastro',)
+
+
+def autocompletar_cidades_view(request):
+    """Retorna em JSON as cidades que começam com o texto digitado (?q=), sem acentuação/caixa."""
+    try:
+        limite = max(1, min(int(request.GET.get('limite', 10)), 50))
+    except ValueError:
+        limite = 10
+    response = JsonResponse({'cidades': autocompletar_cidades(request.GET.get('q', ''), limite=limite)})
+    patch_cache_control(response, public=True, max_age=300)
+    return response
+
 
-class PredioListView(ListView):
+class PredioListView(PaginacaoCursorMixin, ListView):
     model = Predio;
     template_name = 'apartamentos/predio_list.html';
     context_object_name = 'predios';
     paginate_by = 10
+    ordenacao_cursor = ('nome',)
 
     def get(self, request, *args, **kwargs):
         queryset = self.get_queryset()
@@ -125,7 +298,11 @@ class PredioDetailView(DetailView):
     template_name = 'apartamentos/predio_detail.html';
     context_object_name = 'predio'
 
-    def get_queryset(self): return super().get_queryset().prefetch_related('apartamentos__proprietario')
+    def get_queryset(self):
+        # As unidades já vêm com a foto de capa anotada: uma única consulta para todos os cards
+        apartamentos = Apartamento.objects.select_related('proprietario').com_foto_capa()
+        return super().get_queryset().select_related('proprietario').prefetch_related(
+            Prefetch('apartamentos', queryset=apartamentos))
 
 
 class ApartamentoDetailView(FormMixin, DetailView):
@@ -139,21 +316,44 @@ class ApartamentoDetailView(FormMixin, DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['form'] = self.get_form()
+        # Galeria, comodidades, datas ocupadas e avaliações ficam em fragmentos {% cache %} versionados por
+        # apartamento (ver cache.versao_apartamento). As consultas abaixo são preguiçosas: só rodam quando
+        # o fragmento correspondente não está em cache, e no primário, porque o que elas lerem fica guardado
+        # sob a versão atual (uma réplica atrasada gravaria o conteúdo de antes da alteração).
+        context['versao_cache'] = versao_apartamento(self.object.pk)
+        context['tempo_cache'] = TEMPO_FRAGMENTOS_APARTAMENTO
+        context['hoje'] = timezone.localdate()
+        context['fotos'] = self.object.fotos.using(DEFAULT_DB_ALIAS)
+        context['comodidades'] = self.object.apartamentocomodidade_set.using(DEFAULT_DB_ALIAS).select_related(
+            'comodidade').order_by('comodidade__nome')
         status_bloqueantes = [Reserva.StatusReserva.CONFIRMADA, Reserva.StatusReserva.PENDENTE]
-        context['datas_ocupadas'] = self.object.reservas.filter(status__in=status_bloqueantes,
-                                                                data_checkout__gte=timezone.localdate()).order_by(
-            'data_checkin')
-        apartamento = self.get_object()
-        avaliacoes = Avaliacao.objects.filter(reserva__apartamento=apartamento).order_by('-data_avaliacao')
-        nota_media = avaliacoes.aggregate(Avg('nota'))['nota__avg']
-        context['avaliacoes'] = avaliacoes
-        context['nota_media'] = nota_media
+        context['datas_ocupadas'] = self.object.reservas.using(DEFAULT_DB_ALIAS).filter(
+            status__in=status_bloqueantes, data_checkout__gte=timezone.localdate()).order_by('data_checkin')
+        context['avaliacoes'] = Avaliacao.objects.using(DEFAULT_DB_ALIAS).filter(
+            reserva__apartamento=self.object).select_related('reserva__hospede').order_by('-data_avaliacao')
+        # Nota média e histograma vêm dos agregados armazenados no apartamento: sem consulta extra se ele
+        # já foi lido do primário, senão só os agregados, e só quando o fragmento não está em cache
+        context['resumo_avaliacoes'] = SimpleLazyObject(self._resumo_avaliacoes)
+        # Orçamento da estadia quando o período vem na URL (links da busca) ou no formulário enviado
+        periodo = _ler_periodo(self.request.POST if self.request.method == 'POST' else self.request.GET)
+        if periodo:
+            context['orcamento'] = orcar_estadia(self.object, *periodo)
+        if self.request.user == self.object.proprietario:
+            context['url_ics'] = self.request.build_absolute_uri(url_ics(TIPO_APARTAMENTO, self.object.pk))
         return context
 
+    def _resumo_avaliacoes(self):
+        if self.object._state.db == DEFAULT_DB_ALIAS:
+            return self.object
+        return Apartamento.objects.using(DEFAULT_DB_ALIAS).only(*Apartamento.CAMPOS_AGREGADOS).get(pk=self.object.pk)
+
+    def get_initial(self):
+        periodo = _ler_periodo(self.request.GET)
+        return {'data_checkin': periodo[0], 'data_checkout': periodo[1]} if periodo else {}
+
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
-        kwargs['apartamento'] = self.get_object()
+        kwargs['apartamento'] = self.object
         return kwargs
 
     def post(self, request, *args, **kwargs):
@@ -165,25 +365,18 @@ class ApartamentoDetailView(FormMixin, DetailView):
             return self.form_invalid(form)
 
     def form_valid(self, form):
-        reserva = form.save(commit=False)
-        reserva.apartamento = self.object
-        reserva.hospede = self.request.user
-        reserva.save()
-        messages.success(self.request, "Sua solicitação de reserva foi enviada com sucesso!")
+        # O form já avisa sobre conflitos visíveis; o serviço repete a verificação com o apartamento bloqueado
         try:
-            proprietario = self.object.proprietario
-            contexto_email = {'proprietario': proprietario, 'hospede': reserva.hospede, 'apartamento': self.object,
-                              'reserva': reserva}
-            corpo_email = render_to_string('emails/notificacao_nova_reserva.txt', contexto_email)
-            send_mail(subject=f'Nova Solicitação de Reserva para "{self.object.titulo}"', message=corpo_email,
-                      from_email='nao-responda@aluguelpro.com', recipient_list=[proprietario.email],
-                      fail_silently=False)
-        except Exception as e:
-            print(f"ERRO ao enviar e-mail de notificação: {e}")
+            criar_reserva_service(self.object, self.request.user, form.cleaned_data['data_checkin'],
+                                  form.cleaned_data['data_checkout'])
+        except ValidationError as e:
+            form.add_error(None, e)
+            return self.form_invalid(form)
+        messages.success(self.request, "Sua solicitação de reserva foi enviada com sucesso!")
         return super().form_valid(form)
 
     def get_queryset(self):
-        return super().get_queryset().select_related('predio', 'proprietario').prefetch_related('fotos', 'comodidades')
+        return super().get_queryset().select_related('predio', 'proprietario')
 
 
 class ReservaDetailView(LoginRequiredMixin, UserPassesTestMixin, DetailView):
@@ -229,25 +422,44 @@ class PainelProprietarioView(PermissionRequiredMixin, TemplateView):
     template_name = 'apartamentos/painel_proprietario.html';
     permission_required = 'apartamentos.add_apartamento'
 
+    por_pagina = 10
+    unidades_por_predio = 10
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         user = self.request.user
-        context['predios'] = Predio.objects.filter(proprietario=user).prefetch_related('apartamentos')
-        reservas = Reserva.objects.filter(apartamento__proprietario=user).select_related('hospede',
-                                                                                         'apartamento').order_by(
-            '-data_checkin')
-        context['reservas_pendentes'] = reservas.filter(status=Reserva.StatusReserva.PENDENTE)
-        context['reservas_confirmadas'] = reservas.filter(status=Reserva.StatusReserva.CONFIRMADA)
-        context['historico_reservas'] = reservas.filter(status__in=[Reserva.StatusReserva.CANCELADA])
+        hoje = timezone.localdate()
+        # Contadores e indicadores em uma única consulta; cada lista abaixo é paginada por cursor de forma
+        # independente, então o custo do painel não cresce com o histórico de reservas.
+        context['resumo'] = resumo_painel_proprietario(user)
+        reservas = Reserva.objects.filter(apartamento__proprietario=user).select_related('hospede', 'apartamento')
+        context['reservas_pendentes'] = paginar_por_cursor(
+            self.request, reservas.filter(status=Reserva.StatusReserva.PENDENTE), ('data_checkin', 'pk'),
+            self.por_pagina, parametro='pendentes')
+        context['reservas_confirmadas'] = paginar_por_cursor(
+            self.request, reservas.filter(status=Reserva.StatusReserva.CONFIRMADA, data_checkout__gte=hoje),
+            ('data_checkin', 'pk'), self.por_pagina, parametro='confirmadas')
+        context['historico_reservas'] = paginar_por_cursor(
+            self.request, reservas.filter(Q(status=Reserva.StatusReserva.CANCELADA) | Q(data_checkout__lt=hoje)),
+            ('-data_checkin', '-pk'), self.por_pagina, parametro='historico')
+        # Só as primeiras unidades de cada prédio da página (prefetch fatiado, com window function)
+        unidades = Apartamento.objects.order_by('titulo', 'pk')[:self.unidades_por_predio]
+        predios = Predio.objects.filter(proprietario=user).annotate(
+            total_unidades=Count('apartamentos')).prefetch_related(
+            Prefetch('apartamentos', queryset=unidades, to_attr='primeiras_unidades'))
+        context['predios'] = paginar_por_cursor(self.request, predios, ('nome', 'pk'), self.por_pagina,
+                                                parametro='predios')
+        context['url_ics_portfolio'] = self.request.build_absolute_uri(url_ics(TIPO_PROPRIETARIO, user.pk))
         context['titulo_pagina'] = "Painel do Proprietário"
         return context
 
 
-class MinhasReservasListView(LoginRequiredMixin, ListView):
+class MinhasReservasListView(LoginRequiredMixin, PaginacaoCursorMixin, ListView):
     model = Reserva;
     template_name = 'apartamentos/minhas_reservas.html';
     context_object_name = 'reservas';
     paginate_by = 10
+    ordenacao_cursor = ('-data_checkin', '-pk')
 
     def get_queryset(self): return Reserva.objects.filter(hospede=self.request.user).select_related(
         'apartamento__predio').order_by('-data_checkin')
@@ -357,18 +569,23 @@ class ApartamentoDeleteView(PermissionRequiredMixin, UserPassesTestMixin, Delete
 @require_POST
 @login_required
 def aprovar_reserva(request, pk):
-    reserva = get_object_or_404(Reserva, pk=pk)
+    # Apartamento (dono, e-mail), prédio (invalidação da busca da cidade) e hóspede (e-mail) na mesma consulta
+    reserva = get_object_or_404(Reserva.objects.select_related('apartamento__predio', 'hospede'), pk=pk)
     try:
         aprovar_reserva_service(reserva=reserva, usuario=request.user)
         return JsonResponse({'status': 'success', 'message': 'Reserva aprovada com sucesso!'})
     except PermissionError as e:
         return JsonResponse({'status': 'error', 'message': str(e)}, status=403)
+    except ValidationError as e:
+        # Reserva que não está mais pendente ou cujos dias já foram ocupados
+        return JsonResponse({'status': 'error', 'message': e.messages[0]}, status=409)
 
 
 @require_POST
 @login_required
 def recusar_reserva(request, pk):
-    reserva = get_object_or_404(Reserva, pk=pk)
+    # Apartamento (dono, e-mail), prédio (invalidação da busca da cidade) e hóspede (e-mail) na mesma consulta
+    reserva = get_object_or_404(Reserva.objects.select_related('apartamento__predio', 'hospede'), pk=pk)
     try:
         recusar_reserva_service(reserva=reserva, usuario=request.user)
         return JsonResponse({'status': 'success', 'message': 'Reserva recusada.'})
@@ -376,15 +593,105 @@ def recusar_reserva(request, pk):
         return JsonResponse({'status': 'error', 'message': str(e)}, status=403)
 
 
+def _janela_calendario(request):
+    """Lê a janela start/end enviada pelo FullCalendar (datas ISO, com ou sem horário)."""
+    hoje = timezone.localdate()
+    try:
+        inicio = date.fromisoformat(request.GET['start'][:10]) if request.GET.get('start') else hoje - timedelta(days=31)
+        fim = date.fromisoformat(request.GET['end'][:10]) if request.GET.get('end') else hoje + timedelta(days=366)
+    except ValueError:
+        return None
+    if fim <= inicio or (fim - inicio).days > JANELA_MAXIMA_CALENDARIO:
+        return None
+    return inicio, fim
+
+
+def _feed_calendario(request, reservas, titulo_evento):
+    """
+    Responde o feed JSON do FullCalendar para as reservas da janela pedida, com
+    ETag/Last-Modified: uma janela sem alterações volta como 304, sem montar os eventos.
+    """
+    janela = _janela_calendario(request)
+    if janela is None:
+        return JsonResponse({'error': 'Parâmetros start/end inválidos.'}, status=400)
+    reservas = reservas_na_janela(reservas, *janela)
+    etag, ultima_alteracao = validadores_calendario(reservas, request.get_full_path())
+    last_modified = ultima_alteracao.timestamp() if ultima_alteracao else None
+    response = get_conditional_response(request, etag=quote_etag(etag), last_modified=last_modified)
+    if response is None:
+        eventos = [_evento_calendario(reserva, titulo_evento) for reserva in _reservas_do_feed(reservas)]
+        response = JsonResponse(eventos, safe=False)
+    return _com_validadores_feed(response, etag, last_modified)
+
+
+def _reservas_do_feed(reservas):
+    return reservas.filter(status__in=Reserva.STATUS_BLOQUEANTES).order_by('data_checkin', 'pk').values(
+        'status', 'data_checkin', 'data_checkout', 'apartamento_id', 'apartamento__titulo', 'hospede__username')
+
+
+def _evento_calendario(reserva, titulo_evento):
+    return {'title': titulo_evento(reserva), 'start': reserva['data_checkin'].isoformat(),
+            'end': reserva['data_checkout'].isoformat(),
+            'color': 'orange' if reserva['status'] == Reserva.StatusReserva.PENDENTE else 'green',
+            'extendedProps': {'apartamento': reserva['apartamento_id']}}
+
+
+def _com_validadores_feed(response, etag, last_modified):
+    response['ETag'] = quote_etag(etag)
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    # Dados de um único proprietário: o navegador pode guardar, mas sempre revalida
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
 @login_required
 def reserva_calendario_data(request, pk_apartamento):
     apartamento = get_object_or_404(Apartamento, pk=pk_apartamento)
     if request.user != apartamento.proprietario: return JsonResponse({'error': 'Não autorizado'}, status=403)
-    reservas = Reserva.objects.filter(apartamento=apartamento,
-                                      status__in=[Reserva.StatusReserva.PENDENTE, Reserva.StatusReserva.CONFIRMADA])
-    eventos = []
-    for reserva in reservas:
-        eventos.append({'title': f"Hóspede: {reserva.hospede.username}", 'start': reserva.data_checkin.isoformat(),
-                        'end': reserva.data_checkout.isoformat(),
-                        'color': 'orange' if reserva.status == Reserva.StatusReserva.PENDENTE else 'green'})
-    return JsonResponse(eventos, safe=False)
\ No newline at end of file
+    return _feed_calendario(request, Reserva.objects.filter(apartamento=apartamento),
+                            lambda reserva: f"Hóspede: {reserva['hospede__username']}")
+
+
+@login_required
+def calendario_portfolio_data(request):
+    """Feed com as reservas de todos os apartamentos do proprietário logado, em uma única requisição."""
+    if not request.user.has_perm('apartamentos.add_apartamento'):
+        return JsonResponse({'error': 'Não autorizado'}, status=403)
+    return _feed_calendario(request, Reserva.objects.filter(apartamento__proprietario=request.user),
+                            lambda reserva: f"{reserva['apartamento__titulo']} - {reserva['hospede__username']}")
+
+
+def calendario_ics(request, chave):
+    """
+    Feed iCalendar das reservas pendentes e confirmadas, para gerenciadores de canais.
+    Sem login: a chave assinada na URL identifica o apartamento ou o proprietário.
+    O arquivo é gerado em streaming, e um feed sem alterações volta como 304.
+    """
+    try:
+        tipo, pk = ler_chave_ics(chave)
+    except signing.BadSignature:
+        raise Http404
+    if tipo == TIPO_APARTAMENTO:
+        apartamento = get_object_or_404(Apartamento.objects.only('titulo'), pk=pk)
+        reservas, nome = Reserva.objects.filter(apartamento_id=pk), apartamento.titulo
+    else:
+        proprietario = get_object_or_404(User.objects.only('username'), pk=pk)
+        reservas, nome = Reserva.objects.filter(apartamento__proprietario_id=pk), f'Reservas de {proprietario.username}'
+    hoje = timezone.localdate()
+    reservas = reservas_na_janela(reservas, hoje - timedelta(days=JANELA_ICS_PASSADO),
+                                  hoje + timedelta(days=JANELA_ICS_FUTURO))
+    etag, ultima_alteracao = validadores_calendario(reservas, chave, hoje)
+    last_modified = ultima_alteracao.timestamp() if ultima_alteracao else None
+    response = get_conditional_response(request, etag=quote_etag(etag), last_modified=last_modified)
+    if response is None:
+        bloqueantes = reservas.filter(status__in=Reserva.STATUS_BLOQUEANTES).order_by('data_checkin', 'pk').values(
+            'id', 'status', 'data_checkin', 'data_checkout', 'data_atualizacao', 'apartamento__titulo')
+        response = StreamingHttpResponse(gerar_ics(bloqueantes.iterator(chunk_size=500), nome),
+                                         content_type='text/calendar; charset=utf-8')
+        response['Content-Disposition'] = 'inline; filename="calendario.ics"'
+    response['ETag'] = quote_etag(etag)
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
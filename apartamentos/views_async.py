@@ -0,0 +1,175 @@
+# apartamentos/views_async.py
+"""
+Versões assíncronas das views de navegação e dos feeds, servidas no modo ASGI
+(config/asgi.py usa config/urls_asgi.py, que troca estas rotas por estas views).
+
+O ORM assíncrono do Django ainda roda cada consulta em uma thread
+(sync_to_async), mas o worker não fica preso esperando o banco: enquanto uma
+requisição espera, o event loop atende outras. Consultas independentes da
+mesma requisição rodam ao mesmo tempo com _em_paralelo, cada uma na sua
+thread e, portanto, na sua própria conexão. As threads vêm de um pool limitado
+a settings.CONSULTAS_PARALELAS_ASGI por processo, o que limita também as
+conexões abertas por essas consultas.
+
+Regras de negócio, transações e templates continuam nas funções síncronas de
+views.py e services.py, chamadas por sync_to_async.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.exceptions import ValidationError
+from django.db import close_old_connections
+from django.http import JsonResponse
+from django.shortcuts import aget_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.views.decorators.http import require_POST
+
+from . import views
+from .cache import aobter_resultado_busca, cidade_do_prefixo
+from .filters import contar_facetas
+from .models import Apartamento, Reserva
+from .paginacao import contar_limitado, paginar_por_cursor
+from .services import aprovar_reserva_service, recusar_reserva_service, reservas_na_janela, validadores_calendario
+
+# Fragmentos {% cache %} de apartamento_detail.html: nome -> variável do contexto que ele consulta.
+# O vary_on de todos é (apartamento.pk, versao_cache), mais `hoje` nas datas ocupadas.
+FRAGMENTOS_DETALHE = {
+    'apto_galeria': 'fotos',
+    'apto_comodidades': 'comodidades',
+    'apto_datas_ocupadas': 'datas_ocupadas',
+    'apto_avaliacoes': 'avaliacoes',
+}
+
+
+def _fechando_conexoes(funcao):
+    # As threads do pool não passam pelos sinais de início/fim de requisição que fecham as conexões
+    def executar():
+        try:
+            return funcao()
+        finally:
+            close_old_connections()
+    return executar
+
+
+# Sem conexões persistentes no ASGI, cada thread ocupada abre a sua conexão: o pool limita quantas por processo
+_executor_consultas = ThreadPoolExecutor(max_workers=settings.CONSULTAS_PARALELAS_ASGI,
+                                         thread_name_prefix='consultas_paralelas')
+
+
+async def _em_paralelo(*funcoes):
+    """Roda funções síncronas independentes (sem argumentos) ao mesmo tempo; retorna os resultados na ordem."""
+    return await asyncio.gather(*(sync_to_async(_fechando_conexoes(funcao), thread_sensitive=False,
+                                                executor=_executor_consultas)()
+                                  for funcao in funcoes))
+
+
+class ApartamentoListView(views.ApartamentoListView):
+    """Mesma busca de views.ApartamentoListView; página, total e facetas são consultados em paralelo."""
+
+    async def get(self, request, *args, **kwargs):
+        filterset, periodo, circulo, caixa = self.ler_busca(request)
+        cidade = await sync_to_async(cidade_do_prefixo)(request.GET.get('predio__cidade', ''))
+        resultado = await aobter_resultado_busca(views._parametros_normalizados(request),
+                                                 lambda: self.acalcular_resultado(request, periodo, circulo, caixa),
+                                                 cidade=cidade)
+        return await sync_to_async(self.responder)(request, resultado, filterset, periodo, caixa)
+
+    async def acalcular_resultado(self, request, periodo, circulo, caixa):
+        # Validar os filtros pode consultar o banco (comodidades escolhidas)
+        queryset_filtrado = await sync_to_async(self.filtrar)(request, periodo, circulo, caixa)
+        if request.GET.get('formato') == 'mapa':
+            return views._montar_marcadores([linha async for linha in views._consulta_marcadores(queryset_filtrado)])
+        resultados = queryset_filtrado.distinct()
+        page_obj, (total, exato), facetas = await _em_paralelo(
+            partial(paginar_por_cursor, request, resultados, self.ordenacao(request, queryset_filtrado, circulo),
+                    self.por_pagina, links=False),
+            partial(contar_limitado, resultados),
+            partial(contar_facetas, queryset_filtrado),
+        )
+        page_obj.total, page_obj.total_exato = total, exato
+        return {'page_obj': page_obj, 'facetas': facetas}
+
+
+class ApartamentoDetailView(views.ApartamentoDetailView):
+    """
+    GET assíncrono: os fragmentos da página que não estão em cache (datas ocupadas,
+    avaliações, galeria, comodidades) são consultados em paralelo antes de renderizar.
+    O POST (pedido de reserva) continua o síncrono, com a sua transação.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        self.object = await aget_object_or_404(self.get_queryset(), pk=self.kwargs['pk'])
+        context = await sync_to_async(self.get_context_data)(object=self.object)
+        await self._carregar_fragmentos(context)
+        return self.render_to_response(context)
+
+    async def post(self, request, *args, **kwargs):
+        return await sync_to_async(super().post)(request, *args, **kwargs)
+
+    async def _carregar_fragmentos(self, context):
+        vary_on = [self.object.pk, context['versao_cache']]
+        chaves = {make_template_fragment_key(nome, vary_on + [context['hoje']] if nome == 'apto_datas_ocupadas'
+                                             else vary_on): variavel
+                  for nome, variavel in FRAGMENTOS_DETALHE.items()}
+        em_cache = await cache.aget_many(list(chaves))
+        pendentes = [variavel for chave, variavel in chaves.items() if chave not in em_cache]
+        resultados = await _em_paralelo(*(partial(list, context[variavel]) for variavel in pendentes))
+        context.update(zip(pendentes, resultados))
+
+
+async def _feed_calendario(request, reservas, titulo_evento):
+    """views._feed_calendario com o ORM assíncrono (ETag/Last-Modified e 304 iguais)."""
+    janela = views._janela_calendario(request)
+    if janela is None:
+        return JsonResponse({'error': 'Parâmetros start/end inválidos.'}, status=400)
+    reservas = reservas_na_janela(reservas, *janela)
+    etag, ultima_alteracao = await sync_to_async(validadores_calendario)(reservas, request.get_full_path())
+    last_modified = ultima_alteracao.timestamp() if ultima_alteracao else None
+    response = get_conditional_response(request, etag=quote_etag(etag), last_modified=last_modified)
+    if response is None:
+        eventos = [views._evento_calendario(reserva, titulo_evento)
+                   async for reserva in views._reservas_do_feed(reservas)]
+        response = JsonResponse(eventos, safe=False)
+    return views._com_validadores_feed(response, etag, last_modified)
+
+
+@login_required
+async def reserva_calendario_data(request, pk_apartamento):
+    usuario = await request.auser()
+    apartamento = await aget_object_or_404(Apartamento.objects.only('proprietario_id'), pk=pk_apartamento)
+    if usuario.pk != apartamento.proprietario_id: return JsonResponse({'error': 'Não autorizado'}, status=403)
+    return await _feed_calendario(request, Reserva.objects.filter(apartamento_id=apartamento.pk),
+                                  lambda reserva: f"Hóspede: {reserva['hospede__username']}")
+
+
+async def _executar_acao_reserva(request, pk, servico, mensagem):
+    # Apartamento (dono, e-mail), prédio (invalidação da busca da cidade) e hóspede (e-mail) na mesma consulta
+    reserva = await aget_object_or_404(Reserva.objects.select_related('apartamento__predio', 'hospede'), pk=pk)
+    usuario = await request.auser()
+    try:
+        # A mudança de status e o e-mail na caixa de saída continuam na transação síncrona do serviço
+        await sync_to_async(servico)(reserva=reserva, usuario=usuario)
+    except PermissionError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=403)
+    except ValidationError as e:
+        return JsonResponse({'status': 'error', 'message': e.messages[0]}, status=409)
+    return JsonResponse({'status': 'success', 'message': mensagem})
+
+
+@require_POST
+@login_required
+async def aprovar_reserva(request, pk):
+    return await _executar_acao_reserva(request, pk, aprovar_reserva_service, 'Reserva aprovada com sucesso!')
+
+
+@require_POST
+@login_required
+async def recusar_reserva(request, pk):
+    return await _executar_acao_reserva(request, pk, recusar_reserva_service, 'Reserva recusada.')
@@ -4,7 +4,9 @@ set -o errexit
 
 pip install -r requirements.txt
 
+python manage.py baixar_estaticos_externos --settings=config.settings.production
 python manage.py collectstatic --no-input --settings=config.settings.production
 python manage.py migrate --settings=config.settings.production
+python manage.py createcachetable --settings=config.settings.production
 python manage.py criar_grupos --settings=config.settings.production
 python manage.py setup_initial_data --settings=config.settings.production
@@ -3,6 +3,26 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Modo ASGI: a lista de apartamentos, o detalhe (GET), o feed do calendário e a
+aprovação/recusa de reservas são servidos pelas views assíncronas de
+apartamentos/views_async.py (config/urls_asgi.py); as demais continuam
+síncronas. Para servir:
+
+    gunicorn config.asgi:application -k uvicorn_worker.UvicornWorker -w 4
+
+ou, sem gunicorn, ``uvicorn config.asgi:application --workers 4``. O modo WSGI
+continua disponível (``gunicorn config.wsgi:application -w 4``); para comparar
+os dois com os mesmos dados: ``python manage.py comparar_servidores``.
+
+Custo em conexões: no ASGI as conexões não são persistentes (CONN_MAX_AGE = 0),
+e as consultas paralelas de uma requisição (até 4 no detalhe, 3 na lista) abrem
+cada uma a sua. Por processo, essas consultas usam no máximo
+CONSULTAS_PARALELAS_ASGI threads (padrão 8), então conte até
+workers x (CONSULTAS_PARALELAS_ASGI + 1) conexões no banco (o +1 é a thread
+das views síncronas), mais as aberturas de conexão a cada consulta: com um
+pooler (PgBouncer) na frente do PostgreSQL elas ficam baratas. Sem ele, o modo
+WSGI com conexões persistentes pode render mais; meça com comparar_servidores.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -11,6 +31,7 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings.production')
+os.environ['DJANGO_SERVIDOR'] = 'asgi'
 
 application = get_asgi_application()
@@ -17,8 +17,9 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
-    'cloudinary_storage',
     'django.contrib.staticfiles',
+    # Depois do staticfiles: o collectstatic do Django (com o WhiteNoise) é o que vale; o Cloudinary fica só com a mídia
+    'cloudinary_storage',
     'cloudinary',
     # Nossos Apps
     'apartamentos.apps.ApartamentosConfig',
@@ -29,7 +30,8 @@ INSTALLED_APPS = [
 # Middlewares (comuns a todos os ambientes)
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'apartamentos.estaticos.WhiteNoiseMiddleware',
+    'apartamentos.roteamento.RoteamentoBancoMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -38,7 +40,12 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'config.urls'
+# Servido por config/asgi.py (uvicorn): as rotas de navegação e feeds usam as views assíncronas
+SERVIDOR_ASGI = os.getenv('DJANGO_SERVIDOR') == 'asgi'
+ROOT_URLCONF = 'config.urls_asgi' if SERVIDOR_ASGI else 'config.urls'
+# Threads (e, sem conexões persistentes, conexões ao banco) por processo para as consultas em paralelo
+# das views assíncronas (ver apartamentos/views_async._em_paralelo); o excedente espera na fila
+CONSULTAS_PARALELAS_ASGI = int(os.getenv('CONSULTAS_PARALELAS_ASGI', 8))
 
 TEMPLATES = [
     {
@@ -63,7 +70,38 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'OPTIONS': {
+            # Transações já começam com o bloqueio de escrita: reservas simultâneas esperam na fila
+            # (até 'timeout' segundos) em vez de falharem com "database is locked" no meio da transação.
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # Banco de testes em arquivo (e não em memória compartilhada), para que os testes com várias
+        # threads usem o mesmo bloqueio de escrita do banco real.
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    },
+    # Réplica de leitura local: por padrão o mesmo arquivo por outra conexão. Com REPLICA_SQLITE apontando
+    # para uma cópia do db.sqlite3, dá para ver o roteamento e a leitura própria com uma réplica "atrasada".
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('REPLICA_SQLITE', BASE_DIR / 'db.sqlite3'),
+        'OPTIONS': {'timeout': 20},
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+# Leituras de requisições GET vão para estes aliases (ver apartamentos/roteamento.py); vazio = só o primário
+REPLICAS_LEITURA = ['replica'] if os.environ.get('REPLICA_SQLITE') else []
+# Segundos em que quem acabou de escrever continua lendo do primário (atraso tolerado de replicação)
+JANELA_LEITURA_PROPRIA = 15
+DATABASE_ROUTERS = ['apartamentos.roteamento.RoteadorLeituraEscrita']
+
+# Cache local do processo: basta para um único servidor de desenvolvimento. As versões das buscas,
+# dos fragmentos e das permissões (apartamentos/cache.py) precisam de um cache compartilhado em produção.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
 }
 
 # ... (AUTH_PASSWORD_VALIDATORS, LANGUAGE_CODE, TIME_ZONE, etc. continuam aqui) ...
@@ -74,6 +112,44 @@ TIME_ZONE = 'America/Sao_Paulo'
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 # STATIC_ROOT será definido no production.py
+STATICFILES_FINDERS = [
+    'django.contrib.staticfiles.finders.FileSystemFinder',
+    'django.contrib.staticfiles.finders.AppDirectoriesFinder',
+    'apartamentos.estaticos.PacotesFinder',
+]
+
+# Pacotes de CSS/JS referenciados pelos templates (ver apartamentos/estaticos.py): poucos arquivos,
+# do mesmo domínio, com hash no nome depois do collectstatic. O mapa e os calendários são
+# pacotes à parte, carregados só nas páginas (ou no momento) em que são usados.
+PACOTES_ESTATICOS = {
+    'pacotes/base.css': ['vendor/bootstrap/bootstrap.min.css'],
+    'pacotes/base.js': ['vendor/bootstrap/bootstrap.bundle.min.js'],
+    'pacotes/lista.js': ['js/lista_apartamentos.js'],
+    'pacotes/mapa.css': ['vendor/leaflet/leaflet.css'],
+    'pacotes/mapa.js': ['vendor/leaflet/leaflet.js'],
+    'pacotes/calendario.js': ['vendor/fullcalendar/index.global.min.js', 'js/calendario.js'],
+    'pacotes/painel.js': ['vendor/fullcalendar/index.global.min.js', 'js/calendario.js', 'js/painel.js'],
+}
+PACOTES_ESTATICOS_DIR = BASE_DIR / 'build'
+# Bibliotecas de front-end em versões fixas, baixadas para static/ pelo manage.py baixar_estaticos_externos:
+# nome -> (URL, sha256 do arquivo publicado). Conteúdo com outro hash (ou sem hash fixado) interrompe o build;
+# o comando mostra o sha256 obtido, que é o valor a conferir e registrar aqui ao trocar de versão.
+ESTATICOS_EXTERNOS = {
+    'vendor/bootstrap/bootstrap.min.css': (
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css', ''),
+    'vendor/bootstrap/bootstrap.bundle.min.js': (
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/js/bootstrap.bundle.min.js', ''),
+    'vendor/leaflet/leaflet.css': (
+        'https://unpkg.com/leaflet@1.9.4/dist/leaflet.css',
+        'a7837102824184820dfa198d1ebcd109ff6d0ff9a2672a074b9a1b4d147d04c6'),
+    'vendor/leaflet/leaflet.js': (
+        'https://unpkg.com/leaflet@1.9.4/dist/leaflet.js',
+        'db49d009c841f5ca34a888c96511ae936fd9f5533e90d8b2c4d57596f4e5641a'),
+    **{f'vendor/leaflet/images/{imagem}': (f'https://unpkg.com/leaflet@1.9.4/dist/images/{imagem}', '')
+       for imagem in ('layers.png', 'layers-2x.png', 'marker-icon.png', 'marker-icon-2x.png', 'marker-shadow.png')},
+    'vendor/fullcalendar/index.global.min.js': (
+        'https://cdn.jsdelivr.net/npm/fullcalendar@6.1.15/index.global.min.js', ''),
+}
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'mediafiles'
@@ -11,21 +11,47 @@ ALLOWED_HOSTS = ['plataforma-aluguel-pro.onrender.com']
 # SESSION_COOKIE_SECURE = True
 # CSRF_COOKIE_SECURE = True
 
+# Conexões persistentes ficam presas à thread que as abriu; no ASGI cada requisição usa threads
+# diferentes, então lá a conexão é aberta e fechada por requisição (use um pooler, ex. PgBouncer)
+CONN_MAX_AGE = 0 if SERVIDOR_ASGI else 600
 DATABASES = {
-    'default': dj_database_url.config(conn_max_age=600, ssl_require=True)
+    'default': dj_database_url.config(conn_max_age=CONN_MAX_AGE, ssl_require=True)
 }
+# Réplicas de leitura (opcional): DATABASE_REPLICA_URLS="postgres://...,postgres://..."
+# As páginas de busca, detalhe e calendários leem delas; escritas e POSTs ficam no primário.
+REPLICAS_LEITURA = []
+for indice, url in enumerate(filter(None, os.getenv('DATABASE_REPLICA_URLS', '').split(',')), start=1):
+    DATABASES[f'replica{indice}'] = dj_database_url.parse(url.strip(), conn_max_age=CONN_MAX_AGE, ssl_require=True)
+    REPLICAS_LEITURA.append(f'replica{indice}')
+
+# Cache compartilhado entre os workers: sem ele cada processo teria suas próprias versões e
+# invalidações, e a trava de recálculo das buscas não valeria entre processos.
+# Com REDIS_URL usa o Redis; sem ele, a tabela do DatabaseCache (criada no build.sh).
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'cache_django',
+        },
+    }
 
-STATICFILES_STORAGE = 'cloudinary_storage.storage.StaticCloudinaryStorage'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
-# --- A CORREÇÃO PRINCIPAL ESTÁ AQUI ---
-# A configuração moderna STORAGES agora é a fonte única da verdade.
 STORAGES = {
-    # Define o Cloudinary como o backend para MEDIA files (uploads).
+    # Uploads (mídia) no Cloudinary
     "default": {
         "BACKEND": "cloudinary_storage.storage.MediaCloudinaryStorage",
     },
-    # Mantém o WhiteNoise para STATIC files (CSS, JS).
+    # Estáticos: um único pipeline. O collectstatic põe o hash do conteúdo no nome e grava as versões
+    # .br/.gz ao lado; o WhiteNoise entrega a pré-comprimida e, para os nomes com hash, cache de um ano
+    # com "immutable" (qualquer mudança gera outro nome)
     "staticfiles": {
         "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
     },
@@ -0,0 +1,12 @@
+"""
+URLs do modo ASGI (ver config/asgi.py): as mesmas de config/urls.py, com as
+rotas do app apartamentos apontando para as views assíncronas.
+"""
+from django.urls import include, path
+
+from .urls import urlpatterns as urlpatterns_wsgi
+
+urlpatterns = [
+    path('apartamentos/', include('apartamentos.urls_async')) if str(rota.pattern) == 'apartamentos/' else rota
+    for rota in urlpatterns_wsgi
+]
@@ -0,0 +1,23 @@
+// Calendários de ocupação (FullCalendar) dos elementos .calendario-reservas:
+// data-url (feed JSON), data-visoes (botões da direita) e, opcional, data-aba (aba que o revela).
+// Dentro de uma aba, o calendário só é criado quando ela é aberta (o FullCalendar pede apenas a janela visível).
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('.calendario-reservas').forEach(function(calendarioEl) {
+        let calendario = null;
+        function mostrar() {
+            if (calendario) { calendario.updateSize(); return; }
+            calendario = new FullCalendar.Calendar(calendarioEl, {
+                initialView: 'dayGridMonth', locale: 'pt-br',
+                buttonText: {today: 'hoje', month: 'mês', week: 'semana', day: 'dia', list: 'lista'},
+                headerToolbar: {left: 'prev,next today', center: 'title', right: calendarioEl.dataset.visoes},
+                events: calendarioEl.dataset.url
+            });
+            calendario.render();
+        }
+        if (calendarioEl.dataset.aba) {
+            document.querySelector(calendarioEl.dataset.aba).addEventListener('shown.bs.tab', mostrar);
+        } else {
+            mostrar();
+        }
+    });
+});
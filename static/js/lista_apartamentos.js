@@ -0,0 +1,98 @@
+// Lista de apartamentos: sugestões de cidade e busca pela área do mapa
+document.addEventListener('DOMContentLoaded', function() {
+    // Sugestões de cidade buscadas por prefixo conforme o usuário digita (em vez da lista completa na página)
+    const lista = document.getElementById('lista-cidades');
+    const campo = document.querySelector('input[list="lista-cidades"]');
+    let espera;
+    campo.addEventListener('input', function() {
+        clearTimeout(espera);
+        espera = setTimeout(function() {
+            if (!campo.value.trim()) { lista.innerHTML = ''; return; }
+            fetch(lista.dataset.url + '?q=' + encodeURIComponent(campo.value))
+                .then(response => response.json())
+                .then(data => {
+                    lista.innerHTML = '';
+                    data.cidades.forEach(cidade => {
+                        const opcao = document.createElement('option');
+                        opcao.value = cidade;
+                        lista.appendChild(opcao);
+                    });
+                });
+        }, 200);
+    });
+
+    // Mapa criado só quando aberto; a cada movimento pede apenas as unidades da área visível (?formato=mapa)
+    const areaMapa = document.getElementById('area-mapa');
+    const mapaEl = document.getElementById('mapa-apartamentos');
+    const aviso = document.getElementById('mapa-aviso');
+    let mapa, marcadores, pedido, leaflet;
+    // O Leaflet (pacotes/mapa.*) só é baixado quando o mapa é aberto pela primeira vez
+    function carregarLeaflet() {
+        if (!leaflet) {
+            const estilo = document.createElement('link');
+            estilo.rel = 'stylesheet';
+            estilo.href = mapaEl.dataset.leafletCss;
+            document.head.appendChild(estilo);
+            leaflet = new Promise((resolve, reject) => {
+                const script = document.createElement('script');
+                script.src = mapaEl.dataset.leafletJs;
+                script.onload = resolve;
+                script.onerror = reject;
+                document.head.appendChild(script);
+            }).then(() => {
+                // Com o hash no nome das imagens o Leaflet não deduz o caminho dos ícones pelo CSS
+                L.Icon.Default.imagePath = '';
+                L.Icon.Default.mergeOptions({
+                    iconUrl: mapaEl.dataset.icone, iconRetinaUrl: mapaEl.dataset.icone2x, shadowUrl: mapaEl.dataset.sombra
+                });
+            });
+        }
+        return leaflet;
+    }
+    function parametrosDaArea() {
+        const limites = mapa.getBounds();
+        return 'sul=' + limites.getSouth().toFixed(6) + '&oeste=' + limites.getWest().toFixed(6) +
+            '&norte=' + limites.getNorth().toFixed(6) + '&leste=' + limites.getEast().toFixed(6);
+    }
+    function carregarMarcadores() {
+        if (pedido) { pedido.abort(); }
+        pedido = new AbortController();
+        fetch(mapaEl.dataset.url + '&formato=mapa&' + parametrosDaArea(), {signal: pedido.signal})
+            .then(response => response.json())
+            .then(data => {
+                marcadores.clearLayers();
+                data.apartamentos.forEach(apartamento => {
+                    const link = document.createElement('a');
+                    link.href = apartamento.url;
+                    link.textContent = apartamento.titulo + ' — R$ ' + apartamento.preco_diaria;
+                    L.marker([apartamento.lat, apartamento.lng]).bindPopup(link).addTo(marcadores);
+                });
+                aviso.textContent = data.truncado ? 'Muitas unidades nesta área: aproxime o mapa para ver todas.' : '';
+            })
+            .catch(() => {});
+    }
+    areaMapa.addEventListener('shown.bs.collapse', function() {
+        if (mapa) { mapa.invalidateSize(); return; }
+        carregarLeaflet().then(criarMapa);
+    });
+    function criarMapa() {
+        if (mapa) { return; }
+        const params = new URLSearchParams(window.location.search);
+        mapa = L.map(mapaEl);
+        L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {
+            maxZoom: 19, attribution: '&copy; OpenStreetMap'
+        }).addTo(mapa);
+        marcadores = L.layerGroup().addTo(mapa);
+        mapa.on('moveend', carregarMarcadores);
+        if (params.has('sul')) {
+            mapa.fitBounds([[params.get('sul'), params.get('oeste')], [params.get('norte'), params.get('leste')]]);
+        } else if (params.has('lat')) {
+            mapa.setView([params.get('lat'), params.get('lng')], 13);
+        } else {
+            mapa.setView([-15.78, -47.93], 4);
+        }
+    }
+    document.getElementById('buscar-na-area').addEventListener('click', function() {
+        if (mapa) { window.location.search = mapaEl.dataset.url.slice(1) + '&' + parametrosDaArea(); }
+    });
+});
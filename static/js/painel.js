@@ -0,0 +1,49 @@
+// Painel do proprietário: aba aberta pela âncora da URL e aprovação/recusa de reservas sem recarregar
+document.addEventListener('DOMContentLoaded', function() {
+    // Ao paginar uma aba, a âncora da URL indica qual aba deve continuar aberta
+    const abaAtual = document.querySelector(`[data-bs-target="${window.location.hash}"]`);
+    if (window.location.hash && abaAtual) {
+        bootstrap.Tab.getOrCreateInstance(abaAtual).show();
+    }
+
+    const forms = document.querySelectorAll('.form-reserva-action');
+
+    forms.forEach(form => {
+        form.addEventListener('submit', function(event) {
+            event.preventDefault();
+
+            const url = form.action;
+            const csrfToken = form.querySelector('input[name=csrfmiddlewaretoken]').value;
+
+            // --- AQUI ESTÁ A CORREÇÃO ---
+            // Lemos o ID diretamente do atributo data- que adicionamos ao formulário.
+            // É mais seguro e mais claro que tentar extrair da URL.
+            const reservaId = form.dataset.reservaId;
+
+            fetch(url, {
+                method: 'POST',
+                headers: {
+                    'X-CSRFToken': csrfToken,
+                    'X-Requested-With': 'XMLHttpRequest'
+                }
+            })
+            .then(response => response.json())
+            .then(data => {
+                // Mostra a mensagem de sucesso ou erro
+                alert(data.message);
+
+                if (data.status === 'success') {
+                    // Se deu certo, encontra o div da reserva pelo seu ID único e o remove.
+                    const reservaDiv = document.getElementById(`reserva-${reservaId}`);
+                    if (reservaDiv) {
+                        // Animação suave para desaparecer
+                        reservaDiv.style.transition = 'opacity 0.5s ease';
+                        reservaDiv.style.opacity = '0';
+                        setTimeout(() => reservaDiv.remove(), 500);
+                    }
+                }
+            })
+            .catch(error => console.error('Erro no request AJAX:', error));
+        });
+    });
+});